@@ -10,5 +10,8 @@ setup(
         'numpy',
         'statistics',
         'scikit-learn'
-    ]
+    ],
+    extras_require={
+        'arrow': ['pyarrow']
+    }
 )
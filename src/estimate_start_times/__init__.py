@@ -1 +1,2 @@
-__all__ = ['estimator', 'config', 'concurrency_oracle', 'resource_availability']
+__all__ = ['estimator', 'config', 'concurrency_oracle', 'resource_availability', 'event_log_index', 'compact_event_log',
+           'duration_statistics', 'persistence', 'result_cache', 'online', 'parallel', 'partitioned']
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from estimate_start_times.config import EventLogIDs
+from estimate_start_times.utils import to_nanoseconds, from_nanoseconds
+
+
+class CompactEventLog:
+    """
+    Columnar representation of the event log used internally by the estimator. The identifiers (case, activity, and resource) are
+    stored as int32 codes (-1 for missing values) over the unique IDs in order of appearance, and the timestamps as int64 (UTC nanoseconds
+    since epoch, pd.NaT as NAT_NANOSECONDS), avoiding the object-dtype columns and the per-event Series of the DataFrame API. Any column
+    not present in the event log is set to None.
+    """
+
+    __slots__ = ('log_ids', 'index', 'cases', 'case_codes', 'activities', 'activity_codes', 'resources', 'resource_codes',
+                 'end_times', 'start_times')
+
+    def __init__(self, event_log: pd.DataFrame, log_ids: EventLogIDs):
+        # Set log IDs used to build the compact log
+        self.log_ids = log_ids
+        # Index of the event log, to build the DataFrame back with the same index
+        self.index = event_log.index
+        # Integer-code the identifiers (resources identified by their string ID)
+        (self.cases, self.case_codes) = _factorize(event_log, log_ids.case)
+        (self.activities, self.activity_codes) = _factorize(event_log, log_ids.activity)
+        (self.resources, self.resource_codes) = _factorize(event_log, log_ids.resource, as_string=True)
+        # Get the timestamps as nanoseconds (int64)
+        self.end_times = to_nanoseconds(event_log[log_ids.end_time]) if log_ids.end_time in event_log else None
+        self.start_times = to_nanoseconds(event_log[log_ids.start_time]) if log_ids.start_time in event_log else None
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def to_event_log(self) -> pd.DataFrame:
+        """
+        Build back a DataFrame with the columns of the compact event log.
+
+        :return: an event log (pd.DataFrame) with the case, activity, resource, start and end time columns present in the compact log.
+        """
+        columns = {}
+        for (column, uniques, codes) in [(self.log_ids.case, self.cases, self.case_codes),
+                                         (self.log_ids.activity, self.activities, self.activity_codes),
+                                         (self.log_ids.resource, self.resources, self.resource_codes)]:
+            if codes is not None:
+                columns[column] = pd.Categorical.from_codes(codes, uniques).astype(object)
+        if self.start_times is not None:
+            columns[self.log_ids.start_time] = from_nanoseconds(self.start_times, self.index)
+        if self.end_times is not None:
+            columns[self.log_ids.end_time] = from_nanoseconds(self.end_times, self.index)
+        return pd.DataFrame(columns, index=self.index)
+
+
+def _factorize(event_log: pd.DataFrame, column: str, as_string: bool = False) -> (pd.Index, np.ndarray):
+    # Unique values of the column (in order of appearance) and int32 code of each event, or None if the column is not in the log
+    if column not in event_log:
+        return None, None
+    values = event_log[column]
+    if as_string:
+        # Cast to string only the present values, so the missing ones (e.g. NaN) keep the code -1 instead of becoming 'nan'
+        values = values.astype(object).where(values.isna(), values.astype(str))
+    codes, uniques = pd.factorize(values)
+    return uniques, codes.astype(np.int32)
@@ -1,15 +1,37 @@
 from datetime import datetime
+from typing import Optional
 
+import numpy as np
 import pandas as pd
 
-from estimate_start_times.config import EventLogIDs, Configuration
-from estimate_start_times.utils import zip_with_next
+from estimate_start_times.config import EventLogIDs, Configuration, HeuristicsThresholds, configuration_to_dict, configuration_from_dict
+from estimate_start_times.event_log_index import EventLogIndex
+from estimate_start_times.parallel import SharedArrays, get_num_jobs, split_groups, run_in_workers
+from estimate_start_times.persistence import save_artifact, load_artifact
+from estimate_start_times.utils import to_nanoseconds, from_nanoseconds, NAT_NANOSECONDS
 
 
 class ConcurrencyOracle:
-    def __init__(self, concurrency: dict, config: Configuration):
+    def __init__(
+            self,
+            concurrency: Optional[dict],
+            config: Configuration,
+            activities: Optional[np.ndarray] = None,
+            concurrency_matrix: Optional[np.ndarray] = None
+    ):
+        if concurrency_matrix is None:
+            # Build the concurrency matrix from the dict
+            activities, concurrency_matrix = _get_concurrency_matrix(concurrency)
+        elif concurrency is None:
+            # Build the dict from the concurrency matrix
+            concurrency = _get_concurrency_dict(activities, concurrency_matrix)
         # Dict with the concurrency: self.concurrency[A] = set of activities concurrent with A
         self.concurrency = concurrency
+        # Array with the activities, where the position of each activity is its code
+        self.activities = np.asarray(activities)
+        self.activity_index = pd.Index(self.activities)
+        # Boolean matrix with the concurrency: self.concurrency_matrix[a][b] = True if activities[b] is concurrent with activities[a]
+        self.concurrency_matrix = concurrency_matrix
         # Configuration parameters
         self.config = config
         # Set log IDs to ease access within class
@@ -21,7 +43,7 @@ class ConcurrencyOracle:
             (trace[self.log_ids.end_time] < event[self.log_ids.end_time]) &  # i) previous to the current one;
             ((not self.config.consider_start_times) or  # ii) if parallel check is activated,
              (trace[self.log_ids.end_time] <= event[self.log_ids.start_time])) &  # not overlapping;
-            (~trace[self.log_ids.activity].isin(self.concurrency[event[self.log_ids.activity]]))  # iii) with no concurrency;
+            ~self._are_concurrent(event[self.log_ids.activity], trace[self.log_ids.activity])  # iii) with no concurrency;
         ).max()  # keeping only the last (highest) one
         if pd.isnull(previous_time):
             # It is the first event of the trace, or all the previous events where concurrent to it
@@ -29,7 +51,13 @@ class ConcurrencyOracle:
         # Return calculated value
         return previous_time
 
-    def add_enabled_times(self, event_log: pd.DataFrame, set_nat_to_first_event: bool = False):
+    def add_enabled_times(
+            self,
+            event_log: pd.DataFrame,
+            set_nat_to_first_event: bool = False,
+            log_index: Optional[EventLogIndex] = None,
+            n_jobs: Optional[int] = 1
+    ):
         """
         Add the enabled time of each activity instance to the received event log based on the concurrency relations established in the
         class instance (extracted from the event log passed to the instantiation). For the first event on each trace, set the start of the
@@ -38,7 +66,51 @@ class ConcurrencyOracle:
         :param event_log:               event log to add the enabled time information to.
         :param set_nat_to_first_event:  if False, use the start of the trace as enabled time for the activity instances with no previous
                                         activity enabling them, otherwise use pd.NaT.
+        :param log_index:               index of [event_log] to reuse (built from [event_log] if not given).
+        :param n_jobs:                  number of worker processes to compute the enabled times of the cases in parallel (1 to
+                                        compute them in this process, -1 to use all the CPUs).
         """
+        enabled_times = self.get_enabled_times(event_log, set_nat_to_first_event, log_index, n_jobs)
+        # Set all trace enabled times at once
+        event_log[self.log_ids.enabled_time] = from_nanoseconds(enabled_times, event_log.index)
+
+    def get_enabled_times(
+            self,
+            event_log: pd.DataFrame,
+            set_nat_to_first_event: bool = False,
+            log_index: Optional[EventLogIndex] = None,
+            n_jobs: Optional[int] = 1
+    ) -> np.ndarray:
+        """
+        Compute the enabled time of each activity instance of the received event log (without modifying it) based on the concurrency
+        relations established in the class instance.
+
+        :param event_log:               event log to compute the enabled times of.
+        :param set_nat_to_first_event:  if False, use the start of the trace as enabled time for the activity instances with no previous
+                                        activity enabling them, otherwise use pd.NaT.
+        :param log_index:               index of [event_log] to reuse (built from [event_log] if not given).
+        :param n_jobs:                  number of worker processes to compute the enabled times of the cases in parallel (1 to
+                                        compute them in this process, -1 to use all the CPUs). The cases are split in shards with a
+                                        similar number of events, and the result is the same as computing them in this process.
+
+        :return: an array with the enabled time of each event as UTC nanoseconds since epoch (int64), with NaT as NAT_NANOSECONDS.
+        """
+        if type(self).enabled_since is not ConcurrencyOracle.enabled_since:
+            # Custom enablement logic, apply it to each event
+            return self._get_enabled_times_per_event(event_log, set_nat_to_first_event)
+        # Build the index with the events grouped by case, if not given
+        if log_index is None:
+            log_index = EventLogIndex(event_log, self.log_ids)
+        # Compute the enabled times with a sweep over the events of each case sorted by end time
+        activity_codes, concurrency_matrix = self._get_activity_codes(log_index)
+        enabled_times = _compute_enabled_times(log_index, activity_codes, concurrency_matrix, self.config.consider_start_times, n_jobs)
+        if not set_nat_to_first_event:
+            # Use the trace start for activity instances with no previous activity enabling them
+            trace_start_times = _compute_trace_start_times(log_index)
+            enabled_times = np.where(enabled_times == NAT_NANOSECONDS, trace_start_times, enabled_times)
+        return enabled_times
+
+    def _get_enabled_times_per_event(self, event_log: pd.DataFrame, set_nat_to_first_event: bool) -> np.ndarray:
         # For each trace in the log, estimate the enabled time of its events
         indexes = []
         enabled_times = []
@@ -59,9 +131,242 @@ class ConcurrencyOracle:
                 else:
                     # Use the trace start for activity instances with no previous activity enabling them
                     enabled_times += [trace_start_time]
-        # Set all trace enabled times at once
-        event_log.loc[indexes, self.log_ids.enabled_time] = enabled_times
-        event_log[self.log_ids.enabled_time] = pd.to_datetime(event_log[self.log_ids.enabled_time], utc=True)
+        # Align all trace enabled times with the event log
+        return to_nanoseconds(pd.Series(enabled_times, index=indexes, dtype=object).reindex(event_log.index))
+
+    def save(self, path: str):
+        """
+        Persist the concurrency relations learned by the oracle as a directory with a JSON header (type of oracle, configuration, and
+        activity vocabulary) and the concurrency matrix as a .npy file.
+
+        :param path: path of the directory to store the oracle in.
+        """
+        save_artifact(
+            path,
+            'ConcurrencyOracle',
+            {
+                'oracle_type': type(self).__name__,
+                'config': configuration_to_dict(self.config),
+                'activities': np.asarray(self.activities).tolist()
+            },
+            {'concurrency_matrix': self.concurrency_matrix}
+        )
+
+    @staticmethod
+    def load(path: str, mmap: bool = True):
+        """
+        Load a concurrency oracle persisted with [save], without rediscovering its concurrency relations.
+
+        :param path: path of the directory the oracle is stored in.
+        :param mmap: if True, memory-map the concurrency matrix instead of reading it into memory.
+
+        :return: the concurrency oracle, instance of the same class as the persisted one.
+        """
+        header, arrays = load_artifact(path, 'ConcurrencyOracle', mmap)
+        # Instantiate the persisted type of oracle with the learned concurrency
+        oracle_type = _CONCURRENCY_ORACLE_TYPES.get(header['oracle_type'], ConcurrencyOracle)
+        concurrency_oracle = oracle_type.__new__(oracle_type)
+        activities = np.empty(len(header['activities']), dtype=object)
+        activities[:] = header['activities']
+        ConcurrencyOracle.__init__(
+            concurrency_oracle,
+            None,
+            configuration_from_dict(header['config']),
+            activities,
+            arrays['concurrency_matrix']
+        )
+        return concurrency_oracle
+
+    def _are_concurrent(self, activity, activities: pd.Series) -> np.ndarray:
+        # Boolean array with True for the activities concurrent with [activity]
+        activity_code = self.activity_index.get_indexer([activity])[0]
+        activity_codes = self.activity_index.get_indexer(activities)
+        if activity_code < 0:
+            # Activity not in the oracle, no concurrency
+            return np.zeros(len(activity_codes), dtype=bool)
+        return (activity_codes >= 0) & self.concurrency_matrix[activity_code][activity_codes]
+
+    def _get_activity_codes(self, log_index: EventLogIndex) -> (np.ndarray, np.ndarray):
+        # Code in the oracle of each activity of the log (with an extra code for the missing ones)
+        activity_codes = np.append(self.activity_index.get_indexer(log_index.activities), -1)
+        concurrency_matrix = self.concurrency_matrix
+        unknown = activity_codes < 0
+        if unknown.any():
+            # Activities not in the oracle share an extra code with no concurrency
+            activity_codes[unknown] = len(self.activities)
+            concurrency_matrix = np.zeros((len(self.activities) + 1, len(self.activities) + 1), dtype=bool)
+            concurrency_matrix[:-1, :-1] = self.concurrency_matrix
+        # Code in the oracle of the activity of each event
+        return activity_codes[log_index.activity_codes], concurrency_matrix
+
+
+# Maximum number of cells of the (events x activities) matrices processed at once when computing the enabled times
+_ENABLED_TIMES_CHUNK_SIZE = 2 ** 22
+
+
+def _compute_enabled_times(
+        log_index: EventLogIndex,
+        activity_codes: np.ndarray,
+        concurrency_matrix: np.ndarray,
+        consider_start_times: bool,
+        n_jobs: Optional[int] = 1
+) -> np.ndarray:
+    # Enabled time of each event (in nanoseconds) as the end of the latest previous event of its case not concurrent with it, computed
+    # over the events sorted by case and end time.
+    enabled_times = np.full(len(log_index), NAT_NANOSECONDS, dtype=np.int64)
+    order = log_index.case_order
+    if len(order) == 0:
+        return enabled_times
+    sorted_arrays = {
+        'cases': log_index.case_codes[order],
+        'activities': activity_codes[order],
+        'ends': log_index.end_times[order],
+        'case_bounds': log_index.case_offsets
+    }
+    if consider_start_times:
+        sorted_arrays['starts'] = log_index.start_times[order]
+    shards = split_groups(log_index.case_offsets, get_num_jobs(n_jobs))
+    if len(shards) <= 1:
+        enabled_times[order] = _compute_sorted_enabled_times(
+            sorted_arrays['cases'],
+            sorted_arrays['activities'],
+            sorted_arrays['ends'],
+            sorted_arrays.get('starts'),
+            sorted_arrays['case_bounds'],
+            concurrency_matrix
+        )
+    else:
+        # Compute the enabled times of each shard of cases in a worker process, sharing the sorted arrays through shared memory
+        sorted_arrays['enabled_times'] = np.empty(len(order), dtype=np.int64)
+        with SharedArrays.create(sorted_arrays) as shared_arrays:
+            run_in_workers(
+                _compute_shard_enabled_times,
+                [(shared_arrays.specs, start, end, concurrency_matrix) for start, end in shards],
+                len(shards)
+            )
+            enabled_times[order] = shared_arrays['enabled_times']
+    return enabled_times
+
+
+def _compute_shard_enabled_times(specs: dict, shard_start: int, shard_end: int, concurrency_matrix: np.ndarray):
+    # Compute (in a worker process) the enabled times of the events from [shard_start] to [shard_end] of the sorted log in shared memory
+    with SharedArrays.attach(specs) as shared_arrays:
+        shared_arrays['enabled_times'][shard_start:shard_end] = _compute_sorted_enabled_times(
+            shared_arrays['cases'][shard_start:shard_end],
+            shared_arrays['activities'][shard_start:shard_end],
+            shared_arrays['ends'][shard_start:shard_end],
+            shared_arrays['starts'][shard_start:shard_end] if 'starts' in shared_arrays else None,
+            _get_shard_bounds(shared_arrays['case_bounds'], shard_start, shard_end),
+            concurrency_matrix
+        )
+
+
+def _get_shard_bounds(bounds: np.ndarray, shard_start: int, shard_end: int) -> np.ndarray:
+    # Bounds of the groups within a shard, relative to its start
+    return bounds[np.searchsorted(bounds, shard_start):np.searchsorted(bounds, shard_end, side='right')] - shard_start
+
+
+def _compute_sorted_enabled_times(
+        cases: np.ndarray,
+        activities: np.ndarray,
+        ends: np.ndarray,
+        starts: Optional[np.ndarray],
+        case_bounds: np.ndarray,
+        concurrency_matrix: np.ndarray
+) -> np.ndarray:
+    # Enabled time of each event of a log sorted by case and end time (with the events of each case from case_bounds[i] to
+    # case_bounds[i + 1]), sweeping each case keeping the position of the latest event of each activity.
+    enabled_times = np.full(len(ends), NAT_NANOSECONDS, dtype=np.int64)
+    # Position where the events of the case of each event start
+    case_starts = np.repeat(case_bounds[:-1], np.diff(case_bounds))
+    # Compose (case, time) keys preserving the order, to search for the previous events within the same case
+    timestamps = ends if starts is None else np.concatenate([ends, starts])
+    timestamps = np.unique(timestamps[timestamps != NAT_NANOSECONDS])
+    keys = cases.astype(np.int64) * (len(timestamps) + 1) + np.searchsorted(timestamps, ends)
+    # Number of previous events in the sorted log ending i) before the current one, and ii) not after its start
+    num_previous = np.searchsorted(keys, keys, side='left')
+    if starts is not None:
+        start_keys = cases.astype(np.int64) * (len(timestamps) + 1) + np.searchsorted(timestamps, starts)
+        num_previous = np.minimum(num_previous, np.searchsorted(keys, start_keys, side='right'))
+        # No causal predecessor if the start time is missing
+        num_previous[starts == NAT_NANOSECONDS] = case_starts[starts == NAT_NANOSECONDS]
+    if not concurrency_matrix.any():
+        # No concurrency (e.g. directly-follows oracle): the enabler is the last previous event
+        enablers = num_previous - 1
+    else:
+        # Sweep the sorted log searching the latest previous non-concurrent event
+        enablers = _sweep_enablers(activities, num_previous, concurrency_matrix)
+    # Keep only enablers from the same case
+    enabled = enablers >= case_starts
+    enabled_times[enabled] = ends[enablers[enabled]]
+    return enabled_times
+
+
+def _sweep_enablers(
+        activities: np.ndarray,
+        num_previous: np.ndarray,
+        concurrency_matrix: np.ndarray
+) -> np.ndarray:
+    # Position of the enabler of each event in the sorted log (the latest of its first [num_previous] events not concurrent with it, or
+    # -1 if none), sweeping it in chunks of at most _ENABLED_TIMES_CHUNK_SIZE cells (events x activities) whatever the length of the
+    # cases: the memory is bounded by one (chunk_length + 1) x A int64 matrix, carrying the latest position of each activity from one
+    # chunk to the next. The events searching before their chunk (e.g. a long case with start times, or a case split between chunks) are
+    # searched, one activity at a time, in the positions of each activity (one int64 per event, built only if needed).
+    enablers = np.full(len(activities), -1, dtype=np.int64)
+    num_activities = max(concurrency_matrix.shape[0], 1)
+    chunk_length = max(_ENABLED_TIMES_CHUNK_SIZE // num_activities, 1)
+    # Latest position of each activity before the current chunk
+    carried_latest = np.full(num_activities, -1, dtype=np.int64)
+    activity_positions = None
+    for chunk_start in range(0, len(activities), chunk_length):
+        positions = np.arange(chunk_start, min(chunk_start + chunk_length, len(activities)))
+        # Matrix with the position of the latest event of each activity ended before each position of the chunk
+        latest = np.empty((len(positions) + 1, num_activities), dtype=np.int64)
+        latest[0] = carried_latest
+        latest[1:] = -1
+        latest[positions - chunk_start + 1, activities[positions]] = positions
+        np.maximum.accumulate(latest, axis=0, out=latest)
+        carried_latest = latest[-1].copy()
+        # Enabler: latest previous event from the activities not concurrent with the current one
+        in_chunk = num_previous[positions] >= chunk_start
+        candidates = latest[num_previous[positions[in_chunk]] - chunk_start]
+        candidates[concurrency_matrix[activities[positions[in_chunk]]]] = -1
+        enablers[positions[in_chunk]] = candidates.max(axis=1)
+        if not in_chunk.all():
+            # Search the events with their previous events before the chunk in the positions of each activity
+            if activity_positions is None:
+                activity_positions = np.argsort(activities, kind='stable')
+                activity_bounds = np.searchsorted(activities[activity_positions], np.arange(num_activities + 1))
+            searched = positions[~in_chunk]
+            for activity in range(num_activities):
+                same_activity = activity_positions[activity_bounds[activity]:activity_bounds[activity + 1]]
+                num_before = np.searchsorted(same_activity, num_previous[searched], side='left')
+                candidate = np.where(num_before > 0, same_activity[np.maximum(num_before - 1, 0)] if len(same_activity) > 0 else -1, -1)
+                candidate[concurrency_matrix[activities[searched], activity]] = -1
+                enablers[searched] = np.maximum(enablers[searched], candidate)
+    return enablers
+
+
+def _compute_trace_start_times(log_index: EventLogIndex) -> np.ndarray:
+    # Start of each trace as its first end time
+    trace_start_times = np.full(len(log_index.cases) + 1, NAT_NANOSECONDS, dtype=np.int64)
+    if len(log_index.case_order) > 0:
+        trace_start_times[:-1] = log_index.end_times[log_index.case_order][log_index.case_offsets[:-1]]
+        if log_index.start_times is not None:
+            # If the log has start times, take the first start/end as start of the trace (or NaT if all its start times are missing)
+            no_start_time = np.iinfo(np.int64).max
+            start_times = log_index.start_times[log_index.case_order]
+            first_start_times = np.minimum.reduceat(
+                np.where(start_times == NAT_NANOSECONDS, no_start_time, start_times),
+                log_index.case_offsets[:-1]
+            )
+            trace_start_times[:-1] = np.where(
+                first_start_times == no_start_time,
+                NAT_NANOSECONDS,
+                np.minimum(trace_start_times[:-1], first_start_times)
+            )
+    # Map the start of each trace to its events (NaT for the events with no case)
+    return trace_start_times[log_index.case_codes]
 
 
 class DeactivatedConcurrencyOracle(ConcurrencyOracle):
@@ -72,119 +377,276 @@ class DeactivatedConcurrencyOracle(ConcurrencyOracle):
     def enabled_since(self, trace, event) -> datetime:
         return pd.NaT
 
+    def get_enabled_times(
+            self,
+            event_log: pd.DataFrame,
+            set_nat_to_first_event: bool = False,
+            log_index: Optional[EventLogIndex] = None,
+            n_jobs: Optional[int] = 1
+    ) -> np.ndarray:
+        """
+        Compute the enabled time of each activity instance of the received event log. As the concurrency oracle is deactivated, no
+        activity instance has a previous activity enabling it, so its enabled time is pd.NaT or, if [set_nat_to_first_event] is False,
+        the start of its trace.
+
+        :param event_log:               event log to compute the enabled times of.
+        :param set_nat_to_first_event:  if False, use the start of the trace as enabled time for the activity instances with no previous
+                                        activity enabling them, otherwise use pd.NaT.
+        :param log_index:               index of [event_log] to reuse (built from [event_log] if not given).
+        :param n_jobs:                  unused, as there are no enabled times to compute.
+
+        :return: an array with the enabled time of each event as UTC nanoseconds since epoch (int64), with NaT as NAT_NANOSECONDS.
+        """
+        if set_nat_to_first_event:
+            return np.full(len(event_log), NAT_NANOSECONDS, dtype=np.int64)
+        else:
+            # Use the trace start for all the activity instances
+            return _compute_trace_start_times(log_index if log_index is not None else EventLogIndex(event_log, self.log_ids))
+
 
 class DirectlyFollowsConcurrencyOracle(ConcurrencyOracle):
-    def __init__(self, event_log: pd.DataFrame, config):
+    def __init__(self, event_log: pd.DataFrame, config, log_index: Optional[EventLogIndex] = None):
         # Default with no concurrency (all directly-follows relations)
-        activities = event_log[config.log_ids.activity].unique()
+        activities = log_index.activities if log_index is not None else event_log[config.log_ids.activity].unique()
         concurrency = {activity: set() for activity in activities}
         # Super
         super(DirectlyFollowsConcurrencyOracle, self).__init__(concurrency, config)
 
 
 class AlphaConcurrencyOracle(ConcurrencyOracle):
-    def __init__(self, event_log: pd.DataFrame, config: Configuration):
+    def __init__(self, event_log: pd.DataFrame, config: Configuration, log_index: Optional[EventLogIndex] = None):
         # Alpha concurrency
-        # Initialize dictionary for directly-follows relations df_relations[A][B] = number of times B following A
-        df_relations = _get_df_relations(event_log, config.log_ids)
-        # Create concurrency if there is a directly-follows relation in both directions
-        concurrency = {}
-        activities = event_log[config.log_ids.activity].unique()
-        for act_a in activities:
-            concurrency[act_a] = set()
-            for act_b in activities:
-                if act_a != act_b and act_a in df_relations.get(act_b, []) and act_b in df_relations.get(act_a, []):
-                    # Concurrency relation AB, add it to A
-                    concurrency[act_a].add(act_b)
-        # Super
-        super(AlphaConcurrencyOracle, self).__init__(concurrency, config)
+        if log_index is None:
+            log_index = EventLogIndex(event_log, config.log_ids)
+        # Get matrix for directly-follows relations: df_count[a][b] = number of times activities[b] following activities[a]
+        (activities, df_count) = _get_df_count_matrix(log_index)
+        # Super (with concurrency if there is a directly-follows relation in both directions)
+        super(AlphaConcurrencyOracle, self).__init__(None, config, activities, _get_alpha_concurrency(df_count))
+
+    @staticmethod
+    def from_counts(activities: np.ndarray, df_count: np.ndarray, config: Configuration):
+        """
+        Build the oracle from the directly-follows relations counted in an event log (e.g. added over the partitions of an event log
+        split by case), without the event log.
+
+        :param activities:  activities of the event log, where the position of each activity is its code in [df_count].
+        :param df_count:    matrix with the number of times activities[b] directly follows activities[a] in [a][b].
+        :param config:      configuration of the estimation.
+
+        :return: the AlphaConcurrencyOracle with the concurrency relations of the counts.
+        """
+        concurrency_oracle = AlphaConcurrencyOracle.__new__(AlphaConcurrencyOracle)
+        ConcurrencyOracle.__init__(concurrency_oracle, None, config, activities, _get_alpha_concurrency(df_count))
+        return concurrency_oracle
+
+
+def _get_alpha_concurrency(df_count: np.ndarray) -> np.ndarray:
+    # Create concurrency if there is a directly-follows relation in both directions
+    concurrency_matrix = (df_count > 0) & (df_count.T > 0)
+    np.fill_diagonal(concurrency_matrix, False)
+    return concurrency_matrix
+
+
+def _get_df_count_matrix(log_index: EventLogIndex) -> (np.ndarray, np.ndarray):
+    # Get the activity of each event sorted by case
+    (activities, cases, activity_codes) = _get_activity_codes_by_case(log_index)
+    # Count directly-follows relations df_count[a][b] = number of times activities[b] following activities[a]
+    df_count = _count_df_relations(cases, activity_codes, len(activities))
+    return activities, df_count
+
+
+def _get_activity_codes_by_case(log_index: EventLogIndex) -> (np.ndarray, np.ndarray, np.ndarray):
+    # Events grouped by case, keeping the order of the events within each case
+    order = log_index.get_case_order_in_log_order()
+    return np.asarray(log_index.activities), log_index.case_codes[order], log_index.activity_codes[order]
+
+
+def _count_df_relations(cases: np.ndarray, activity_codes: np.ndarray, num_activities: int) -> np.ndarray:
+    # Pair each event with the next event of its case: (e1, e2), (e2, e3), (e3, e4)...
+    same_case = cases[:-1] == cases[1:]
+    pairs = activity_codes[:-1][same_case] * num_activities + activity_codes[1:][same_case]
+    # Count them: df_count[a][b] = number of times activities[b] following activities[a]
+    return np.bincount(pairs, minlength=num_activities ** 2).reshape((num_activities, num_activities))
+
+
+def _count_l2l_relations(cases: np.ndarray, activity_codes: np.ndarray, num_activities: int) -> np.ndarray:
+    # Triples of consecutive events in the same case (e1, e2, e3) with the same activity in e1 and e3 (A-B-A)
+    loop = (cases[:-2] == cases[2:]) & (activity_codes[:-2] == activity_codes[2:])
+    pairs = activity_codes[:-2][loop] * num_activities + activity_codes[1:-1][loop]
+    # Count them: l2l_count[a][b] = number of times activities[a]-activities[b]-activities[a]
+    return np.bincount(pairs, minlength=num_activities ** 2).reshape((num_activities, num_activities))
 
 
 def _get_df_relations(event_log: pd.DataFrame, log_ids: EventLogIDs) -> dict:
-    # Initialize dictionary for directly-follows relations df_relations[A][B] = number of times B following A
-    df_relations = {activity: {} for activity in event_log[log_ids.activity].unique()}
-    # Fill dictionary with directly-follows relations
-    for (key, trace) in event_log.groupby([log_ids.case]):
-        for (i, current_event), (j, future_event) in zip_with_next(trace.iterrows()):
-            current_activity = current_event[log_ids.activity]
-            future_activity = future_event[log_ids.activity]
-            # Store df relation
-            df_relations[current_activity][future_activity] = df_relations[current_activity].get(future_activity, 0) + 1
+    # Get matrix for directly-follows relations: df_count[a][b] = number of times activities[b] following activities[a]
+    (activities, df_count) = _get_df_count_matrix(EventLogIndex(event_log, log_ids))
+    # Transform to dictionary for directly-follows relations df_relations[A][B] = number of times B following A
+    return _get_df_relations_dict(activities, df_count)
+
+
+def _get_df_relations_dict(activities: np.ndarray, df_count: np.ndarray) -> dict:
+    # Dictionary with the observed directly-follows relations df_relations[A][B] = number of times B following A
+    df_relations = {activity: {} for activity in activities}
+    for (i, j) in zip(*np.nonzero(df_count)):
+        df_relations[activities[i]][activities[j]] = int(df_count[i, j])
     return df_relations
 
 
+def _get_concurrency_matrix(concurrency: dict) -> (np.ndarray, np.ndarray):
+    # Activities in the concurrency relations (keys and values)
+    activities = pd.unique(pd.Series(
+        list(concurrency.keys()) + [act_b for concurrent in concurrency.values() for act_b in concurrent],
+        dtype=object
+    ))
+    activity_codes = {activity: code for code, activity in enumerate(activities)}
+    # Boolean matrix with the concurrency: concurrency_matrix[a][b] = True if activities[b] is concurrent with activities[a]
+    concurrency_matrix = np.zeros((len(activities), len(activities)), dtype=bool)
+    for act_a, concurrent in concurrency.items():
+        concurrency_matrix[activity_codes[act_a], [activity_codes[act_b] for act_b in concurrent]] = True
+    return activities, concurrency_matrix
+
+
+def _get_concurrency_dict(activities: np.ndarray, concurrency_matrix: np.ndarray) -> dict:
+    # Dictionary with the concurrency: concurrency[A] = set of activities concurrent with A
+    concurrency = {activity: set() for activity in activities}
+    for (i, j) in zip(*np.nonzero(concurrency_matrix)):
+        concurrency[activities[i]].add(activities[j])
+    return concurrency
+
+
 class HeuristicsConcurrencyOracle(ConcurrencyOracle):
-    def __init__(self, event_log: pd.DataFrame, config: Configuration):
+    def __init__(self, event_log: pd.DataFrame, config: Configuration, log_index: Optional[EventLogIndex] = None):
         # Heuristics concurrency
-        activities = event_log[config.log_ids.activity].unique()
-        # Get matrices for:
+        if log_index is None:
+            log_index = EventLogIndex(event_log, config.log_ids)
+        # Get the matrices for (with [i][j] referring to the relation between activities[i] and activities[j]):
         # - Directly-follows relations: df_count[A][B] = number of times B following A
-        # - Directly-follows dependency values: df_dependency[A][B] = value of certainty that there is a df-relation between A and B
-        # - Length-2 loop values: l2l_dependency[A][B] = value of certainty that there is a l2l relation between A and B (A-B-A)
-        (df_count, df_dependency, l2l_dependency) = _get_heuristics_matrices(event_log, activities, config)
-        # Create concurrency if there is a directly-follows relation in both directions
-        concurrency = {}
-        for act_a in activities:
-            concurrency[act_a] = set()
-            for act_b in activities:
-                if (act_a != act_b and  # They are not the same activity
-                        df_count[act_a].get(act_b, 0) > 0 and  # 'B' follows 'A' at least once
-                        df_count[act_b].get(act_a, 0) > 0 and  # 'A' follows 'B' at least once
-                        l2l_dependency[act_a].get(act_b, 0) < config.heuristics_thresholds.l2l and  # 'A' and 'B' are not a length 2 loop
-                        abs(df_dependency[act_a].get(act_b, 0)) < config.heuristics_thresholds.df):  # The df relations are weak
-                    # Concurrency relation AB, add it to A
-                    concurrency[act_a].add(act_b)
+        # - Length-2 loop relations: l2l_count[A][B] = number of times A-B-A
+        (activities, df_count, l2l_count) = _get_heuristics_counts(log_index)
         # Super
-        super(HeuristicsConcurrencyOracle, self).__init__(concurrency, config)
+        super(HeuristicsConcurrencyOracle, self).__init__(
+            None,
+            config,
+            activities,
+            _get_heuristics_concurrency_from_counts(df_count, l2l_count, config.heuristics_thresholds)
+        )
+
+    @staticmethod
+    def from_counts(activities: np.ndarray, df_count: np.ndarray, l2l_count: np.ndarray, config: Configuration):
+        """
+        Build the oracle from the directly-follows and length-2 loop relations counted in an event log (e.g. added over the partitions
+        of an event log split by case), without the event log.
+
+        :param activities:  activities of the event log, where the position of each activity is its code in the counts.
+        :param df_count:    matrix with the number of times activities[b] directly follows activities[a] in [a][b].
+        :param l2l_count:   matrix with the number of times activities[a]-activities[b]-activities[a] in [a][b].
+        :param config:      configuration of the estimation (with the heuristics thresholds).
+
+        :return: the HeuristicsConcurrencyOracle with the concurrency relations of the counts.
+        """
+        concurrency_oracle = HeuristicsConcurrencyOracle.__new__(HeuristicsConcurrencyOracle)
+        ConcurrencyOracle.__init__(
+            concurrency_oracle,
+            None,
+            config,
+            activities,
+            _get_heuristics_concurrency_from_counts(df_count, l2l_count, config.heuristics_thresholds)
+        )
+        return concurrency_oracle
+
+    @staticmethod
+    def concurrency_sweep(
+            event_log: pd.DataFrame,
+            log_ids: EventLogIDs,
+            thresholds: list,
+            log_index: Optional[EventLogIndex] = None
+    ) -> (np.ndarray, np.ndarray):
+        """
+        Compute the heuristics concurrency relations of an event log for a grid of thresholds, counting the directly-follows and
+        length-2 loop relations only once, and evaluating all the thresholds at once.
+
+        :param event_log:   event log to discover the concurrency relations from.
+        :param log_ids:     IDs of the columns of the event log.
+        :param thresholds:  list of HeuristicsThresholds with each point of the grid to evaluate.
+        :param log_index:   index of [event_log] to reuse (built from [event_log] if not given).
+
+        :return: a tuple with the activities of the log, and a boolean tensor where [g][i][j] is True if activities[j] is concurrent
+        with activities[i] using thresholds[g].
+        """
+        # Count the directly-follows and l2l relations once
+        if log_index is None:
+            log_index = EventLogIndex(event_log, log_ids)
+        (activities, df_count, l2l_count) = _get_heuristics_counts(log_index)
+        # Stack the thresholds to broadcast them over the matrices (one grid point per first dimension)
+        stacked_thresholds = HeuristicsThresholds(
+            df=np.array([threshold.df for threshold in thresholds]).reshape((-1, 1, 1)),
+            l2l=np.array([threshold.l2l for threshold in thresholds]).reshape((-1, 1, 1)),
+            l1l=np.array([threshold.l1l for threshold in thresholds]).reshape((-1, 1))
+        )
+        # Compute the concurrency relations of all the grid points at once
+        (df_dependency, l2l_dependency) = _get_heuristics_matrices(df_count, l2l_count, stacked_thresholds)
+        concurrency_tensor = _get_heuristics_concurrency(df_count, df_dependency, l2l_dependency, stacked_thresholds)
+        return activities, concurrency_tensor
 
 
-def _get_heuristics_matrices(event_log: pd.DataFrame, activities: list, config: Configuration) -> (dict, dict, dict):
-    # Initialize dictionary for directly-follows relations df_count[A][B] = number of times B following A
-    df_count = {activity: {} for activity in activities}
-    # Initialize dictionary for length 2 loops
-    l2l_count = {activity: {} for activity in activities}
+def _get_heuristics_concurrency_from_counts(df_count: np.ndarray, l2l_count: np.ndarray, thresholds: HeuristicsThresholds) -> np.ndarray:
+    # Get the matrices for (with [i][j] referring to the relation between activities[i] and activities[j]):
+    # - Directly-follows dependency values: df_dependency[A][B] = value of certainty that there is a df-relation between A and B
+    # - Length-2 loop values: l2l_dependency[A][B] = value of certainty that there is a l2l relation between A and B (A-B-A)
+    (df_dependency, l2l_dependency) = _get_heuristics_matrices(df_count, l2l_count, thresholds)
+    # Create concurrency if there is a directly-follows relation in both directions
+    return _get_heuristics_concurrency(df_count, df_dependency, l2l_dependency, thresholds)
+
+
+def _get_heuristics_counts(log_index: EventLogIndex) -> (np.ndarray, np.ndarray, np.ndarray):
+    # Get the activity of each event sorted by case
+    (activities, cases, activity_codes) = _get_activity_codes_by_case(log_index)
     # Count directly-follows and l2l relations
-    for (key, trace) in event_log.groupby([config.log_ids.case]):
-        previous_activity = None
-        # Iterate the events of the trace in pairs: (e1, e2), (e2, e3), (e3, e4)...
-        for (i, current_event), (j, future_event) in zip_with_next(trace.iterrows()):
-            current_activity = current_event[config.log_ids.activity]
-            future_activity = future_event[config.log_ids.activity]
-            # Store df relation
-            df_count[current_activity][future_activity] = df_count[current_activity].get(future_activity, 0) + 1
-            # Process l2l
-            if previous_activity:
-                # Increase value if there is a length 2 loop (A-B-A)
-                if previous_activity == future_activity:
-                    l2l_count[previous_activity][current_activity] = l2l_count[previous_activity].get(current_activity, 0) + 1
-            # Save previous activity
-            previous_activity = current_activity
-    # Fill df and l1l dependency matrices
-    df_dependency = {activity: {} for activity in activities}
-    l1l_dependency = {activity: 0 for activity in activities}
-    for act_a in activities:
-        for act_b in activities:
-            if act_a != act_b:
-                # Process directly follows dependency value A -> B
-                ab = df_count[act_a].get(act_b, 0)
-                ba = df_count[act_b].get(act_a, 0)
-                df_dependency[act_a][act_b] = (ab - ba) / (ab + ba + 1)
-            else:
-                # Process length 1 loop value
-                aa = df_count[act_a].get(act_a, 0)
-                l1l_dependency[act_a] = aa / (aa + 1)
-    # Fill l2l dependency matrix
-    l2l_dependency = {activity: {} for activity in activities}
-    for act_a in activities:
-        for act_b in activities:
-            if act_a != act_b and \
-                    l1l_dependency[act_a] < config.heuristics_thresholds.l1l and \
-                    l1l_dependency[act_b] < config.heuristics_thresholds.l1l:
-                # Process directly follows dependency value A -> B
-                aba = l2l_count[act_a].get(act_b, 0)
-                bab = l2l_count[act_b].get(act_a, 0)
-                l2l_dependency[act_a][act_b] = (aba + bab) / (aba + bab + 1)
-            else:
-                l2l_dependency[act_a][act_b] = 0
+    df_count = _count_df_relations(cases, activity_codes, len(activities))
+    l2l_count = _count_l2l_relations(cases, activity_codes, len(activities))
+    return activities, df_count, l2l_count
+
+
+def _get_heuristics_matrices(
+        df_count: np.ndarray,
+        l2l_count: np.ndarray,
+        thresholds: HeuristicsThresholds
+) -> (np.ndarray, np.ndarray):
+    # Directly follows dependency value A -> B
+    df_dependency = (df_count - df_count.T) / (df_count + df_count.T + 1)
+    # Length 1 loop value of each activity
+    l1l_dependency = np.diagonal(df_count) / (np.diagonal(df_count) + 1)
+    # Length 2 loop value A -> B, only for different activities with no length 1 loop (broadcasting over stacked thresholds)
+    no_l1l = l1l_dependency < thresholds.l1l
+    l2l_dependency = np.where(
+        no_l1l[..., :, np.newaxis] & no_l1l[..., np.newaxis, :] & ~np.eye(len(df_count), dtype=bool),
+        (l2l_count + l2l_count.T) / (l2l_count + l2l_count.T + 1),
+        0.0
+    )
     # Return matrices with dependency values
-    return df_count, df_dependency, l2l_dependency
+    return df_dependency, l2l_dependency
+
+
+def _get_heuristics_concurrency(
+        df_count: np.ndarray,
+        df_dependency: np.ndarray,
+        l2l_dependency: np.ndarray,
+        thresholds: HeuristicsThresholds
+) -> np.ndarray:
+    # Concurrency between A and B if:
+    concurrency_matrix = (
+            ~np.eye(len(df_count), dtype=bool) &  # They are not the same activity
+            (df_count > 0) &  # 'B' follows 'A' at least once
+            (df_count.T > 0) &  # 'A' follows 'B' at least once
+            (l2l_dependency < thresholds.l2l) &  # 'A' and 'B' are not a length 2 loop
+            (np.abs(df_dependency) < thresholds.df)  # The df relations are weak
+    )
+    return concurrency_matrix
+
+
+# Types of concurrency oracle by name, to instantiate the persisted ones
+_CONCURRENCY_ORACLE_TYPES = {
+    oracle_type.__name__: oracle_type
+    for oracle_type in [ConcurrencyOracle, DeactivatedConcurrencyOracle, DirectlyFollowsConcurrencyOracle, AlphaConcurrencyOracle,
+                        HeuristicsConcurrencyOracle]
+}
@@ -1,4 +1,5 @@
 import enum
+import math
 from dataclasses import dataclass, field
 
 
@@ -27,6 +28,13 @@ class ResourceAvailabilityType(enum.Enum):
     WITH_CALENDAR = 2  # Future possibility considering also the resource calendars and non-working days
 
 
+class EstimationOutput(enum.Enum):
+    COPY = 1  # Copy of the event log with the new columns
+    IN_PLACE = 2  # Event log of the estimator with the new columns written in place
+    NEW_COLUMNS = 3  # DataFrame with only the new columns, aligned with the event log
+    ARRAYS = 4  # Dictionary with the values (np.ndarray) of each new column
+
+
 @dataclass
 class EventLogIDs:
     case: str = 'case'
@@ -107,3 +115,52 @@ class Configuration:
     consider_start_times: bool = False
     outlier_statistic: OutlierStatistic = OutlierStatistic.MEDIAN
     outlier_threshold: float = float('nan')
+
+
+def configuration_to_dict(config: Configuration) -> dict:
+    """
+    Transform a configuration into a dictionary with JSON-serializable values (enums by name, sets as sorted lists, and NaN as None),
+    in a canonical form: equal configurations produce equal dictionaries.
+
+    :param config: configuration to transform.
+
+    :return: a dictionary with the value of each configuration parameter.
+    """
+    return {
+        'log_ids': dict(vars(config.log_ids)),
+        'concurrency_oracle_type': config.concurrency_oracle_type.name,
+        'resource_availability_type': config.resource_availability_type.name,
+        'missing_resource': config.missing_resource,
+        're_estimation_method': config.re_estimation_method.name,
+        'bot_resources': sorted(config.bot_resources, key=str),
+        'instant_activities': sorted(config.instant_activities, key=str),
+        'heuristics_thresholds': dict(vars(config.heuristics_thresholds)),
+        'reuse_current_start_times': config.reuse_current_start_times,
+        'consider_start_times': config.consider_start_times,
+        'outlier_statistic': config.outlier_statistic.name,
+        'outlier_threshold': None if math.isnan(config.outlier_threshold) else config.outlier_threshold
+    }
+
+
+def configuration_from_dict(values: dict) -> Configuration:
+    """
+    Build a configuration from a dictionary generated with [configuration_to_dict].
+
+    :param values: dictionary with the value of each configuration parameter.
+
+    :return: the configuration with the values of the dictionary.
+    """
+    return Configuration(
+        log_ids=EventLogIDs(**values['log_ids']),
+        concurrency_oracle_type=ConcurrencyOracleType[values['concurrency_oracle_type']],
+        resource_availability_type=ResourceAvailabilityType[values['resource_availability_type']],
+        missing_resource=values['missing_resource'],
+        re_estimation_method=ReEstimationMethod[values['re_estimation_method']],
+        bot_resources=set(values['bot_resources']),
+        instant_activities=set(values['instant_activities']),
+        heuristics_thresholds=HeuristicsThresholds(**values['heuristics_thresholds']),
+        reuse_current_start_times=values['reuse_current_start_times'],
+        consider_start_times=values['consider_start_times'],
+        outlier_statistic=OutlierStatistic[values['outlier_statistic']],
+        outlier_threshold=float('nan') if values['outlier_threshold'] is None else values['outlier_threshold']
+    )
@@ -0,0 +1,325 @@
+import heapq
+from bisect import bisect_left, insort
+from collections import deque
+
+import numpy as np
+
+from estimate_start_times.utils import NAT_NANOSECONDS
+
+
+class ActivityDurationStatistics:
+    """
+    Cache of the statistics (mode, median, and mean) of the estimated durations of each activity, computed with vectorized operations
+    over int64 nanoseconds. Each statistic is computed once for all the activities the first time it is requested and, when the
+    durations of some events are updated, recomputed only for the activities of those events.
+
+    The mode breaks ties with the first occurrence (in log order) of the tied durations, as statistics.mode, and the median and mean
+    are truncated to the nanosecond, as the numpy/pandas statistics over timedelta values.
+    """
+
+    def __init__(self, activity_codes: np.ndarray, durations: np.ndarray, num_activities: int = None):
+        """
+        :param activity_codes:  code of the activity of each event (-1 for missing activities).
+        :param durations:       estimated duration of each event in nanoseconds (int64), NAT_NANOSECONDS if not estimated.
+        :param num_activities:  number of activities (the maximum activity code plus one if not given).
+        """
+        self.activity_codes = activity_codes
+        self.durations = durations.astype(np.int64, copy=True)
+        self.num_activities = num_activities if num_activities is not None else int(np.max(activity_codes, initial=-1)) + 1
+        # Statistics already computed, with the name of the statistic as key and its value for each activity as value
+        self._statistics = {}
+
+    def get_statistic(self, statistic: str) -> np.ndarray:
+        """
+        Get the value of a statistic for the durations of each activity.
+
+        :param statistic: name of the statistic to compute ('MODE', 'MEDIAN', or 'MEAN').
+
+        :return: an array with the statistic (in nanoseconds) of the durations of each activity, or NAT_NANOSECONDS for the activities
+        with no estimated durations.
+        """
+        if statistic not in self._statistics:
+            valid = (self.durations != NAT_NANOSECONDS) & (self.activity_codes >= 0)
+            self._statistics[statistic] = compute_grouped_statistic(
+                statistic,
+                self.activity_codes[valid],
+                self.durations[valid],
+                self.num_activities
+            )
+        return self._statistics[statistic]
+
+    def get_event_statistic(self, statistic: str) -> np.ndarray:
+        """
+        Get the value of a statistic for the durations of the activity of each event.
+
+        :param statistic: name of the statistic to compute ('MODE', 'MEDIAN', or 'MEAN').
+
+        :return: an array with the statistic (in nanoseconds) of the durations of the activity of each event, or NAT_NANOSECONDS for
+        the events of activities with no estimated durations (or with missing activity).
+        """
+        return np.append(self.get_statistic(statistic), NAT_NANOSECONDS)[self.activity_codes]
+
+    def update_durations(self, positions: np.ndarray, durations: np.ndarray):
+        """
+        Update the estimated duration of some events, recomputing the statistics already computed only for their activities.
+
+        :param positions: positions of the events to update.
+        :param durations: new estimated duration of each of the events in nanoseconds (int64), NAT_NANOSECONDS if not estimated.
+        """
+        self.durations[positions] = durations
+        # Get the activities with updated durations
+        updated_activities = np.unique(self.activity_codes[positions])
+        updated_activities = updated_activities[updated_activities >= 0]
+        if len(updated_activities) > 0 and len(self._statistics) > 0:
+            # Recompute the statistics over the durations of these activities
+            updated = np.zeros(self.num_activities + 1, dtype=bool)
+            updated[updated_activities] = True
+            valid = updated[self.activity_codes] & (self.durations != NAT_NANOSECONDS)
+            for statistic, values in self._statistics.items():
+                recomputed = compute_grouped_statistic(statistic, self.activity_codes[valid], self.durations[valid], self.num_activities)
+                values[updated_activities] = recomputed[updated_activities]
+
+
+def compute_grouped_statistic(statistic: str, group_codes: np.ndarray, values: np.ndarray, num_groups: int) -> np.ndarray:
+    """
+    Compute a statistic of the values of each group.
+
+    :param statistic:   name of the statistic to compute ('MODE', 'MEDIAN', or 'MEAN').
+    :param group_codes: code (from 0 to [num_groups] - 1) of the group of each value.
+    :param values:      int64 values (in their original order, to break the ties of the mode).
+    :param num_groups:  number of groups.
+
+    :return: an array with the statistic of the values of each group, NAT_NANOSECONDS for the groups with no values.
+    """
+    if statistic == 'MODE':
+        return _grouped_mode(group_codes, values, num_groups)
+    elif statistic == 'MEDIAN':
+        return _grouped_median(group_codes, values, num_groups)
+    elif statistic == 'MEAN':
+        return _grouped_mean(group_codes, values, num_groups)
+    else:
+        raise ValueError("Unknown statistic '{}'!".format(statistic))
+
+
+def _grouped_mode(group_codes: np.ndarray, values: np.ndarray, num_groups: int) -> np.ndarray:
+    # Sort by group and value (stable, so the first event of each run of equal values is its first occurrence)
+    result = np.full(num_groups, NAT_NANOSECONDS, dtype=np.int64)
+    if len(values) == 0:
+        return result
+    order = np.lexsort((values, group_codes))
+    sorted_codes, sorted_values = group_codes[order], values[order]
+    # Runs of equal (group, value) pairs, with their length and first occurrence
+    run_starts = np.flatnonzero(np.concatenate([
+        [True],
+        (sorted_codes[1:] != sorted_codes[:-1]) | (sorted_values[1:] != sorted_values[:-1])
+    ]))
+    run_lengths = np.diff(np.append(run_starts, len(values)))
+    run_first_occurrences = order[run_starts]
+    run_codes = sorted_codes[run_starts]
+    # Longest run of each group, breaking ties with the first occurrence
+    best_runs = np.lexsort((run_first_occurrences, -run_lengths, run_codes))
+    best_codes = run_codes[best_runs]
+    first_of_group = np.concatenate([[True], best_codes[1:] != best_codes[:-1]])
+    result[best_codes[first_of_group]] = sorted_values[run_starts[best_runs[first_of_group]]]
+    return result
+
+
+def _grouped_median(group_codes: np.ndarray, values: np.ndarray, num_groups: int) -> np.ndarray:
+    # Sort by group and value, and get the middle values of each non-empty group
+    result = np.full(num_groups, NAT_NANOSECONDS, dtype=np.int64)
+    order = np.lexsort((values, group_codes))
+    sorted_values = values[order]
+    offsets = np.searchsorted(group_codes[order], np.arange(num_groups + 1))
+    counts = np.diff(offsets)
+    groups = np.flatnonzero(counts > 0)
+    low = sorted_values[offsets[groups] + (counts[groups] - 1) // 2]
+    high = sorted_values[offsets[groups] + counts[groups] // 2]
+    # Average of the middle values, truncated towards zero without overflowing
+    remainders = low % 2 + high % 2
+    result[groups] = _truncate_towards_zero(low // 2 + high // 2 + remainders // 2, remainders % 2 > 0)
+    return result
+
+
+def _grouped_mean(group_codes: np.ndarray, values: np.ndarray, num_groups: int) -> np.ndarray:
+    # Sort by group and get the sum of each non-empty group
+    result = np.full(num_groups, NAT_NANOSECONDS, dtype=np.int64)
+    order = np.argsort(group_codes, kind='stable')
+    sorted_codes, sorted_values = group_codes[order], values[order]
+    offsets = np.searchsorted(sorted_codes, np.arange(num_groups + 1))
+    counts = np.diff(offsets)
+    groups = np.flatnonzero(counts > 0)
+    if len(groups) == 0:
+        return result
+    # Split each value by the size of its group (value = quotient * count + remainder) to sum them without overflowing
+    event_counts = counts[sorted_codes]
+    quotients = np.add.reduceat(sorted_values // event_counts, offsets[groups])
+    remainders = np.add.reduceat(sorted_values % event_counts, offsets[groups])
+    # Mean truncated towards zero
+    result[groups] = _truncate_towards_zero(quotients + remainders // counts[groups], remainders % counts[groups] > 0)
+    return result
+
+
+def _truncate_towards_zero(floor: np.ndarray, inexact: np.ndarray) -> np.ndarray:
+    # Transform the floor of a division to its truncation towards zero (different for the negative inexact ones)
+    return np.where((floor < 0) & inexact, floor + 1, floor)
+
+
+class RunningDurationStatistics:
+    """
+    Statistics (mode, median, and mean) of a stream of durations, updated with each new duration in O(1) (mode and mean) and O(log n)
+    (median), and equal to the ones computed with [compute_grouped_statistic] over all the durations added so far.
+    """
+
+    def __init__(self):
+        # Number of durations added
+        self.count = 0
+        # Exact (Python int) sum of the durations, for the mean
+        self._total = 0
+        # Number of occurrences and position of the first occurrence of each duration, and current mode
+        self._occurrences = {}
+        self._first_positions = {}
+        self._mode = NAT_NANOSECONDS
+        # Lower half of the durations (max-heap with negated values) and upper half (min-heap), for the median
+        self._lower_half = []
+        self._upper_half = []
+
+    def add(self, duration: int):
+        """
+        Add a new duration to the statistics.
+
+        :param duration: duration in nanoseconds (int).
+        """
+        duration = int(duration)
+        # Update the sum and the occurrences
+        self._total += duration
+        self._occurrences[duration] = self._occurrences.get(duration, 0) + 1
+        self._first_positions.setdefault(duration, self.count)
+        self.count += 1
+        # Update the mode, breaking the ties with the first occurrence
+        if self._mode == NAT_NANOSECONDS or (
+                (self._occurrences[duration], -self._first_positions[duration]) >
+                (self._occurrences[self._mode], -self._first_positions[self._mode])
+        ):
+            self._mode = duration
+        # Insert in the halves, keeping the lower one with the same size or one more element than the upper one
+        if len(self._lower_half) == 0 or duration <= -self._lower_half[0]:
+            heapq.heappush(self._lower_half, -duration)
+        else:
+            heapq.heappush(self._upper_half, duration)
+        if len(self._lower_half) > len(self._upper_half) + 1:
+            heapq.heappush(self._upper_half, -heapq.heappop(self._lower_half))
+        elif len(self._upper_half) > len(self._lower_half):
+            heapq.heappush(self._lower_half, -heapq.heappop(self._upper_half))
+
+    def get_statistic(self, statistic: str) -> int:
+        """
+        Get the value of a statistic of the durations added so far.
+
+        :param statistic: name of the statistic to compute ('MODE', 'MEDIAN', or 'MEAN').
+
+        :return: the statistic in nanoseconds, or NAT_NANOSECONDS if no duration has been added.
+        """
+        if self.count == 0:
+            return NAT_NANOSECONDS
+        if statistic == 'MODE':
+            return self._mode
+        elif statistic == 'MEDIAN':
+            if len(self._lower_half) > len(self._upper_half):
+                return -self._lower_half[0]
+            return _divide_towards_zero(-self._lower_half[0] + self._upper_half[0], 2)
+        elif statistic == 'MEAN':
+            return _divide_towards_zero(self._total, self.count)
+        else:
+            raise ValueError("Unknown statistic '{}'!".format(statistic))
+
+
+class WindowedDurationStatistics:
+    """
+    Statistics of a stream of durations with bounded memory: the mean of all the durations added so far (exact), and the mode and
+    median of the last [window] durations. Updated with each new duration in O(1) (mean and mode) and O(log window) (median, plus the
+    shift of a sorted list with at most [window] durations). The ties of the mode are broken with the duration reaching its number of
+    occurrences (within the window) first.
+    """
+
+    def __init__(self, window: int):
+        """
+        :param window: number of (last) durations to compute the mode and the median from.
+        """
+        if window < 1:
+            raise ValueError("The window must contain at least one duration!")
+        self.window = window
+        # Number of durations added
+        self.count = 0
+        # Exact (Python int) sum of all the durations, for the mean
+        self._total = 0
+        # Durations in the window, in order of arrival and sorted (for the median)
+        self._durations = deque()
+        self._sorted_durations = []
+        # Number of occurrences of each duration in the window, and durations with each number of occurrences (in the order they
+        # reached it) for the mode
+        self._occurrences = {}
+        self._durations_by_occurrences = {}
+        self._max_occurrences = 0
+
+    def add(self, duration: int):
+        """
+        Add a new duration to the statistics, discarding the oldest one of the window if it is full.
+
+        :param duration: duration in nanoseconds (int).
+        """
+        duration = int(duration)
+        self.count += 1
+        self._total += duration
+        # Add it to the window
+        self._durations.append(duration)
+        insort(self._sorted_durations, duration)
+        self._set_occurrences(duration, self._occurrences.get(duration, 0) + 1)
+        # Discard the oldest duration if the window is full
+        if len(self._durations) > self.window:
+            oldest_duration = self._durations.popleft()
+            del self._sorted_durations[bisect_left(self._sorted_durations, oldest_duration)]
+            self._set_occurrences(oldest_duration, self._occurrences[oldest_duration] - 1)
+
+    def get_statistic(self, statistic: str) -> int:
+        """
+        Get the value of a statistic of the durations added so far (mean) or of the ones in the window (mode and median).
+
+        :param statistic: name of the statistic to compute ('MODE', 'MEDIAN', or 'MEAN').
+
+        :return: the statistic in nanoseconds, or NAT_NANOSECONDS if no duration has been added.
+        """
+        if self.count == 0:
+            return NAT_NANOSECONDS
+        if statistic == 'MODE':
+            return next(iter(self._durations_by_occurrences[self._max_occurrences]))
+        elif statistic == 'MEDIAN':
+            middle = len(self._sorted_durations) // 2
+            if len(self._sorted_durations) % 2 == 1:
+                return self._sorted_durations[middle]
+            return _divide_towards_zero(self._sorted_durations[middle - 1] + self._sorted_durations[middle], 2)
+        elif statistic == 'MEAN':
+            return _divide_towards_zero(self._total, self.count)
+        else:
+            raise ValueError("Unknown statistic '{}'!".format(statistic))
+
+    def _set_occurrences(self, duration: int, occurrences: int):
+        # Move the duration to the group of its new number of occurrences, updating the maximum one
+        previous_occurrences = self._occurrences.get(duration, 0)
+        if previous_occurrences > 0:
+            del self._durations_by_occurrences[previous_occurrences][duration]
+            if len(self._durations_by_occurrences[previous_occurrences]) == 0:
+                del self._durations_by_occurrences[previous_occurrences]
+                if previous_occurrences == self._max_occurrences:
+                    self._max_occurrences = occurrences
+        if occurrences > 0:
+            self._occurrences[duration] = occurrences
+            self._durations_by_occurrences.setdefault(occurrences, {})[duration] = None
+            self._max_occurrences = max(self._max_occurrences, occurrences)
+        else:
+            del self._occurrences[duration]
+
+
+def _divide_towards_zero(dividend: int, divisor: int) -> int:
+    # Integer division (of Python ints, with no overflow) truncated towards zero
+    quotient = abs(dividend) // divisor
+    return -quotient if dividend < 0 else quotient
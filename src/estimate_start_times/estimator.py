@@ -1,102 +1,474 @@
+import json
 import math
-from statistics import mode
+import os
 
 import numpy as np
 import pandas as pd
 
 from estimate_start_times.concurrency_oracle import DirectlyFollowsConcurrencyOracle, AlphaConcurrencyOracle, \
-    HeuristicsConcurrencyOracle, DeactivatedConcurrencyOracle
-from estimate_start_times.config import ConcurrencyOracleType, ReEstimationMethod, ResourceAvailabilityType, OutlierStatistic, Configuration
-from estimate_start_times.resource_availability import SimpleResourceAvailability
+    HeuristicsConcurrencyOracle, DeactivatedConcurrencyOracle, ConcurrencyOracle
+from estimate_start_times.config import ConcurrencyOracleType, ReEstimationMethod, ResourceAvailabilityType, OutlierStatistic, \
+    Configuration, EstimationOutput, EventLogIDs, configuration_to_dict, configuration_from_dict
+from estimate_start_times.duration_statistics import ActivityDurationStatistics, compute_grouped_statistic
+from estimate_start_times.compact_event_log import CompactEventLog
+from estimate_start_times.event_log_index import EventLogIndex
+from estimate_start_times.persistence import save_artifact, load_artifact
+from estimate_start_times.resource_availability import SimpleResourceAvailability, ResourceAvailability
+from estimate_start_times.utils import to_nanoseconds, from_nanoseconds, NAT_NANOSECONDS
 
 
 class StartTimeEstimator:
-    def __init__(self, event_log: pd.DataFrame, config: Configuration):
-        # Set event log
-        self.event_log = event_log
+    def __init__(
+            self,
+            event_log: pd.DataFrame = None,
+            config: Configuration = None,
+            log_index: EventLogIndex = None,
+            n_jobs: int = 1
+    ):
         # Set configuration
-        self.config = config
+        self.config = config if config is not None else Configuration()
+        # Number of worker processes to compute the enabled and availability times in parallel (1 to compute them in this process, -1 to
+        # use all the CPUs)
+        self.n_jobs = n_jobs
         # Set log IDs to ease access within class
-        self.log_ids = config.log_ids
+        self.log_ids = self.config.log_ids
+        # Learn the concurrency oracle and the resource availability from the event log, if given
+        self.event_log, self.log_index, self.concurrency_oracle, self.resource_availability = None, None, None, None
+        # Resource availability and enablement times of the event log, kept to [update] its estimation incrementally
+        self._estimation_times = None
+        if event_log is not None:
+            self.fit(event_log, log_index)
+
+    def fit(self, event_log: pd.DataFrame, log_index: EventLogIndex = None):
+        """
+        Discover the concurrency oracle and the resource calendars from an event log (e.g. the history of the process), to estimate its
+        start times with [estimate], or the start times of new event logs with [transform].
+
+        :param event_log:   event log to learn the concurrency relations and the resource calendars from.
+        :param log_index:   index of [event_log] to reuse (built from [event_log] if not given).
+
+        :return: the estimator itself.
+        """
+        # Set event log
+        self.event_log = event_log
+        # Set the index of the event log (grouped by case and resource once) shared by all the components
+        if log_index is None:
+            log_index = EventLogIndex(self.event_log, self.log_ids)
+        elif not log_index.matches(self.event_log, self.log_ids):
+            raise ValueError("The event log index does not correspond to the event log!")
+        self.log_index = log_index
+        self._estimation_times = None
+        # Set concurrency oracle and resource availability
+        self._fit_concurrency_oracle()
+        self._fit_resource_availability()
+        return self
+
+    def _fit_concurrency_oracle(self):
         # Set concurrency oracle
         if self.config.concurrency_oracle_type == ConcurrencyOracleType.DEACTIVATED:
             self.concurrency_oracle = DeactivatedConcurrencyOracle(self.config)
         elif self.config.concurrency_oracle_type == ConcurrencyOracleType.DF:
-            self.concurrency_oracle = DirectlyFollowsConcurrencyOracle(self.event_log, self.config)
+            self.concurrency_oracle = DirectlyFollowsConcurrencyOracle(self.event_log, self.config, self.log_index)
         elif self.config.concurrency_oracle_type == ConcurrencyOracleType.ALPHA:
-            self.concurrency_oracle = AlphaConcurrencyOracle(self.event_log, self.config)
+            self.concurrency_oracle = AlphaConcurrencyOracle(self.event_log, self.config, self.log_index)
         elif self.config.concurrency_oracle_type == ConcurrencyOracleType.HEURISTICS:
-            self.concurrency_oracle = HeuristicsConcurrencyOracle(self.event_log, self.config)
+            self.concurrency_oracle = HeuristicsConcurrencyOracle(self.event_log, self.config, self.log_index)
         else:
             raise ValueError("No concurrency oracle defined!")
+
+    def _fit_resource_availability(self):
         # Set resource availability
         if self.config.resource_availability_type == ResourceAvailabilityType.SIMPLE:
-            self.resource_availability = SimpleResourceAvailability(self.event_log, self.config)
+            self.resource_availability = SimpleResourceAvailability(self.event_log, self.config, self.log_index)
         else:
             raise ValueError("No resource availability defined!")
 
-    def estimate(self, replace_recorded_start_times: bool = False) -> pd.DataFrame:
+    def save(self, path: str):
+        """
+        Persist the concurrency oracle and resource calendars learned with [fit] (see ConcurrencyOracle.save and
+        ResourceAvailability.save) in a directory, to load them with [load] and [transform] new event logs without fitting again.
+
+        :param path: path of the directory to store the estimator in.
+        """
+        if self.concurrency_oracle is None:
+            raise ValueError("The estimator has not been fitted to an event log!")
+        self.concurrency_oracle.save(os.path.join(path, 'concurrency_oracle'))
+        self.resource_availability.save(os.path.join(path, 'resource_availability'))
+        save_artifact(path, 'StartTimeEstimator', {'config': configuration_to_dict(self.config)}, {})
+
+    @staticmethod
+    def load(path: str, mmap: bool = True):
+        """
+        Load an estimator persisted with [save], ready to [transform] new event logs.
+
+        :param path: path of the directory the estimator is stored in.
+        :param mmap: if True, memory-map the persisted arrays instead of reading them into memory.
+
+        :return: the StartTimeEstimator with the persisted concurrency oracle and resource calendars.
+        """
+        header, _ = load_artifact(path, 'StartTimeEstimator', mmap)
+        start_time_estimator = StartTimeEstimator(config=configuration_from_dict(header['config']))
+        start_time_estimator.concurrency_oracle = ConcurrencyOracle.load(os.path.join(path, 'concurrency_oracle'), mmap)
+        start_time_estimator.resource_availability = ResourceAvailability.load(os.path.join(path, 'resource_availability'), mmap)
+        return start_time_estimator
+
+    def estimate(
+            self,
+            replace_recorded_start_times: bool = False,
+            output: EstimationOutput = EstimationOutput.COPY
+    ):
         """
         Estimate the start times of each activity instance in the event log based on the resource availability and enablement times with
         the configuration defined in the parameters.
 
         :param replace_recorded_start_times:    If 'true', replace the start time column with the estimated start
                                                 times, if 'false', the estimation is placed in its own column.
+        :param output:                          Form of the result: a copy of the event log with the new columns (COPY), the event
+                                                log of the estimator with the new columns written in place (IN_PLACE), a DataFrame
+                                                with only the new columns (NEW_COLUMNS), or a dictionary with the name of each new
+                                                column as key and its values (np.ndarray of UTC datetime64[ns]) as value (ARRAYS).
+
+        :return: The event log (or only the new columns of it, depending on [output]) with the estimated start time, the resource
+        availability time, and the enablement time for each activity instance.
+        """
+        if self.event_log is None:
+            raise ValueError("The estimator has not been fitted to an event log!")
+        if self.log_index is None:
+            # Index the event log (e.g. extended with [update])
+            self.log_index = EventLogIndex(self.event_log, self.log_ids)
+        (available_times, enabled_times, estimated_start_times) = self._estimate_nanoseconds(self.event_log, self.log_index)
+        self._estimation_times = (available_times, enabled_times)
+        # Build the output with the new columns
+        new_columns = self._get_new_columns(
+            self.event_log,
+            available_times,
+            enabled_times,
+            estimated_start_times,
+            replace_recorded_start_times
+        )
+        if output == EstimationOutput.IN_PLACE:
+            # The columns of the event log are modified, so index it again (and get its times from it) in the next estimation or update
+            self.log_index, self._estimation_times = None, None
+        return build_estimation_output(self.event_log, self.log_ids, new_columns, replace_recorded_start_times, output)
+
+    def update(
+            self,
+            new_events: pd.DataFrame,
+            replace_recorded_start_times: bool = False,
+            output: EstimationOutput = EstimationOutput.COPY
+    ):
+        """
+        Add late events (e.g. the events recorded since the last estimation, of new or already estimated cases) to the event log of the
+        estimator, and update its estimation recomputing only what they can change: the enablement times of the events of their cases
+        (dirty cases), and the resource availability times of the events of their resources (dirty resources), after adding them to the
+        resource calendars. The concurrency relations learned with [fit] are reused, and the final stages (reuse of start times,
+        instant activities, outliers, and re-estimation) run over the whole updated event log, as the per-activity statistics depend on
+        all of its events.
+
+        :param new_events:                      events to add to the event log (with an index not overlapping its index).
+        :param replace_recorded_start_times:    If 'true', replace the start time column with the estimated start
+                                                times, if 'false', the estimation is placed in its own column.
+        :param output:                          Form of the result (see [estimate]), with IN_PLACE writing the new columns in the
+                                                updated event log.
+
+        :return: The updated event log (or only the new columns of it, depending on [output]) with the estimated start time, the
+        resource availability time, and the enablement time for each activity instance.
+        """
+        if self.event_log is None:
+            raise ValueError("The estimator has not been fitted to an event log!")
+        if new_events.index.isin(self.event_log.index).any():
+            raise ValueError("The index of the new events overlaps the index of the event log!")
+        # Get the resource availability and enablement times of the current event log, if not kept from a previous estimation
+        if self._estimation_times is None:
+            if self.log_index is None:
+                self.log_index = EventLogIndex(self.event_log, self.log_ids)
+            self._estimation_times = (
+                self._get_available_times(self.event_log, self.log_index),
+                self._get_enabled_times(self.event_log, self.log_index)
+            )
+        (available_times, enabled_times) = self._estimation_times
+        # Add the new events to the event log and the resource calendars
+        event_log = pd.concat([self.event_log, new_events])
+        self.resource_availability.add_events(new_events)
+        # Update the resource availability times: given in the new events, or recomputed for the events of the dirty resources
+        if self.log_ids.available_time in new_events.columns:
+            available_times = np.concatenate([available_times, to_nanoseconds(new_events[self.log_ids.available_time])])
+        else:
+            available_times = np.concatenate([available_times, np.full(len(new_events), NAT_NANOSECONDS, dtype=np.int64)])
+            dirty_events = event_log[self.log_ids.resource].isin(pd.unique(new_events[self.log_ids.resource])).values
+            available_times[dirty_events] = self.resource_availability.get_resource_availability_times(
+                event_log[dirty_events],
+                n_jobs=self.n_jobs
+            )
+        # Update the enablement times: given in the new events, or recomputed for the events of the dirty cases
+        if self.log_ids.enabled_time in new_events.columns:
+            enabled_times = np.concatenate([enabled_times, to_nanoseconds(new_events[self.log_ids.enabled_time])])
+        else:
+            enabled_times = np.concatenate([enabled_times, np.full(len(new_events), NAT_NANOSECONDS, dtype=np.int64)])
+            dirty_events = event_log[self.log_ids.case].isin(pd.unique(new_events[self.log_ids.case])).values
+            enabled_times[dirty_events] = self.concurrency_oracle.get_enabled_times(
+                event_log[dirty_events],
+                set_nat_to_first_event=True,
+                n_jobs=self.n_jobs
+            )
+        # Set the updated event log (indexed again only if needed)
+        self.event_log, self.log_index, self._estimation_times = event_log, None, (available_times, enabled_times)
+        # Run the final stages over the updated event log
+        estimated_start_times = self._estimate_start_times(CompactEventLog(event_log, self.log_ids), available_times, enabled_times)
+        # Build the output with the new columns (the availability and enablement times are new unless given in the new events)
+        new_columns = self._get_new_columns(new_events, available_times, enabled_times, estimated_start_times, replace_recorded_start_times)
+        if output == EstimationOutput.IN_PLACE:
+            # The columns of the updated event log are modified, so get its times from it in the next estimation or update
+            self._estimation_times = None
+        return build_estimation_output(event_log, self.log_ids, new_columns, replace_recorded_start_times, output)
+
+    def transform(
+            self,
+            event_log: pd.DataFrame,
+            replace_recorded_start_times: bool = False,
+            output: EstimationOutput = EstimationOutput.COPY,
+            log_index: EventLogIndex = None,
+            commit: bool = False
+    ):
+        """
+        Estimate the start times of each activity instance of a new event log (e.g. the cases received since the last execution) reusing
+        the concurrency relations and the resource calendars learned with [fit]. The resource availability of each event considers the
+        previous events of its resource both in the learned log and in the new one (estimating against the learned calendars extended
+        with the new events). The re-estimation statistics are computed over the durations estimated in the new event log.
+
+        :param event_log:                       new event log to estimate the start times of.
+        :param replace_recorded_start_times:    If 'true', replace the start time column with the estimated start
+                                                times, if 'false', the estimation is placed in its own column.
+        :param output:                          Form of the result (see [estimate]), with IN_PLACE writing the new columns in
+                                                [event_log].
+        :param log_index:                       index of [event_log] to reuse (built from [event_log] if not given).
+        :param commit:                          if True, keep the events of [event_log] in the resource calendars of the estimator (so the
+                                                next transformations consider them, as with consecutive windows of cases). If False, the
+                                                learned calendars are not modified.
+
+        :return: The new event log (or only the new columns of it, depending on [output]) with the estimated start time, the resource
+        availability time, and the enablement time for each activity instance.
+        """
+        if self.concurrency_oracle is None:
+            raise ValueError("The estimator has not been fitted to an event log!")
+        # Index the new event log
+        if log_index is None:
+            log_index = EventLogIndex(event_log, self.log_ids)
+        elif not log_index.matches(event_log, self.log_ids):
+            raise ValueError("The event log index does not correspond to the event log!")
+        # Resource calendars extended with the new events (kept in the estimator only if committed)
+        resource_availability = self.resource_availability.with_events(event_log, log_index)
+        if commit:
+            self.resource_availability = resource_availability
+        # Estimate with the learned concurrency and the extended resource calendars
+        return self._estimate(event_log, log_index, replace_recorded_start_times, output, resource_availability)
+
+    @staticmethod
+    def configuration_sweep(
+            event_log: pd.DataFrame,
+            configs: list,
+            replace_recorded_start_times: bool = False,
+            output: EstimationOutput = EstimationOutput.COPY,
+            log_index: EventLogIndex = None,
+            n_jobs: int = 1
+    ) -> list:
+        """
+        Estimate the start times of an event log with each configuration of a list (e.g. a grid of techniques to evaluate), computing
+        each shared stage only once. The enablement times are computed once per concurrency oracle (type, thresholds, and use of the
+        start times), and the resource availability times once per resource availability (type, bots, missing resource, and use of the
+        start times). Only the final stages (reuse of start times, instant activities, outliers, and re-estimation) run per
+        configuration. The result of each configuration is the same as with StartTimeEstimator(event_log, config).estimate().
+
+        :param event_log:                       event log to estimate the start times of.
+        :param configs:                         list of configurations to estimate the start times with.
+        :param replace_recorded_start_times:    If 'true', replace the start time column with the estimated start
+                                                times, if 'false', the estimation is placed in its own column.
+        :param output:                          Form of the result (see [estimate]). IN_PLACE is not supported, as the estimation
+                                                of each configuration would overwrite the previous one.
+        :param log_index:                       index of [event_log] to reuse for the configurations with the same log IDs (built
+                                                from [event_log] once per set of log IDs if not given).
+        :param n_jobs:                          number of worker processes to compute the enabled and availability times in parallel.
 
-        :return: A copy of the event log with the estimated start time, the resource availability time, and the enablement time for each
-        activity instance.
+        :return: a list with the result of the estimation (see [estimate]) with each configuration, in the same order as [configs].
         """
-        # Copy self event log to allow lunching this method many times
-        event_log = self.event_log.copy()
-        # Compute resource availability time if not already in the log
+        if output == EstimationOutput.IN_PLACE:
+            raise ValueError("The in place output is not supported when estimating with many configurations!")
+        # Shared stages, identified by the configuration parameters they depend on
+        log_indexes, enabled_times, available_times = {}, {}, {}
+        results = []
+        for config in configs:
+            values = configuration_to_dict(config)
+            log_ids_key = json.dumps(values['log_ids'], sort_keys=True)
+            enablement_key = json.dumps([
+                values['log_ids'],
+                values['concurrency_oracle_type'],
+                values['consider_start_times'],
+                values['heuristics_thresholds'] if config.concurrency_oracle_type == ConcurrencyOracleType.HEURISTICS else None
+            ], sort_keys=True)
+            availability_key = json.dumps([
+                values['log_ids'],
+                values['resource_availability_type'],
+                values['consider_start_times'],
+                values['missing_resource'],
+                values['bot_resources']
+            ], sort_keys=True, default=str)
+            # Index the event log once per set of log IDs
+            if log_ids_key not in log_indexes:
+                if log_index is not None and log_index.matches(event_log, config.log_ids):
+                    log_indexes[log_ids_key] = log_index
+                else:
+                    log_indexes[log_ids_key] = EventLogIndex(event_log, config.log_ids)
+            start_time_estimator = StartTimeEstimator(config=config, n_jobs=n_jobs)
+            start_time_estimator.event_log, start_time_estimator.log_index = event_log, log_indexes[log_ids_key]
+            # Compute the enablement times once per concurrency oracle
+            if enablement_key not in enabled_times:
+                if config.log_ids.enabled_time not in event_log.columns:
+                    start_time_estimator._fit_concurrency_oracle()
+                enabled_times[enablement_key] = start_time_estimator._get_enabled_times(event_log, start_time_estimator.log_index)
+            # Compute the resource availability times once per resource availability
+            if availability_key not in available_times:
+                if config.log_ids.available_time not in event_log.columns:
+                    start_time_estimator._fit_resource_availability()
+                available_times[availability_key] = start_time_estimator._get_available_times(event_log, start_time_estimator.log_index)
+            # Run the final stages of the estimation with this configuration
+            estimated_start_times = start_time_estimator._estimate_start_times(
+                start_time_estimator.log_index,
+                available_times[availability_key],
+                enabled_times[enablement_key]
+            )
+            new_columns = start_time_estimator._get_new_columns(
+                event_log,
+                available_times[availability_key],
+                enabled_times[enablement_key],
+                estimated_start_times,
+                replace_recorded_start_times
+            )
+            results += [build_estimation_output(event_log, config.log_ids, new_columns, replace_recorded_start_times, output)]
+        return results
+
+    def _estimate(
+            self,
+            event_log: pd.DataFrame,
+            log_index: EventLogIndex,
+            replace_recorded_start_times: bool,
+            output: EstimationOutput,
+            resource_availability: ResourceAvailability = None
+    ):
+        # Compute, over the compact event log (codes and int64 timestamps), the new columns (except the ones already in the log)
+        (available_times, enabled_times, estimated_start_times) = self._estimate_nanoseconds(event_log, log_index, resource_availability)
+        new_columns = self._get_new_columns(event_log, available_times, enabled_times, estimated_start_times, replace_recorded_start_times)
+        # Build the output with the new columns
+        return build_estimation_output(event_log, self.log_ids, new_columns, replace_recorded_start_times, output)
+
+    def _get_new_columns(
+            self,
+            event_log: pd.DataFrame,
+            available_times: np.ndarray,
+            enabled_times: np.ndarray,
+            estimated_start_times: np.ndarray,
+            replace_recorded_start_times: bool
+    ) -> dict:
+        # Set the resource availability and enablement times if not already in the log
+        new_columns = {}
         if self.log_ids.available_time not in event_log.columns:
-            self.resource_availability.add_resource_availability_times(event_log)
-        # Compute enablement time if not already in the log
+            new_columns[self.log_ids.available_time] = available_times
         if self.log_ids.enabled_time not in event_log.columns:
-            self.concurrency_oracle.add_enabled_times(event_log, set_nat_to_first_event=True)
-        # Assign estimated start timestamps
-        event_log[self.log_ids.estimated_start_time] = event_log[
-            [self.log_ids.available_time, self.log_ids.enabled_time]
-        ].max(axis=1, skipna=True, numeric_only=False)
-        # Reuse current start times as estimation if the option is enabled
-        if self.config.reuse_current_start_times:
-            event_log.loc[
-                ~pd.isna(event_log[self.log_ids.start_time]),
-                self.log_ids.estimated_start_time
-            ] = event_log[self.log_ids.start_time]
-        # Re-estimate as instant those activities declared as instant
-        event_log.loc[
-            event_log[self.log_ids.activity].isin(self.config.instant_activities),
-            self.log_ids.estimated_start_time
-        ] = event_log[self.log_ids.end_time]
+            new_columns[self.log_ids.enabled_time] = enabled_times
+        # Set the estimation in its own column, or as start times if replacement to true
+        start_time_column = self.log_ids.start_time if replace_recorded_start_times else self.log_ids.estimated_start_time
+        new_columns[start_time_column] = estimated_start_times
+        return {column: values.view('datetime64[ns]') for column, values in new_columns.items()}
+
+    def _estimate_nanoseconds(
+            self,
+            event_log: pd.DataFrame,
+            log_index: EventLogIndex,
+            resource_availability: ResourceAvailability = None
+    ) -> (np.ndarray, np.ndarray, np.ndarray):
+        # Compute the resource availability and enablement times if not already in the log
+        available_times = self._get_available_times(event_log, log_index, resource_availability)
+        enabled_times = self._get_enabled_times(event_log, log_index)
+        return available_times, enabled_times, self._estimate_start_times(log_index, available_times, enabled_times)
+
+    def _get_available_times(
+            self,
+            event_log: pd.DataFrame,
+            log_index: EventLogIndex,
+            resource_availability: ResourceAvailability = None
+    ) -> np.ndarray:
+        # Compute the resource availability times (with the resource calendars of the estimator if not given) if not already in the log
+        if self.log_ids.available_time not in event_log.columns:
+            if resource_availability is None:
+                resource_availability = self.resource_availability
+            return resource_availability.get_resource_availability_times(event_log, log_index, self.n_jobs)
+        else:
+            return to_nanoseconds(event_log[self.log_ids.available_time])
+
+    def _get_enabled_times(self, event_log: pd.DataFrame, log_index: EventLogIndex) -> np.ndarray:
+        # Compute the enablement times if not already in the log
+        if self.log_ids.enabled_time not in event_log.columns:
+            return self.concurrency_oracle.get_enabled_times(
+                event_log,
+                set_nat_to_first_event=True,
+                log_index=log_index,
+                n_jobs=self.n_jobs
+            )
+        else:
+            return to_nanoseconds(event_log[self.log_ids.enabled_time])
+
+    def _estimate_start_times(self, log_index: CompactEventLog, available_times: np.ndarray, enabled_times: np.ndarray) -> np.ndarray:
+        # Estimate the start times before the re-estimation stages
+        estimated_start_times = self._get_initial_start_times(log_index, available_times, enabled_times)
+        # Compute the statistics of the estimated durations of each activity once, to share them between re-estimation stages
+        duration_statistics = ActivityDurationStatistics(
+            log_index.activity_codes,
+            _get_durations(log_index.end_times, estimated_start_times),
+            len(log_index.activities)
+        )
         # Re-estimate start time of those events with an estimated duration over the threshold
         if not math.isnan(self.config.outlier_threshold):
-            self._re_estimate_durations_over_threshold(event_log)
+            estimated_start_times = self._clip_durations_over_threshold(log_index.end_times, estimated_start_times, duration_statistics)
         # Fix start time of those events for which it could not be estimated (with pd.NaT)
         if self.config.re_estimation_method == ReEstimationMethod.SET_INSTANT:
-            self._set_instant_non_estimated_start_times(event_log)
+            estimated_start_times = np.where(estimated_start_times == NAT_NANOSECONDS, log_index.end_times, estimated_start_times)
         else:
-            self._re_estimate_non_estimated_start_times(event_log)
-        # If replacement to true, set estimated as start times
-        if replace_recorded_start_times:
-            event_log[self.log_ids.start_time] = event_log[self.log_ids.estimated_start_time]
-            event_log.drop([self.log_ids.estimated_start_time], axis=1, inplace=True)
-        # Return estimated event log
-        return event_log
-
-    def _re_estimate_durations_over_threshold(self, event_log: pd.DataFrame):
-        # Get only events with estimated start time
-        estimated_events = event_log[~pd.isna(event_log[self.log_ids.estimated_start_time])]
-        # For each event, if the duration is over the threshold, set the defined statistic
-        for activity, events in estimated_events.groupby([self.log_ids.activity]):
-            statistic_duration = self._apply_statistic(events[self.log_ids.end_time] - events[self.log_ids.estimated_start_time])
-            duration_limit = self.config.outlier_threshold * statistic_duration
-            event_log.loc[
-                (event_log[self.log_ids.activity] == activity) &
-                (~pd.isna(event_log[self.log_ids.estimated_start_time])) &
-                ((event_log[self.log_ids.end_time] - event_log[self.log_ids.estimated_start_time]) > duration_limit),
-                self.log_ids.estimated_start_time
-            ] = event_log[self.log_ids.end_time] - duration_limit
+            estimated_start_times = self._fill_non_estimated_start_times(log_index.end_times, estimated_start_times, duration_statistics)
+        return estimated_start_times
+
+    def _get_initial_start_times(self, log_index: CompactEventLog, available_times: np.ndarray, enabled_times: np.ndarray) -> np.ndarray:
+        # Assign estimated start timestamps (NaT is the minimum int64, so it is only kept if both are NaT)
+        estimated_start_times = np.maximum(available_times, enabled_times)
+        # Reuse current start times as estimation if the option is enabled
+        if self.config.reuse_current_start_times:
+            estimated_start_times = np.where(log_index.start_times != NAT_NANOSECONDS, log_index.start_times, estimated_start_times)
+        # Re-estimate as instant those activities declared as instant
+        instant_activities = np.array([activity in self.config.instant_activities for activity in log_index.activities], dtype=bool)
+        instant_events = np.append(instant_activities, False)[log_index.activity_codes]
+        estimated_start_times = np.where(instant_events, log_index.end_times, estimated_start_times)
+        return estimated_start_times
+
+    def _re_estimate_durations_over_threshold(self, event_log: pd.DataFrame, duration_statistics: ActivityDurationStatistics = None):
+        end_times = to_nanoseconds(event_log[self.log_ids.end_time])
+        estimated_start_times = to_nanoseconds(event_log[self.log_ids.estimated_start_time])
+        if duration_statistics is None:
+            duration_statistics = self._get_duration_statistics(event_log, end_times, estimated_start_times)
+        estimated_start_times = self._clip_durations_over_threshold(end_times, estimated_start_times, duration_statistics)
+        event_log[self.log_ids.estimated_start_time] = from_nanoseconds(estimated_start_times, event_log.index)
+
+    def _clip_durations_over_threshold(
+            self,
+            end_times: np.ndarray,
+            estimated_start_times: np.ndarray,
+            duration_statistics: ActivityDurationStatistics
+    ) -> np.ndarray:
+        # Get the limit of the duration of each event, as the defined statistic of the durations of its activity over the threshold
+        statistic_durations = duration_statistics.get_event_statistic(self._get_statistic_name(self.config.outlier_statistic))
+        duration_limits = _get_duration_limits(statistic_durations, self.config.outlier_threshold)
+        # For each event, if the duration is over the limit of its activity, set the limit as duration
+        (estimated_start_times, over_threshold) = _clip_start_times(end_times, estimated_start_times, duration_limits)
+        # Update the durations of the re-estimated events in the statistics
+        duration_statistics.update_durations(over_threshold, duration_limits[over_threshold])
+        return estimated_start_times
 
     def _set_instant_non_estimated_start_times(self, event_log: pd.DataFrame):
         # Identify events with non_estimated as start time
@@ -106,37 +478,135 @@ class StartTimeEstimator:
             self.log_ids.estimated_start_time
         ] = event_log[self.log_ids.end_time]
 
-    def _re_estimate_non_estimated_start_times(self, event_log: pd.DataFrame):
-        # Get only events with estimated start time
-        estimated_events = event_log[~pd.isna(event_log[self.log_ids.estimated_start_time])]
-        # For each event, if the duration is over the threshold, set the defined statistic
-        for activity, events in estimated_events.groupby([self.log_ids.activity]):
-            durations = (events[self.log_ids.end_time] - events[self.log_ids.estimated_start_time]).values
-            statistic_duration = self._get_activity_duration(durations)
-            event_log.loc[
-                (event_log[self.log_ids.activity] == activity) &
-                pd.isna(event_log[self.log_ids.estimated_start_time]),
-                self.log_ids.estimated_start_time
-            ] = event_log[self.log_ids.end_time] - statistic_duration
-        # Set remaining non estimated activity instances to instant (those of activities with no estimated time)
-        event_log[self.log_ids.estimated_start_time].fillna(event_log[self.log_ids.end_time], inplace=True)
+    def _re_estimate_non_estimated_start_times(self, event_log: pd.DataFrame, duration_statistics: ActivityDurationStatistics = None):
+        end_times = to_nanoseconds(event_log[self.log_ids.end_time])
+        estimated_start_times = to_nanoseconds(event_log[self.log_ids.estimated_start_time])
+        if duration_statistics is None:
+            duration_statistics = self._get_duration_statistics(event_log, end_times, estimated_start_times)
+        estimated_start_times = self._fill_non_estimated_start_times(end_times, estimated_start_times, duration_statistics)
+        event_log[self.log_ids.estimated_start_time] = from_nanoseconds(estimated_start_times, event_log.index)
+
+    def _fill_non_estimated_start_times(
+            self,
+            end_times: np.ndarray,
+            estimated_start_times: np.ndarray,
+            duration_statistics: ActivityDurationStatistics
+    ) -> np.ndarray:
+        # Get the duration to set to each event as the defined statistic of the (estimated) durations of its activity
+        statistic_durations = duration_statistics.get_event_statistic(self._get_statistic_name(self.config.re_estimation_method))
+        return _fill_start_times(end_times, estimated_start_times, statistic_durations)
+
+    def _get_duration_statistics(self, event_log: pd.DataFrame, end_times: np.ndarray, estimated_start_times: np.ndarray):
+        # Build the statistics of the estimated durations of each activity of the event log
+        activity_codes, activities = pd.factorize(event_log[self.log_ids.activity])
+        return ActivityDurationStatistics(activity_codes, _get_durations(end_times, estimated_start_times), len(activities))
 
     def _get_activity_duration(self, durations):
-        if self.config.re_estimation_method == ReEstimationMethod.MODE:
-            return mode(durations)
-        elif self.config.re_estimation_method == ReEstimationMethod.MEDIAN:
-            return np.median(durations)
-        elif self.config.re_estimation_method == ReEstimationMethod.MEAN:
-            return np.mean(durations)
-        else:
-            raise ValueError("Unselected re-estimation method for events with non-estimated start time!")
+        return _compute_duration_statistic(self._get_statistic_name(self.config.re_estimation_method), durations)
 
     def _apply_statistic(self, durations):
-        if self.config.outlier_statistic == OutlierStatistic.MODE:
-            return mode(durations)
-        elif self.config.outlier_statistic == OutlierStatistic.MEDIAN:
-            return np.median(durations)
-        elif self.config.outlier_statistic == OutlierStatistic.MEAN:
-            return np.mean(durations)
+        return _compute_duration_statistic(self._get_statistic_name(self.config.outlier_statistic), durations)
+
+    @staticmethod
+    def _get_statistic_name(statistic) -> str:
+        if statistic in (ReEstimationMethod.MODE, OutlierStatistic.MODE):
+            return 'MODE'
+        elif statistic in (ReEstimationMethod.MEDIAN, OutlierStatistic.MEDIAN):
+            return 'MEDIAN'
+        elif statistic in (ReEstimationMethod.MEAN, OutlierStatistic.MEAN):
+            return 'MEAN'
+        elif isinstance(statistic, ReEstimationMethod):
+            raise ValueError("Unselected re-estimation method for events with non-estimated start time!")
         else:
             raise ValueError("Unselected outlier statistic for events with estimated duration over the established!")
+
+
+def _get_durations(end_times: np.ndarray, start_times: np.ndarray) -> np.ndarray:
+    # Durations in nanoseconds (int64), with NAT_NANOSECONDS if any of the timestamps is missing
+    return np.where(
+        (end_times != NAT_NANOSECONDS) & (start_times != NAT_NANOSECONDS),
+        end_times - start_times,
+        NAT_NANOSECONDS
+    )
+
+
+def _get_duration_limits(statistic_durations: np.ndarray, outlier_threshold: float) -> np.ndarray:
+    # Limit of the duration of each event as the statistic of the durations of its activity over the threshold (NAT_NANOSECONDS if
+    # its activity has no statistic)
+    with_limit = statistic_durations != NAT_NANOSECONDS
+    duration_limits = np.where(with_limit, outlier_threshold * statistic_durations.astype(float), 0).astype(np.int64)
+    duration_limits[~with_limit] = NAT_NANOSECONDS
+    return duration_limits
+
+
+def _clip_start_times(end_times: np.ndarray, start_times: np.ndarray, duration_limits: np.ndarray) -> (np.ndarray, np.ndarray):
+    # Set the limit as the duration of the events with a duration over the limit of their activity, returning the new start times
+    # and the positions of the clipped events
+    durations = _get_durations(end_times, start_times)
+    over_threshold = np.flatnonzero(
+        (duration_limits != NAT_NANOSECONDS) & (durations != NAT_NANOSECONDS) & (durations > duration_limits)
+    )
+    start_times = start_times.copy()
+    start_times[over_threshold] = end_times[over_threshold] - duration_limits[over_threshold]
+    return start_times, over_threshold
+
+
+def _fill_start_times(end_times: np.ndarray, start_times: np.ndarray, statistic_durations: np.ndarray) -> np.ndarray:
+    # Set the non estimated activity instances to the duration of their activity, or to instant if their activity has no
+    # estimated durations
+    with_duration = (statistic_durations != NAT_NANOSECONDS) & (end_times != NAT_NANOSECONDS)
+    return np.where(
+        start_times == NAT_NANOSECONDS,
+        np.where(with_duration, end_times - np.where(with_duration, statistic_durations, 0), end_times),
+        start_times
+    )
+
+
+def _compute_duration_statistic(statistic: str, durations) -> pd.Timedelta:
+    # Compute the statistic over a list/array of durations
+    durations = np.asarray(pd.to_timedelta(durations), dtype='timedelta64[ns]').view(np.int64)
+    durations = durations[durations != NAT_NANOSECONDS]
+    value = compute_grouped_statistic(statistic, np.zeros(len(durations), dtype=np.int64), durations, 1)[0]
+    return pd.NaT if value == NAT_NANOSECONDS else pd.Timedelta(value)
+
+
+def build_estimation_output(
+        event_log: pd.DataFrame,
+        log_ids: EventLogIDs,
+        new_columns: dict,
+        replace_recorded_start_times: bool = False,
+        output: EstimationOutput = EstimationOutput.COPY
+):
+    """
+    Build the result of an estimation (see StartTimeEstimator.estimate) from the values of the new columns.
+
+    :param event_log:                       event log the new columns have been estimated for.
+    :param log_ids:                         IDs of the columns of the event log.
+    :param new_columns:                     dictionary with the name of each new column as key and its values (np.ndarray of UTC
+                                            datetime64[ns], aligned with [event_log]) as value.
+    :param replace_recorded_start_times:    if 'true', the start time column is one of the new columns, replacing the recorded start
+                                            times, and the estimated start time column is removed from the event log.
+    :param output:                          form of the result (see EstimationOutput).
+
+    :return: The event log (or only the new columns of it, depending on [output]) with the new columns.
+    """
+    # Return only the new columns without building a DataFrame
+    if output == EstimationOutput.ARRAYS:
+        return new_columns
+    # Return only the new columns, aligned with the event log
+    if output == EstimationOutput.NEW_COLUMNS:
+        return pd.DataFrame(
+            {column: from_nanoseconds(values, event_log.index) for column, values in new_columns.items()},
+            index=event_log.index
+        )
+    # Set the new columns in the event log, or in a copy of it to allow lunching the estimation many times
+    if output == EstimationOutput.COPY:
+        event_log = event_log.copy()
+    elif output != EstimationOutput.IN_PLACE:
+        raise ValueError("No estimation output defined!")
+    for column, values in new_columns.items():
+        event_log[column] = from_nanoseconds(values, event_log.index)
+    if replace_recorded_start_times and log_ids.estimated_start_time in event_log.columns:
+        event_log.drop([log_ids.estimated_start_time], axis=1, inplace=True)
+    # Return estimated event log
+    return event_log
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from estimate_start_times.compact_event_log import CompactEventLog
+from estimate_start_times.config import EventLogIDs
+
+
+class EventLogIndex(CompactEventLog):
+    """
+    Index of an event log, built once and shared by the concurrency oracle, the resource availability, and the enablement and availability
+    time calculations, so the event log is grouped by case and by resource only once. It can be built once and passed to several
+    estimators working on the same event log.
+
+    On top of the compact event log (int32 codes of the identifiers and int64 timestamps), the groups are stored in CSR layout: a
+    permutation of the events sorting them by case (resp. resource) and end time, and the offsets where each case (resp. resource)
+    starts in it.
+    """
+
+    __slots__ = ('case_order', 'case_offsets', 'case_order_is_log_order', 'resource_order', 'resource_offsets')
+
+    def __init__(self, event_log: pd.DataFrame, log_ids: EventLogIDs):
+        # Build the compact (columnar) event log with the codes and timestamps
+        super(EventLogIndex, self).__init__(event_log, log_ids)
+        # Group the events by case: sorted by case and, within each case, by end time (in log order if it is already sorted by it)
+        self.case_order, self.case_offsets, self.case_order_is_log_order = None, None, True
+        if self.case_codes is not None:
+            self.case_order = np.argsort(self.case_codes, kind='stable')
+            self.case_order = self.case_order[self.case_codes[self.case_order] >= 0]
+            if self.end_times is not None:
+                sorted_cases = self.case_codes[self.case_order]
+                sorted_end_times = self.end_times[self.case_order]
+                self.case_order_is_log_order = bool(np.all(
+                    (sorted_end_times[1:] >= sorted_end_times[:-1]) | (sorted_cases[1:] != sorted_cases[:-1])
+                ))
+            if not self.case_order_is_log_order:
+                self.case_order = np.lexsort((self.end_times, self.case_codes))
+                self.case_order = self.case_order[self.case_codes[self.case_order] >= 0]
+            self.case_offsets = np.searchsorted(self.case_codes[self.case_order], np.arange(len(self.cases) + 1))
+        # Group the events by resource: sorted by resource and, within each resource, by end time
+        self.resource_order, self.resource_offsets = None, None
+        if self.resource_codes is not None:
+            if self.end_times is not None:
+                self.resource_order = np.lexsort((self.end_times, self.resource_codes))
+            else:
+                self.resource_order = np.argsort(self.resource_codes, kind='stable')
+            self.resource_order = self.resource_order[self.resource_codes[self.resource_order] >= 0]
+            self.resource_offsets = np.searchsorted(self.resource_codes[self.resource_order], np.arange(len(self.resources) + 1))
+
+    def matches(self, event_log: pd.DataFrame, log_ids: EventLogIDs) -> bool:
+        """
+        Check if this index has been built from [event_log] with the IDs [log_ids].
+
+        :param event_log:   event log to check.
+        :param log_ids:     IDs of the columns of the event log.
+
+        :return: True if the index corresponds to the event log, False otherwise.
+        """
+        return self.log_ids == log_ids and self.index.equals(event_log.index)
+
+    def get_case_order_in_log_order(self) -> np.ndarray:
+        """
+        Get the permutation grouping the events by case, keeping, within each case, the order of the events in the log.
+
+        :return: an array with the position of the events grouped by case.
+        """
+        if self.case_order_is_log_order:
+            return self.case_order
+        else:
+            order = np.argsort(self.case_codes, kind='stable')
+            return order[self.case_codes[order] >= 0]
+
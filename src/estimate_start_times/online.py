@@ -0,0 +1,294 @@
+import math
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from estimate_start_times.concurrency_oracle import ConcurrencyOracle, DeactivatedConcurrencyOracle
+from estimate_start_times.config import Configuration, EstimationOutput, ReEstimationMethod
+from estimate_start_times.duration_statistics import RunningDurationStatistics, WindowedDurationStatistics
+from estimate_start_times.estimator import StartTimeEstimator, build_estimation_output
+from estimate_start_times.utils import to_nanoseconds, NAT_NANOSECONDS
+
+
+class OnlineStartTimeEstimator:
+    """
+    Estimator of the start times of a stream of events received in end time order (e.g. the events of a process as they are
+    completed), reusing the concurrency relations of a fitted concurrency oracle. For each new event, its enablement time is the last
+    end time (previous to the event) of the activities of its case not concurrent with it, its resource availability time is the
+    last end time (previous to the event) of its resource, and the re-estimation statistics are computed over the durations of the
+    events of the same activity estimated so far.
+
+    The state is formed by the distinct end times of each activity of each open case, the distinct end times of each active resource,
+    and the running duration statistics of each activity (the exact mean, and the mode and median of a window with the last durations).
+    When the start times are not considered, only the last two distinct end times are kept per activity and resource. The cases can be
+    evicted with [close_case], the cases and resources with no events since a timestamp with [evict_before] (or automatically, with a
+    [horizon]), and the older end times with [forget_before], so the memory is bounded by the open cases and active resources.
+    """
+
+    def __init__(
+            self,
+            concurrency_oracle: ConcurrencyOracle,
+            config: Configuration = None,
+            statistics_window: Optional[int] = 10_000,
+            horizon=None
+    ):
+        """
+        :param concurrency_oracle:  fitted concurrency oracle with the concurrency relations to use.
+        :param config:              configuration of the estimation (the one of the concurrency oracle if not given).
+        :param statistics_window:   number of last estimated durations of each activity to compute its mode and median from (the mean
+                                    is computed from all of them). If None, all the durations are kept to compute the exact statistics
+                                    (as the batch estimation), with a memory growing with the length of the stream.
+        :param horizon:             if given (e.g. pd.Timedelta(days=30)), evict the cases and resources with no events during the
+                                    horizon previous to each new event (see [evict_before]).
+        """
+        # Set configuration
+        self.config = config if config is not None else concurrency_oracle.config
+        # Set log IDs to ease access within class
+        self.log_ids = self.config.log_ids
+        # Concurrency relations: concurrency[A] = set of activities concurrent with A (None if the enablement is deactivated)
+        self.concurrency = None if isinstance(concurrency_oracle, DeactivatedConcurrencyOracle) else concurrency_oracle.concurrency
+        # Distinct end times (ascending) of each activity of each open case, sorted by last event
+        self._cases = OrderedDict()
+        # Distinct end times (ascending) of each active resource, sorted by last event
+        self._resources = OrderedDict()
+        # Window of the statistics of the durations of each activity, and horizon to evict the inactive cases and resources (in ns)
+        self.statistics_window = statistics_window
+        self._horizon = None if horizon is None else pd.Timedelta(horizon).value
+        # Running statistics of the estimated durations of each activity
+        self._statistics = {}
+        # End time of the last event received, to check the order
+        self._last_end_time = NAT_NANOSECONDS
+
+    @staticmethod
+    def from_estimator(start_time_estimator: StartTimeEstimator, statistics_window: Optional[int] = 10_000, horizon=None):
+        """
+        Build an online estimator reusing the concurrency oracle and the configuration of a fitted estimator.
+
+        :param start_time_estimator:    estimator fitted to an event log (e.g. the history of the process).
+        :param statistics_window:       number of last durations of each activity to compute its mode and median from (see __init__).
+        :param horizon:                 period without events after which the cases and resources are evicted (see __init__).
+
+        :return: the OnlineStartTimeEstimator with the concurrency relations of [start_time_estimator].
+        """
+        if start_time_estimator.concurrency_oracle is None:
+            raise ValueError("The estimator has not been fitted to an event log!")
+        return OnlineStartTimeEstimator(
+            start_time_estimator.concurrency_oracle,
+            start_time_estimator.config,
+            statistics_window,
+            horizon
+        )
+
+    def estimate_event(self, case, activity, end_time, resource=None, start_time=None) -> (pd.Timestamp, pd.Timestamp, pd.Timestamp):
+        """
+        Estimate the start time of a new event, and add it to the state of its case and resource.
+
+        :param case:        ID of the case of the event.
+        :param activity:    activity of the event.
+        :param end_time:    end time of the event (not previous to the end time of the events already received).
+        :param resource:    resource of the event.
+        :param start_time:  recorded start time of the event (if any).
+
+        :return: a tuple with the enablement time, the resource availability time, and the estimated start time of the event (as UTC
+        pd.Timestamp, or pd.NaT).
+        """
+        (enabled_time, available_time, estimated_start_time) = self._estimate_event(
+            case,
+            activity,
+            _to_nanoseconds(end_time),
+            resource,
+            _to_nanoseconds(start_time)
+        )
+        return _to_timestamp(enabled_time), _to_timestamp(available_time), _to_timestamp(estimated_start_time)
+
+    def estimate_events(
+            self,
+            event_log: pd.DataFrame,
+            replace_recorded_start_times: bool = False,
+            output: EstimationOutput = EstimationOutput.COPY
+    ):
+        """
+        Estimate the start times of a batch of new events (sorted by end time, and not previous to the events already received) one by
+        one, as with [estimate_event].
+
+        :param event_log:                       batch of events to estimate the start times of.
+        :param replace_recorded_start_times:    If 'true', replace the start time column with the estimated start
+                                                times, if 'false', the estimation is placed in its own column.
+        :param output:                          form of the result (see StartTimeEstimator.estimate).
+
+        :return: The batch of events (or only the new columns of it, depending on [output]) with the estimated start time, the
+        resource availability time, and the enablement time for each activity instance.
+        """
+        num_events = len(event_log)
+        end_times = to_nanoseconds(event_log[self.log_ids.end_time])
+        start_times = to_nanoseconds(event_log[self.log_ids.start_time]) \
+            if self.log_ids.start_time in event_log.columns else np.full(num_events, NAT_NANOSECONDS, dtype=np.int64)
+        cases, activities = event_log[self.log_ids.case], event_log[self.log_ids.activity]
+        resources = event_log[self.log_ids.resource] if self.log_ids.resource in event_log.columns else [None] * num_events
+        # Estimate each event in order
+        enabled_times = np.empty(num_events, dtype=np.int64)
+        available_times = np.empty(num_events, dtype=np.int64)
+        estimated_start_times = np.empty(num_events, dtype=np.int64)
+        for position, (case, activity, resource) in enumerate(zip(cases, activities, resources)):
+            (enabled_times[position], available_times[position], estimated_start_times[position]) = self._estimate_event(
+                case,
+                activity,
+                int(end_times[position]),
+                resource,
+                int(start_times[position])
+            )
+        # Build the output with the new columns
+        start_time_column = self.log_ids.start_time if replace_recorded_start_times else self.log_ids.estimated_start_time
+        new_columns = {
+            self.log_ids.available_time: available_times.view('datetime64[ns]'),
+            self.log_ids.enabled_time: enabled_times.view('datetime64[ns]'),
+            start_time_column: estimated_start_times.view('datetime64[ns]')
+        }
+        return build_estimation_output(event_log, self.log_ids, new_columns, replace_recorded_start_times, output)
+
+    def close_case(self, case):
+        """
+        Evict the state of a case whose events have all been received.
+
+        :param case: ID of the case to evict.
+        """
+        self._cases.pop(case, None)
+
+    def evict_before(self, timestamp):
+        """
+        Evict the state of the cases and resources with no events ending at or after a timestamp (considered closed and inactive). The
+        next event of an evicted resource has no resource availability time, as the first one of a resource.
+
+        :param timestamp: timestamp before which the cases and resources with no later events are evicted.
+        """
+        self._evict_before(_to_nanoseconds(timestamp))
+
+    def forget_before(self, timestamp):
+        """
+        Discard the end times previous to a timestamp (except the last one of each activity and resource), to bound the state when the
+        start times are considered. The estimation of the events starting after [timestamp] is not affected.
+
+        :param timestamp: timestamp before which the end times are no longer needed.
+        """
+        timestamp = _to_nanoseconds(timestamp)
+        for end_times in [end_times for trace in self._cases.values() for end_times in trace.values()] + list(self._resources.values()):
+            del end_times[:max(bisect_right(end_times, timestamp) - 1, 0)]
+
+    @property
+    def num_open_cases(self) -> int:
+        return len(self._cases)
+
+    @property
+    def num_active_resources(self) -> int:
+        return len(self._resources)
+
+    def _evict_before(self, timestamp: int):
+        # Evict the cases and resources (sorted by last event) whose last end time is previous to the timestamp
+        for states in [self._cases, self._resources]:
+            while len(states) > 0 and _get_last_end_time(next(iter(states.values()))) < timestamp:
+                states.popitem(last=False)
+
+    def _estimate_event(self, case, activity, end_time: int, resource, start_time: int) -> (int, int, int):
+        # Check the order of the stream
+        if end_time != NAT_NANOSECONDS:
+            if end_time < self._last_end_time:
+                raise ValueError("The events must be received in end time order!")
+            self._last_end_time = end_time
+            # Evict the cases and resources with no events during the horizon
+            if self._horizon is not None:
+                self._evict_before(end_time - self._horizon)
+        # Only the end times not after the start time are considered if the option is enabled
+        limit_start_time = start_time if self.config.consider_start_times else None
+        # Enablement time: last end time of the non-concurrent activities of the case
+        trace = self._cases.setdefault(case, {})
+        enabled_time = NAT_NANOSECONDS
+        if self.concurrency is not None:
+            concurrent_activities = self.concurrency.get(activity, ())
+            for previous_activity, end_times in trace.items():
+                if previous_activity not in concurrent_activities:
+                    enabled_time = max(enabled_time, _previous_end_time(end_times, end_time, limit_start_time))
+        # Resource availability time: last end time of the resource (the end time for bots, NaT if missing)
+        resource = self.config.missing_resource if resource is None or pd.isna(resource) else str(resource)
+        if resource == self.config.missing_resource:
+            available_time = NAT_NANOSECONDS
+        elif resource in self.config.bot_resources:
+            available_time = end_time
+        else:
+            available_time = _previous_end_time(self._resources.setdefault(resource, []), end_time, limit_start_time)
+        # Assign estimated start timestamp
+        estimated_start_time = max(enabled_time, available_time)
+        # Reuse current start time as estimation if the option is enabled
+        if self.config.reuse_current_start_times and start_time != NAT_NANOSECONDS:
+            estimated_start_time = start_time
+        # Re-estimate as instant if the activity is declared as instant
+        if activity in self.config.instant_activities:
+            estimated_start_time = end_time
+        # Re-estimate the start time if the estimated duration is over the threshold
+        if activity not in self._statistics:
+            self._statistics[activity] = RunningDurationStatistics() if self.statistics_window is None \
+                else WindowedDurationStatistics(self.statistics_window)
+        statistics = self._statistics[activity]
+        with_duration = estimated_start_time != NAT_NANOSECONDS and end_time != NAT_NANOSECONDS
+        if with_duration and not math.isnan(self.config.outlier_threshold):
+            statistic_duration = statistics.get_statistic(StartTimeEstimator._get_statistic_name(self.config.outlier_statistic))
+            if statistic_duration != NAT_NANOSECONDS:
+                duration_limit = int(self.config.outlier_threshold * float(statistic_duration))
+                if end_time - estimated_start_time > duration_limit:
+                    estimated_start_time = end_time - duration_limit
+        # Add the estimated duration to the statistics of the activity
+        if with_duration:
+            statistics.add(end_time - estimated_start_time)
+        # Fix the start time if it could not be estimated
+        if estimated_start_time == NAT_NANOSECONDS:
+            if self.config.re_estimation_method == ReEstimationMethod.SET_INSTANT:
+                estimated_start_time = end_time
+            else:
+                statistic_duration = statistics.get_statistic(StartTimeEstimator._get_statistic_name(self.config.re_estimation_method))
+                with_statistic = statistic_duration != NAT_NANOSECONDS and end_time != NAT_NANOSECONDS
+                estimated_start_time = end_time - statistic_duration if with_statistic else end_time
+        # Add the event to the state of its case and resource
+        if end_time != NAT_NANOSECONDS:
+            _add_end_time(trace.setdefault(activity, []), end_time, self.config.consider_start_times)
+            self._cases.move_to_end(case)
+            if resource != self.config.missing_resource and resource not in self.config.bot_resources:
+                _add_end_time(self._resources[resource], end_time, self.config.consider_start_times)
+                self._resources.move_to_end(resource)
+        return enabled_time, available_time, estimated_start_time
+
+
+def _previous_end_time(end_times: list, end_time: int, start_time: int = None) -> int:
+    # Binary search the last end time previous to [end_time] (and not after [start_time], if given)
+    num_previous = bisect_left(end_times, end_time)
+    if start_time is not None:
+        num_previous = 0 if start_time == NAT_NANOSECONDS else min(num_previous, bisect_right(end_times, start_time))
+    return end_times[num_previous - 1] if num_previous > 0 else NAT_NANOSECONDS
+
+
+def _add_end_time(end_times: list, end_time: int, keep_history: bool):
+    # Append the end time (received in order) if distinct to the last one
+    if len(end_times) == 0 or end_times[-1] != end_time:
+        end_times.append(end_time)
+        # Without start times, only the last two distinct end times are needed to get the previous one to any new end time
+        if not keep_history and len(end_times) > 2:
+            del end_times[0]
+
+
+def _get_last_end_time(state) -> int:
+    # Last end time of the state of a resource (list of end times) or a case (end times of each activity), NAT_NANOSECONDS if none
+    end_times = [state] if isinstance(state, list) else state.values()
+    return max([times[-1] for times in end_times if len(times) > 0], default=NAT_NANOSECONDS)
+
+
+def _to_nanoseconds(timestamp) -> int:
+    # UTC nanoseconds since epoch of a timestamp (NAT_NANOSECONDS if missing)
+    if timestamp is None or pd.isna(timestamp):
+        return NAT_NANOSECONDS
+    return int(pd.Timestamp(timestamp).value)
+
+
+def _to_timestamp(nanoseconds: int) -> pd.Timestamp:
+    # UTC pd.Timestamp of the nanoseconds since epoch (pd.NaT if missing)
+    return pd.NaT if nanoseconds == NAT_NANOSECONDS else pd.Timestamp(nanoseconds, tz='UTC')
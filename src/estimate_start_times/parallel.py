@@ -0,0 +1,125 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+
+
+class SharedArrays:
+    """
+    Set of numpy arrays stored in shared memory blocks (multiprocessing.shared_memory), so worker processes can read and write them
+    without pickling them. The process creating them owns the blocks (and releases them when closed), and the workers attach to them
+    with their description ([specs]).
+    """
+
+    def __init__(self, blocks: dict, specs: dict, owner: bool):
+        # Shared memory block of each array
+        self._blocks = blocks
+        # Description of each array: name of its block, shape, and dtype
+        self.specs = specs
+        # Whether this process created the blocks (and has to release them)
+        self._owner = owner
+        # Arrays over the shared memory blocks
+        self.arrays = {
+            name: np.ndarray(shape, dtype=np.dtype(dtype), buffer=blocks[name].buf)
+            for name, (_, shape, dtype) in specs.items()
+        }
+
+    @staticmethod
+    def create(arrays: dict):
+        """
+        Copy a set of arrays to new shared memory blocks.
+
+        :param arrays: dictionary with the name of each array as key and the array (np.ndarray) as value.
+
+        :return: the SharedArrays owning the new blocks.
+        """
+        blocks, specs = {}, {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            blocks[name] = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            specs[name] = (blocks[name].name, array.shape, array.dtype.str)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=blocks[name].buf)[...] = array
+        return SharedArrays(blocks, specs, True)
+
+    @staticmethod
+    def attach(specs: dict):
+        """
+        Attach (e.g. from a worker process) to the shared memory blocks of a set of arrays.
+
+        :param specs: description of the arrays ([specs] of the SharedArrays that created them).
+
+        :return: the SharedArrays over the existing blocks.
+        """
+        return SharedArrays({name: shared_memory.SharedMemory(name=block_name) for name, (block_name, _, _) in specs.items()}, specs, False)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.arrays
+
+    def close(self):
+        """
+        Detach from the shared memory blocks, releasing them if this process created them. The arrays (and their views) can not be used
+        after closing them.
+        """
+        # Release the arrays over the blocks before closing them
+        self.arrays = {}
+        for block in self._blocks.values():
+            block.close()
+            if self._owner:
+                block.unlink()
+        self._blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_num_jobs(n_jobs: Optional[int]) -> int:
+    """
+    Get the number of worker processes to use.
+
+    :param n_jobs: requested number of jobs: None or 1 for no parallelism, and negative values for all the CPUs but (-n_jobs - 1).
+
+    :return: the number of worker processes (at least 1).
+    """
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        return max((os.cpu_count() or 1) + 1 + n_jobs, 1)
+    return max(n_jobs, 1)
+
+
+def split_groups(offsets: np.ndarray, num_shards: int) -> list:
+    """
+    Split a set of groups in CSR layout (e.g. the events of each case) into contiguous shards of whole groups with a similar number of
+    elements.
+
+    :param offsets:     offsets where each group starts (and the total number of elements as last value).
+    :param num_shards:  maximum number of shards.
+
+    :return: a list with the (start, end) position of the elements of each non-empty shard.
+    """
+    # Cut at the first group starting after each even split of the elements
+    targets = np.linspace(0, offsets[-1], num_shards + 1)
+    cuts = np.unique(offsets[np.minimum(np.searchsorted(offsets, targets), len(offsets) - 1)])
+    return [(int(start), int(end)) for start, end in zip(cuts[:-1], cuts[1:]) if end > start]
+
+
+def run_in_workers(function, arguments: list, num_jobs: int) -> list:
+    """
+    Run a function (defined at module level, so it can be pickled) with each set of arguments in a pool of worker processes.
+
+    :param function:    function to run.
+    :param arguments:   list with the tuple of arguments of each call.
+    :param num_jobs:    maximum number of worker processes.
+
+    :return: a list with the result of each call, in the same order as [arguments].
+    """
+    with ProcessPoolExecutor(max_workers=max(min(num_jobs, len(arguments)), 1)) as executor:
+        return list(executor.map(function, *zip(*arguments)))
@@ -0,0 +1,409 @@
+import math
+import os
+import shutil
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from estimate_start_times.concurrency_oracle import AlphaConcurrencyOracle, HeuristicsConcurrencyOracle, \
+    DirectlyFollowsConcurrencyOracle, DeactivatedConcurrencyOracle, ConcurrencyOracle, _get_heuristics_counts
+from estimate_start_times.config import Configuration, ConcurrencyOracleType, ReEstimationMethod, configuration_to_dict, \
+    configuration_from_dict
+from estimate_start_times.duration_statistics import ActivityDurationStatistics
+from estimate_start_times.estimator import StartTimeEstimator, _get_durations, _get_duration_limits, _clip_start_times, \
+    _fill_start_times
+from estimate_start_times.event_log_index import EventLogIndex
+from estimate_start_times.parallel import get_num_jobs, run_in_workers
+from estimate_start_times.persistence import save_artifact, load_artifact, artifact_exists
+from estimate_start_times.utils import to_nanoseconds, from_nanoseconds, NAT_NANOSECONDS
+
+# Directories (within the directory of the estimation) with the files of each step
+_CASE_PARTITIONS = 'case_partitions'
+_RELATION_COUNTS = 'relation_counts'
+_CONCURRENCY_ORACLE = 'concurrency_oracle'
+_RESOURCE_PARTITIONS = 'resource_partitions'
+_INITIAL_ESTIMATIONS = 'initial_estimations'
+_DURATIONS = 'durations'
+_DURATION_STATISTICS = 'duration_statistics'
+_RESULTS = 'results'
+
+
+class PartitionedStartTimeEstimator:
+    """
+    Estimation of the start times of event logs that do not fit in memory, in two phases over partitions of the event log stored as
+    local files. In the first phase, the event log is split by case (hash of the case ID), the directly-follows relations counted in
+    each partition are added to discover the concurrency relations, and the enabled times of each partition are computed (as the
+    enablement only depends on the events of the same case). Then, the events (with their enabled times) are split by resource, and in
+    the second phase the resource availability times of each partition are computed (as the availability only depends on the events of
+    the same resource). Finally, the per-activity statistics are computed from the estimated durations of all the partitions, and each
+    partition is re-estimated with them.
+
+    Each step over a partition only reads and writes files in the directory of the estimation, so the partitions can be processed by
+    several local processes (or, sharing the directory, by several machines, each one processing some of the partitions). The result is
+    the same as estimating, with a StartTimeEstimator, the whole event log with its events in the order they are received. The merge of
+    the statistics reads the activity and estimated duration of every event (12 bytes per event), as the mode and median of each
+    activity need all its durations.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            config: Configuration = None,
+            num_case_partitions: int = 16,
+            num_resource_partitions: int = 16,
+            n_jobs: Optional[int] = 1
+    ):
+        """
+        :param path:                    path of the directory to store the partitions and the results in.
+        :param config:                  configuration of the estimation.
+        :param num_case_partitions:     number of partitions of the event log by case.
+        :param num_resource_partitions: number of partitions of the event log by resource.
+        :param n_jobs:                  number of worker processes to process the partitions of each step (1 to process them in this
+                                        process, -1 to use all the CPUs).
+        """
+        self.path = path
+        self.config = config if config is not None else Configuration()
+        self.log_ids = self.config.log_ids
+        self.num_case_partitions = num_case_partitions
+        self.num_resource_partitions = num_resource_partitions
+        self.n_jobs = n_jobs
+
+    def estimate(self, event_log_chunks: Iterable[pd.DataFrame]):
+        """
+        Run all the steps of the estimation over an event log received in chunks (e.g. read from a CSV file with 'chunksize'), to read
+        the results afterwards with [iter_results] or [read_results].
+
+        :param event_log_chunks: iterable with the chunks of the event log, in order.
+        """
+        self.partition_by_case(event_log_chunks)
+        self.discover_concurrency()
+        self.compute_enabled_times()
+        self.compute_available_times()
+        self.compute_duration_statistics()
+        self.re_estimate()
+
+    def partition_by_case(self, event_log_chunks: Iterable[pd.DataFrame]):
+        """
+        Split an event log received in chunks into partitions by case, removing the files of any previous estimation. The events are
+        identified (indexed) by their position in the event log.
+
+        :param event_log_chunks: iterable with the chunks of the event log, in order.
+        """
+        # Clean the files of previous estimations
+        for step in [_CASE_PARTITIONS, _RELATION_COUNTS, _CONCURRENCY_ORACLE, _RESOURCE_PARTITIONS, _INITIAL_ESTIMATIONS, _DURATIONS,
+                     _DURATION_STATISTICS, _RESULTS]:
+            shutil.rmtree(os.path.join(self.path, step), ignore_errors=True)
+        # Split each chunk by case
+        (num_events, columns) = (0, [])
+        for chunk_number, chunk in enumerate(event_log_chunks):
+            columns = list(chunk.columns)
+            chunk = chunk.set_axis(pd.RangeIndex(num_events, num_events + len(chunk)), axis=0)
+            _write_partitions(
+                chunk,
+                chunk[self.log_ids.case],
+                self.num_case_partitions,
+                os.path.join(self.path, _CASE_PARTITIONS),
+                chunk_number
+            )
+            num_events += len(chunk)
+        # Store the configuration and the columns of the event log for the workers
+        save_artifact(
+            self.path,
+            'PartitionedEstimation',
+            {
+                'config': configuration_to_dict(self.config),
+                'columns': columns,
+                'num_case_partitions': self.num_case_partitions,
+                'num_resource_partitions': self.num_resource_partitions
+            },
+            {}
+        )
+
+    def discover_concurrency(self, partitions: list = None):
+        """
+        Discover the concurrency relations of the event log, counting the directly-follows relations of each partition by case and
+        adding them up (the relations are within a case, so the counts of the partitions are additive).
+
+        :param partitions: partitions by case to count the relations of (all if None). The concurrency oracle is discovered only when
+                           the relations of all the partitions have been counted (right away if the oracle is deactivated, as it needs
+                           no counts).
+        """
+        if self.config.concurrency_oracle_type == ConcurrencyOracleType.DEACTIVATED:
+            counts_done = True
+        else:
+            self._run(_count_relations, self.num_case_partitions, partitions)
+            counts_done = len(_get_pending_partitions(os.path.join(self.path, _RELATION_COUNTS), self.num_case_partitions)) == 0
+        if counts_done:
+            _discover_concurrency_oracle(self.path, self.config, self.num_case_partitions).save(
+                os.path.join(self.path, _CONCURRENCY_ORACLE)
+            )
+
+    def compute_enabled_times(self, partitions: list = None):
+        """
+        Compute the enabled times of the events of each partition by case, and split them (with their enabled times) by resource.
+
+        :param partitions: partitions by case to process (all if None).
+        """
+        if not artifact_exists(os.path.join(self.path, _CONCURRENCY_ORACLE)):
+            # The concurrency oracle is discovered once the relations of all the partitions have been counted
+            raise ValueError("The relations of the partitions by case {} have not been counted (see discover_concurrency)!".format(
+                _get_pending_partitions(os.path.join(self.path, _RELATION_COUNTS), self.num_case_partitions)
+            ))
+        self._run(_compute_enabled_times, self.num_case_partitions, partitions)
+
+    def compute_available_times(self, partitions: list = None):
+        """
+        Compute the resource availability times of the events of each partition by resource, their estimated start times before the
+        re-estimation stages, and the resulting durations.
+
+        :param partitions: partitions by resource to process (all if None).
+        """
+        self._run(_compute_available_times, self.num_resource_partitions, partitions)
+
+    def compute_duration_statistics(self):
+        """
+        Merge the estimated durations of all the partitions by resource and compute the statistics of each activity used to re-estimate
+        the durations over the outlier threshold and the non-estimated start times.
+        """
+        _compute_duration_statistics(self.path, self.config, self.num_resource_partitions)
+
+    def re_estimate(self, partitions: list = None):
+        """
+        Re-estimate the start times of each partition by resource with the statistics of the whole event log.
+
+        :param partitions: partitions by resource to process (all if None).
+        """
+        self._run(_re_estimate, self.num_resource_partitions, partitions)
+
+    def iter_results(self):
+        """
+        Iterate over the estimated partitions by resource.
+
+        :return: a generator of the partitions of the event log (pd.DataFrame indexed by the position of each event in the event log)
+        with the estimated start time, the resource availability time, and the enablement time for each activity instance.
+        """
+        for partition in range(self.num_resource_partitions):
+            result = _read_partition(os.path.join(self.path, _RESULTS), partition)
+            if result is not None:
+                yield result
+
+    def read_results(self) -> pd.DataFrame:
+        """
+        Read the whole estimated event log (when it fits in memory).
+
+        :return: the event log (indexed by the position of each event) with the estimated start time, the resource availability time,
+        and the enablement time for each activity instance.
+        """
+        return pd.concat(list(self.iter_results())).sort_index()
+
+    def _run(self, function, num_partitions: int, partitions: Optional[list]):
+        # Process the partitions (all if not given) in this process or in a pool of worker processes
+        arguments = [(self.path, partition) for partition in (partitions if partitions is not None else range(num_partitions))]
+        num_jobs = get_num_jobs(self.n_jobs)
+        if num_jobs > 1 and len(arguments) > 1:
+            run_in_workers(function, arguments, num_jobs)
+        else:
+            for path, partition in arguments:
+                function(path, partition)
+
+
+def _count_relations(path: str, partition: int):
+    # Count the directly-follows and length-2 loop relations of a partition by case
+    config = _load_configuration(path)
+    event_log = _read_partition(os.path.join(path, _CASE_PARTITIONS), partition)
+    if event_log is None:
+        activities, df_count, l2l_count = [], np.zeros((0, 0), dtype=np.int64), np.zeros((0, 0), dtype=np.int64)
+    else:
+        (activities, df_count, l2l_count) = _get_heuristics_counts(EventLogIndex(event_log, config.log_ids))
+    save_artifact(
+        os.path.join(path, _RELATION_COUNTS, str(partition)),
+        'RelationCounts',
+        {'activities': np.asarray(activities).tolist()},
+        {'df_count': df_count, 'l2l_count': l2l_count}
+    )
+
+
+def _discover_concurrency_oracle(path: str, config: Configuration, num_partitions: int) -> ConcurrencyOracle:
+    # Discover the concurrency oracle from the relations counted in each partition by case
+    if config.concurrency_oracle_type == ConcurrencyOracleType.DEACTIVATED:
+        return DeactivatedConcurrencyOracle(config)
+    # Add up the counts of the partitions (with the activities in order of appearance)
+    counts = [load_artifact(os.path.join(path, _RELATION_COUNTS, str(partition)), 'RelationCounts') for partition in range(num_partitions)]
+    activities = pd.unique(pd.Series([activity for header, _ in counts for activity in header['activities']], dtype=object))
+    activity_index = pd.Index(activities)
+    df_count = np.zeros((len(activities), len(activities)), dtype=np.int64)
+    l2l_count = np.zeros((len(activities), len(activities)), dtype=np.int64)
+    for header, arrays in counts:
+        codes = activity_index.get_indexer(header['activities'])
+        df_count[np.ix_(codes, codes)] += arrays['df_count']
+        l2l_count[np.ix_(codes, codes)] += arrays['l2l_count']
+    # Build the concurrency oracle from the counts
+    if config.concurrency_oracle_type == ConcurrencyOracleType.DF:
+        return DirectlyFollowsConcurrencyOracle(pd.DataFrame({config.log_ids.activity: activities}), config)
+    elif config.concurrency_oracle_type == ConcurrencyOracleType.ALPHA:
+        return AlphaConcurrencyOracle.from_counts(activities, df_count, config)
+    elif config.concurrency_oracle_type == ConcurrencyOracleType.HEURISTICS:
+        return HeuristicsConcurrencyOracle.from_counts(activities, df_count, l2l_count, config)
+    else:
+        raise ValueError("No concurrency oracle defined!")
+
+
+def _compute_enabled_times(path: str, partition: int):
+    # Compute the enabled times of a partition by case, and split it by resource
+    config = _load_configuration(path)
+    header, _ = load_artifact(path, 'PartitionedEstimation')
+    event_log = _read_partition(os.path.join(path, _CASE_PARTITIONS), partition)
+    if event_log is None:
+        return
+    if config.log_ids.enabled_time not in event_log.columns:
+        concurrency_oracle = ConcurrencyOracle.load(os.path.join(path, _CONCURRENCY_ORACLE))
+        concurrency_oracle.add_enabled_times(event_log, set_nat_to_first_event=True)
+    _write_partitions(
+        event_log,
+        event_log[config.log_ids.resource],
+        header['num_resource_partitions'],
+        os.path.join(path, _RESOURCE_PARTITIONS),
+        partition
+    )
+
+
+def _compute_available_times(path: str, partition: int):
+    # Compute the availability times of a partition by resource, the estimation before the re-estimation stages, and its durations
+    config = _load_configuration(path)
+    event_log = _read_partition(os.path.join(path, _RESOURCE_PARTITIONS), partition)
+    if event_log is None:
+        return
+    event_log = event_log.sort_index()
+    # Compute the availability times with the calendars of the resources of the partition (all their events are in it)
+    start_time_estimator = StartTimeEstimator(config=config)
+    start_time_estimator.event_log = event_log
+    start_time_estimator.log_index = EventLogIndex(event_log, config.log_ids)
+    if config.log_ids.available_time not in event_log.columns:
+        start_time_estimator._fit_resource_availability()
+    available_times = start_time_estimator._get_available_times(event_log, start_time_estimator.log_index)
+    enabled_times = to_nanoseconds(event_log[config.log_ids.enabled_time])
+    # Estimate the start times before the re-estimation stages
+    estimated_start_times = start_time_estimator._get_initial_start_times(start_time_estimator.log_index, available_times, enabled_times)
+    event_log[config.log_ids.available_time] = from_nanoseconds(available_times, event_log.index)
+    event_log[config.log_ids.estimated_start_time] = from_nanoseconds(estimated_start_times, event_log.index)
+    _write_partition(event_log, os.path.join(path, _INITIAL_ESTIMATIONS), partition)
+    # Store the activity and estimated duration of each event to compute the statistics
+    save_artifact(
+        os.path.join(path, _DURATIONS, str(partition)),
+        'Durations',
+        {'activities': np.asarray(start_time_estimator.log_index.activities).tolist()},
+        {
+            'positions': np.asarray(event_log.index, dtype=np.int64),
+            'activity_codes': start_time_estimator.log_index.activity_codes,
+            'durations': _get_durations(start_time_estimator.log_index.end_times, estimated_start_times)
+        }
+    )
+
+
+def _compute_duration_statistics(path: str, config: Configuration, num_partitions: int):
+    # Read the durations of all the partitions (with a global activity code)
+    durations = [
+        load_artifact(os.path.join(path, _DURATIONS, str(partition)), 'Durations')
+        for partition in range(num_partitions)
+        if os.path.isdir(os.path.join(path, _DURATIONS, str(partition)))
+    ]
+    activities = pd.unique(pd.Series([activity for header, _ in durations for activity in header['activities']], dtype=object))
+    activity_index = pd.Index(activities)
+    positions = np.concatenate([np.array([], dtype=np.int64)] + [arrays['positions'] for _, arrays in durations])
+    activity_codes = np.concatenate([np.array([], dtype=np.int64)] + [
+        np.append(activity_index.get_indexer(header['activities']), -1)[arrays['activity_codes']] for header, arrays in durations
+    ])
+    event_durations = np.concatenate([np.array([], dtype=np.int64)] + [arrays['durations'] for _, arrays in durations])
+    # Sort them in the order of the event log (to break the ties of the mode as with the whole event log)
+    order = np.argsort(positions, kind='stable')
+    activity_codes, event_durations = activity_codes[order], event_durations[order]
+    duration_statistics = ActivityDurationStatistics(activity_codes, event_durations, len(activities))
+    statistics = {}
+    if not math.isnan(config.outlier_threshold):
+        # Limit of the durations of each activity, updating the durations of the events over it
+        duration_limits = _get_duration_limits(
+            duration_statistics.get_statistic(StartTimeEstimator._get_statistic_name(config.outlier_statistic)),
+            config.outlier_threshold
+        )
+        event_duration_limits = np.append(duration_limits, NAT_NANOSECONDS)[activity_codes]
+        over_threshold = np.flatnonzero(
+            (event_duration_limits != NAT_NANOSECONDS) & (event_durations != NAT_NANOSECONDS) & (event_durations > event_duration_limits)
+        )
+        duration_statistics.update_durations(over_threshold, event_duration_limits[over_threshold])
+        statistics['duration_limits'] = duration_limits
+    if config.re_estimation_method != ReEstimationMethod.SET_INSTANT:
+        # Duration of each activity to re-estimate the non-estimated start times
+        statistics['re_estimation_durations'] = duration_statistics.get_statistic(
+            StartTimeEstimator._get_statistic_name(config.re_estimation_method)
+        )
+    save_artifact(os.path.join(path, _DURATION_STATISTICS), 'DurationStatistics', {'activities': activities.tolist()}, statistics)
+
+
+def _re_estimate(path: str, partition: int):
+    # Re-estimate the start times of a partition by resource with the statistics of the whole event log
+    config = _load_configuration(path)
+    event_log = _read_partition(os.path.join(path, _INITIAL_ESTIMATIONS), partition)
+    if event_log is None:
+        return
+    header, statistics = load_artifact(os.path.join(path, _DURATION_STATISTICS), 'DurationStatistics')
+    activity_codes = pd.Index(pd.Series(header['activities'], dtype=object)).get_indexer(event_log[config.log_ids.activity])
+    end_times = to_nanoseconds(event_log[config.log_ids.end_time])
+    estimated_start_times = to_nanoseconds(event_log[config.log_ids.estimated_start_time])
+    # Re-estimate start time of those events with an estimated duration over the threshold
+    if 'duration_limits' in statistics:
+        duration_limits = np.append(statistics['duration_limits'], NAT_NANOSECONDS)[activity_codes]
+        (estimated_start_times, _) = _clip_start_times(end_times, estimated_start_times, duration_limits)
+    # Fix start time of those events for which it could not be estimated (instant if SET_INSTANT, as there are no statistics)
+    if 're_estimation_durations' in statistics:
+        statistic_durations = np.append(statistics['re_estimation_durations'], NAT_NANOSECONDS)[activity_codes]
+    else:
+        statistic_durations = np.full(len(event_log), NAT_NANOSECONDS, dtype=np.int64)
+    estimated_start_times = _fill_start_times(end_times, estimated_start_times, statistic_durations)
+    event_log[config.log_ids.estimated_start_time] = from_nanoseconds(estimated_start_times, event_log.index)
+    # Sort the columns as in the estimation of the whole event log (with the new ones at the end)
+    header, _ = load_artifact(path, 'PartitionedEstimation')
+    new_columns = [config.log_ids.available_time, config.log_ids.enabled_time, config.log_ids.estimated_start_time]
+    event_log = event_log[header['columns'] + [column for column in new_columns if column not in header['columns']]]
+    _write_partition(event_log, os.path.join(path, _RESULTS), partition)
+
+
+def _load_configuration(path: str) -> Configuration:
+    # Configuration of the estimation stored in its directory
+    header, _ = load_artifact(path, 'PartitionedEstimation')
+    return configuration_from_dict(header['config'])
+
+
+def _get_partitions(keys: pd.Series, num_partitions: int) -> np.ndarray:
+    # Partition of each key (hash of its string ID, stable across processes)
+    return (pd.util.hash_pandas_object(keys.astype(str), index=False).values % np.uint64(num_partitions)).astype(np.int64)
+
+
+def _write_partitions(event_log: pd.DataFrame, keys: pd.Series, num_partitions: int, directory: str, part: int):
+    # Write the events of each partition (by the hash of their key) as a part of the partition
+    partitions = _get_partitions(keys, num_partitions)
+    for partition in np.unique(partitions):
+        os.makedirs(os.path.join(directory, str(partition)), exist_ok=True)
+        event_log[partitions == partition].to_pickle(os.path.join(directory, str(partition), "{:06d}.pkl".format(part)))
+
+
+def _write_partition(event_log: pd.DataFrame, directory: str, partition: int):
+    # Write a whole partition as a single part
+    os.makedirs(os.path.join(directory, str(partition)), exist_ok=True)
+    event_log.to_pickle(os.path.join(directory, str(partition), "{:06d}.pkl".format(0)))
+
+
+def _read_partition(directory: str, partition: int) -> Optional[pd.DataFrame]:
+    # Read the parts of a partition (in order), or None if it has no events
+    partition_path = os.path.join(directory, str(partition))
+    if not os.path.isdir(partition_path):
+        return None
+    parts = sorted(name for name in os.listdir(partition_path) if name.endswith('.pkl'))
+    if len(parts) == 0:
+        return None
+    return pd.concat([pd.read_pickle(os.path.join(partition_path, name)) for name in parts])
+
+
+def _get_pending_partitions(directory: str, num_partitions: int) -> list:
+    # Partitions for which the artifact of the step has not been (completely) saved
+    return [partition for partition in range(num_partitions) if not artifact_exists(os.path.join(directory, str(partition)))]
@@ -0,0 +1,65 @@
+import json
+import os
+
+import numpy as np
+
+# Version of the format of the persisted artifacts, increased with each incompatible change
+ARTIFACT_FORMAT_VERSION = 1
+# Name of the file with the header of an artifact
+_HEADER_FILE_NAME = 'header.json'
+
+
+def save_artifact(path: str, kind: str, header: dict, arrays: dict):
+    """
+    Persist an artifact (e.g. a concurrency oracle or a resource calendar index) as a directory with a JSON header and one .npy file per
+    array, so the arrays can be loaded memory-mapped.
+
+    :param path:    path of the directory to store the artifact in (created if it does not exist).
+    :param kind:    type of the artifact (e.g. 'ConcurrencyOracle'), checked when loading it.
+    :param header:  JSON-serializable dictionary with the metadata of the artifact (e.g. its configuration).
+    :param arrays:  dictionary with the name of each array as key, and the array (np.ndarray) as value.
+    """
+    os.makedirs(path, exist_ok=True)
+    # Write the arrays
+    for name, array in arrays.items():
+        np.save(os.path.join(path, "{}.npy".format(name)), np.ascontiguousarray(array), allow_pickle=False)
+    # Write the header (last, so an artifact with header is complete)
+    with open(os.path.join(path, _HEADER_FILE_NAME), 'w') as header_file:
+        json.dump({'format_version': ARTIFACT_FORMAT_VERSION, 'kind': kind, 'arrays': list(arrays), **header}, header_file)
+
+
+def artifact_exists(path: str) -> bool:
+    """
+    Check if an artifact has been completely persisted (with [save_artifact]) in a directory.
+
+    :param path: path of the directory of the artifact.
+
+    :return: True if the directory has the header of an artifact (written last), False otherwise.
+    """
+    return os.path.isfile(os.path.join(path, _HEADER_FILE_NAME))
+
+
+def load_artifact(path: str, kind: str, mmap: bool = True) -> (dict, dict):
+    """
+    Load an artifact persisted with [save_artifact].
+
+    :param path:    path of the directory the artifact is stored in.
+    :param kind:    expected type of the artifact.
+    :param mmap:    if True, memory-map the arrays (read-only) instead of reading them into memory.
+
+    :return: a tuple with the header and the arrays of the artifact.
+    """
+    with open(os.path.join(path, _HEADER_FILE_NAME)) as header_file:
+        header = json.load(header_file)
+    # Check the artifact can be read
+    if header.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        raise ValueError("Unsupported artifact format version {} (expected {})!".format(header.get('format_version'),
+                                                                                      ARTIFACT_FORMAT_VERSION))
+    if header.get('kind') != kind:
+        raise ValueError("The artifact in '{}' is a {}, not a {}!".format(path, header.get('kind'), kind))
+    # Read the arrays
+    arrays = {
+        name: np.load(os.path.join(path, "{}.npy".format(name)), mmap_mode='r' if mmap else None, allow_pickle=False)
+        for name in header['arrays']
+    }
+    return header, arrays
@@ -1,19 +1,217 @@
+import copy
+import os
+from collections.abc import Mapping
 from datetime import datetime
+from typing import Optional
 
+import numpy as np
 import pandas as pd
 
-from estimate_start_times.config import Configuration
+from estimate_start_times.config import Configuration, configuration_to_dict, configuration_from_dict
+from estimate_start_times.event_log_index import EventLogIndex
+from estimate_start_times.parallel import SharedArrays, get_num_jobs, split_groups, run_in_workers
+from estimate_start_times.persistence import save_artifact, load_artifact
+from estimate_start_times.utils import to_nanoseconds, from_nanoseconds, NAT_NANOSECONDS
+
+
+class ResourceCalendarIndex(Mapping):
+    """
+    Calendars of a set of resources stored in a single buffer with the end times (UTC nanoseconds since epoch) of the events of all the
+    resources, sorted by resource and end time, and the offset where the calendar of each resource starts. Indexing it by resource
+    returns a view (sorted np.ndarray of int64) of the buffer with the end times of the events of that resource.
+    """
+
+    def __init__(self, resources: list, end_times: np.ndarray, offsets: np.ndarray):
+        # List with the ID of each resource
+        self.resources = list(resources)
+        # Position of each resource in the index
+        self.resource_positions = {resource: position for position, resource in enumerate(self.resources)}
+        # Buffer with the end times of all the resources
+        self.end_times = end_times
+        # Offsets of the calendars in the buffer: calendar of resources[i] in end_times[offsets[i]:offsets[i + 1]]
+        self.offsets = offsets
+
+    @staticmethod
+    def from_event_log(event_log: pd.DataFrame, config: Configuration, log_index: Optional[EventLogIndex] = None):
+        """
+        Build the calendars of the resources of an event log (except the bot resources) reusing the grouping by resource of its index.
+        The resources are identified by their string ID, so the events of non-string resources (e.g. int 5) are in the calendar of their
+        string ID ('5').
+
+        :param event_log:   event log to build the calendars from.
+        :param config:      configuration with the log IDs and the bot resources.
+        :param log_index:   index of [event_log] to reuse (built from [event_log] if not given).
+
+        :return: a ResourceCalendarIndex with the end times of the events of each resource.
+        """
+        if log_index is None:
+            log_index = EventLogIndex(event_log, config.log_ids)
+        # Events sorted by resource (string ID) and end time (the ones with no resource, code -1, are not grouped)
+        resource_codes = log_index.resource_codes[log_index.resource_order]
+        end_times = log_index.end_times[log_index.resource_order]
+        # Discard the events of the bot resources and the ones with no end time
+        non_bot = np.array([resource not in config.bot_resources for resource in log_index.resources], dtype=bool)
+        kept = non_bot[resource_codes] & (end_times != NAT_NANOSECONDS)
+        resource_codes = (np.cumsum(non_bot) - 1)[resource_codes[kept]]
+        end_times = end_times[kept]
+        # Get where the calendar of each resource starts
+        offsets = np.searchsorted(resource_codes, np.arange(np.sum(non_bot) + 1))
+        return ResourceCalendarIndex(log_index.resources[non_bot], end_times, offsets)
+
+    @staticmethod
+    def from_calendars(resources_calendar: dict):
+        """
+        Build the index from a dictionary with the resources as key and the end times of all their events as value.
+
+        :param resources_calendar: dictionary with the resources as key and the end times of all their events (pd.Series) as value.
+
+        :return: a ResourceCalendarIndex with the end times of the events of each resource.
+        """
+        calendars = []
+        for resource_calendar in resources_calendar.values():
+            end_times = np.sort(to_nanoseconds(resource_calendar))
+            calendars += [end_times[end_times != NAT_NANOSECONDS]]
+        offsets = np.concatenate([[0], np.cumsum([len(calendar) for calendar in calendars], dtype=np.int64)])
+        end_times = np.concatenate(calendars) if len(calendars) > 0 else np.array([], dtype=np.int64)
+        return ResourceCalendarIndex(list(resources_calendar.keys()), end_times, offsets)
+
+    def merge(self, other):
+        """
+        Build the index with the calendars of this index extended with the ones of [other], inserting the end times of [other] in the
+        calendars of their resources (and adding the calendars of the resources not in this index).
+
+        :param other: ResourceCalendarIndex with the calendars to add.
+
+        :return: a new ResourceCalendarIndex with the end times of both indexes.
+        """
+        # Position of the resources of [other] in the merged index (the new ones at the end)
+        resources = list(self.resources) + [resource for resource in other.resources if resource not in self.resource_positions]
+        resource_positions = {resource: position for position, resource in enumerate(resources)}
+        other_positions = np.array([resource_positions[resource] for resource in other.resources], dtype=np.int64)
+        # Pad the offsets of this index with the (empty) calendars of the new resources
+        offsets = np.concatenate([self.offsets, np.full(len(resources) - len(self.resources), self.offsets[-1])])
+        # Position of each end time of [other] in the buffer of this index, keeping each calendar sorted
+        insert_positions = np.empty(len(other.end_times), dtype=np.int64)
+        for other_position, position in enumerate(other_positions):
+            start, end = other.offsets[other_position], other.offsets[other_position + 1]
+            calendar = self.end_times[offsets[position]:offsets[position + 1]]
+            insert_positions[start:end] = offsets[position] + np.searchsorted(calendar, other.end_times[start:end], side='right')
+        # Insert them and shift the offsets with the number of end times inserted before each calendar
+        end_times = np.insert(self.end_times, insert_positions, other.end_times)
+        num_inserted = np.zeros(len(resources), dtype=np.int64)
+        num_inserted[other_positions] = np.diff(other.offsets)
+        offsets = offsets + np.concatenate([[0], np.cumsum(num_inserted)])
+        return ResourceCalendarIndex(resources, end_times, offsets)
+
+    def save(self, path: str):
+        """
+        Persist the calendars as a directory with a JSON header (with the resource vocabulary) and the buffer with the end times and
+        the offsets as .npy files.
+
+        :param path: path of the directory to store the calendars in.
+        """
+        save_artifact(
+            path,
+            'ResourceCalendarIndex',
+            {'resources': list(self.resources)},
+            {'end_times': self.end_times, 'offsets': self.offsets}
+        )
+
+    @staticmethod
+    def load(path: str, mmap: bool = True):
+        """
+        Load calendars persisted with [save].
+
+        :param path: path of the directory the calendars are stored in.
+        :param mmap: if True, memory-map the buffer with the end times instead of reading it into memory.
+
+        :return: the ResourceCalendarIndex with the persisted calendars.
+        """
+        header, arrays = load_artifact(path, 'ResourceCalendarIndex', mmap)
+        return ResourceCalendarIndex(header['resources'], arrays['end_times'], np.asarray(arrays['offsets']))
+
+    def __getitem__(self, resource) -> np.ndarray:
+        position = self.resource_positions[resource]
+        return self.end_times[self.offsets[position]:self.offsets[position + 1]]
+
+    def __iter__(self):
+        return iter(self.resources)
+
+    def __len__(self) -> int:
+        return len(self.resources)
 
 
 class ResourceAvailability:
-    def __init__(self, resources_calendar: dict, config: Configuration):
-        # Store dictionary with the resources as key and all its events as value
-        self.resources_calendar = resources_calendar
+    def __init__(self, resources_calendar, config: Configuration):
+        # Store index with the resources as key and all its events as value
+        if isinstance(resources_calendar, ResourceCalendarIndex):
+            self.resources_calendar = resources_calendar
+        else:
+            self.resources_calendar = ResourceCalendarIndex.from_calendars(resources_calendar)
         # Configuration parameters
         self.config = config
         # Set log IDs to ease access within class
         self.log_ids = config.log_ids
 
+    def save(self, path: str):
+        """
+        Persist the resource availability (its configuration and resource calendars) as a directory with a JSON header and the .npy
+        files of the calendars.
+
+        :param path: path of the directory to store the resource availability in.
+        """
+        self.resources_calendar.save(os.path.join(path, 'calendars'))
+        save_artifact(
+            path,
+            'ResourceAvailability',
+            {'availability_type': type(self).__name__, 'config': configuration_to_dict(self.config)},
+            {}
+        )
+
+    @staticmethod
+    def load(path: str, mmap: bool = True):
+        """
+        Load a resource availability persisted with [save], without rebuilding its resource calendars.
+
+        :param path: path of the directory the resource availability is stored in.
+        :param mmap: if True, memory-map the buffer with the end times of the calendars instead of reading it into memory.
+
+        :return: the resource availability, instance of the same class as the persisted one.
+        """
+        header, _ = load_artifact(path, 'ResourceAvailability', mmap)
+        availability_type = SimpleResourceAvailability if header['availability_type'] == SimpleResourceAvailability.__name__ \
+            else ResourceAvailability
+        resource_availability = availability_type.__new__(availability_type)
+        ResourceAvailability.__init__(
+            resource_availability,
+            ResourceCalendarIndex.load(os.path.join(path, 'calendars'), mmap),
+            configuration_from_dict(header['config'])
+        )
+        return resource_availability
+
+    def add_events(self, event_log: pd.DataFrame, log_index: Optional[EventLogIndex] = None):
+        """
+        Add the events of an event log (except the ones of bot resources) to the calendars of their resources.
+
+        :param event_log: event log with the events to add.
+        :param log_index: index of [event_log] to reuse (built from [event_log] if not given).
+        """
+        self.resources_calendar = self.resources_calendar.merge(ResourceCalendarIndex.from_event_log(event_log, self.config, log_index))
+
+    def with_events(self, event_log: pd.DataFrame, log_index: Optional[EventLogIndex] = None):
+        """
+        Build a copy of this resource availability with the events of an event log (except the ones of bot resources) added to the
+        calendars of their resources, without modifying this one.
+
+        :param event_log: event log with the events to add.
+        :param log_index: index of [event_log] to reuse (built from [event_log] if not given).
+
+        :return: the new resource availability (instance of the same class) with the extended calendars.
+        """
+        resource_availability = copy.copy(self)
+        resource_availability.add_events(event_log, log_index)
+        return resource_availability
+
     def available_since(self, resource: str, event) -> datetime:
         if resource == self.config.missing_resource:
             # If the resource is missing return pd.NaT
@@ -23,43 +221,162 @@ class ResourceAvailability:
             timestamp_previous_event = event[self.log_ids.end_time]
         else:
             # If not, take the first timestamp previous to [timestamp]
-            resource=str(resource)
-            resource_calendar = self.resources_calendar[resource]
-            timestamp_previous_event = resource_calendar.where(
-                (resource_calendar < event[self.log_ids.end_time]) &
-                ((not self.config.consider_start_times) or (resource_calendar <= event[self.log_ids.start_time]))
-            ).max()
-            if pd.isna(timestamp_previous_event):
-                timestamp_previous_event = pd.NaT
+            end_time = pd.to_datetime(event[self.log_ids.end_time], utc=True).value
+            start_time = pd.to_datetime(event[self.log_ids.start_time], utc=True).value \
+                if self.config.consider_start_times else None
+            timestamp_previous_event = self._previous_end_times(
+                str(resource),
+                np.array([end_time], dtype=np.int64),
+                None if start_time is None else np.array([start_time], dtype=np.int64)
+            )[0]
+            timestamp_previous_event = pd.NaT if timestamp_previous_event == NAT_NANOSECONDS \
+                else pd.Timestamp(timestamp_previous_event, tz='UTC')
         return timestamp_previous_event
 
-    def add_resource_availability_times(self, event_log: pd.DataFrame):
+    def add_resource_availability_times(
+            self,
+            event_log: pd.DataFrame,
+            log_index: Optional[EventLogIndex] = None,
+            n_jobs: Optional[int] = 1
+    ):
         """
         Add the resource availability time of each activity instance to the received event log. For the first event of each resource, set
         pd.NaT.
 
         :param event_log: event log to add the resource availability time information to.
+        :param log_index: index of [event_log] to reuse (built from [event_log] if not given).
+        :param n_jobs:    number of worker processes to compute the availability times in parallel (1 to compute them in this process,
+                          -1 to use all the CPUs).
+        """
+        resource_availability_times = self.get_resource_availability_times(event_log, log_index, n_jobs)
+        # Set all availability times at once
+        event_log[self.log_ids.available_time] = from_nanoseconds(resource_availability_times, event_log.index)
+
+    def get_resource_availability_times(
+            self,
+            event_log: pd.DataFrame,
+            log_index: Optional[EventLogIndex] = None,
+            n_jobs: Optional[int] = 1
+    ) -> np.ndarray:
         """
-        # For each trace in the log, estimate the enabled time of its events
-        indexes = []
-        resource_availability_times = []
-        for (case_id, trace) in event_log.groupby([self.log_ids.case]):
-            # Get the resource availability times
-            for index, event in trace.iterrows():
-                indexes += [index]
-                resource_availability_time = self.available_since(event[self.log_ids.resource], event)
-                resource_availability_times += [resource_availability_time]
-        # Set all enabled times at once
-        event_log.loc[indexes, self.log_ids.available_time] = resource_availability_times
-        event_log[self.log_ids.available_time] = pd.to_datetime(event_log[self.log_ids.available_time], utc=True)
+        Compute the resource availability time of each activity instance of the received event log (without modifying it). For the
+        first event of each resource, set pd.NaT.
+
+        :param event_log: event log to compute the resource availability times of.
+        :param log_index: index of [event_log] to reuse (built from [event_log] if not given).
+        :param n_jobs:    number of worker processes to compute the availability times in parallel (1 to compute them in this process,
+                          -1 to use all the CPUs). The events, sorted by resource, are split in shards with the same number of events
+                          (splitting the events of a resource with many events between several workers), and the result is the same as
+                          computing them in this process.
+
+        :return: an array with the availability time of each event as UTC nanoseconds since epoch (int64), with NaT as NAT_NANOSECONDS.
+        """
+        if log_index is None:
+            log_index = EventLogIndex(event_log, self.log_ids)
+        end_times = log_index.end_times
+        start_times = log_index.start_times if self.config.consider_start_times else None
+        # If the resource is missing set pd.NaT (also to the events with no resource, code -1, as they are not grouped by resource)
+        resource_availability_times = np.full(len(log_index), NAT_NANOSECONDS, dtype=np.int64)
+        missing = np.array([resource == self.config.missing_resource for resource in log_index.resources], dtype=bool)
+        # If the resource has been marked as 'bot resource', set the same timestamp
+        bots = np.array([resource in self.config.bot_resources for resource in log_index.resources], dtype=bool) & ~missing
+        for resource_code in np.flatnonzero(bots):
+            indexes = log_index.resource_order[log_index.resource_offsets[resource_code]:log_index.resource_offsets[resource_code + 1]]
+            resource_availability_times[indexes] = end_times[indexes]
+        # If not, search, for the events of each resource (sorted by resource), the previous end time in the calendar of the resource
+        order = log_index.resource_order[~(missing | bots)[log_index.resource_codes[log_index.resource_order]]]
+        if len(order) == 0:
+            return resource_availability_times
+        calendar_positions = np.array([
+            self.resources_calendar.resource_positions[resource] if not (is_missing or is_bot) else -1
+            for resource, is_missing, is_bot in zip(log_index.resources, missing, bots)
+        ], dtype=np.int64)
+        sorted_arrays = {
+            'calendars': calendar_positions[log_index.resource_codes[order]],
+            'ends': end_times[order],
+            'calendar_end_times': self.resources_calendar.end_times,
+            'calendar_offsets': self.resources_calendar.offsets
+        }
+        if start_times is not None:
+            sorted_arrays['starts'] = start_times[order]
+        # Any event can start a shard, so the events of a resource with many events are split between several workers
+        shards = split_groups(np.arange(len(order) + 1), get_num_jobs(n_jobs))
+        if len(shards) <= 1:
+            resource_availability_times[order] = _compute_sorted_previous_end_times(
+                sorted_arrays['calendars'],
+                sorted_arrays['ends'],
+                sorted_arrays.get('starts'),
+                sorted_arrays['calendar_end_times'],
+                sorted_arrays['calendar_offsets']
+            )
+        else:
+            # Compute the availability times of each shard in a worker process, sharing the arrays through shared memory
+            sorted_arrays['available_times'] = np.empty(len(order), dtype=np.int64)
+            with SharedArrays.create(sorted_arrays) as shared_arrays:
+                run_in_workers(
+                    _compute_shard_previous_end_times,
+                    [(shared_arrays.specs, start, end) for start, end in shards],
+                    len(shards)
+                )
+                resource_availability_times[order] = shared_arrays['available_times']
+        return resource_availability_times
+
+    def _previous_end_times(self, resource: str, end_times: np.ndarray, start_times: np.ndarray = None) -> np.ndarray:
+        # Binary search, in the calendar of the resource, the last end time previous to each end time
+        return _previous_end_times_in_calendar(self.resources_calendar[resource], end_times, start_times)
+
+
+def _compute_shard_previous_end_times(specs: dict, shard_start: int, shard_end: int):
+    # Compute (in a worker process) the availability times of the events from [shard_start] to [shard_end] of the sorted log in shared
+    # memory
+    with SharedArrays.attach(specs) as shared_arrays:
+        shared_arrays['available_times'][shard_start:shard_end] = _compute_sorted_previous_end_times(
+            shared_arrays['calendars'][shard_start:shard_end],
+            shared_arrays['ends'][shard_start:shard_end],
+            shared_arrays['starts'][shard_start:shard_end] if 'starts' in shared_arrays else None,
+            shared_arrays['calendar_end_times'],
+            shared_arrays['calendar_offsets']
+        )
+
+
+def _compute_sorted_previous_end_times(
+        calendars: np.ndarray,
+        end_times: np.ndarray,
+        start_times: Optional[np.ndarray],
+        calendar_end_times: np.ndarray,
+        calendar_offsets: np.ndarray
+) -> np.ndarray:
+    # Previous end time of each event of a log sorted by resource (with the position of the calendar of its resource in [calendars]),
+    # searching the events of each resource at once
+    previous_end_times = np.empty(len(end_times), dtype=np.int64)
+    run_bounds = np.concatenate([[0], np.flatnonzero(calendars[1:] != calendars[:-1]) + 1, [len(calendars)]])
+    for run_start, run_end in zip(run_bounds[:-1], run_bounds[1:]):
+        calendar = calendars[run_start]
+        previous_end_times[run_start:run_end] = _previous_end_times_in_calendar(
+            calendar_end_times[calendar_offsets[calendar]:calendar_offsets[calendar + 1]],
+            end_times[run_start:run_end],
+            None if start_times is None else start_times[run_start:run_end]
+        )
+    return previous_end_times
+
+
+def _previous_end_times_in_calendar(resource_calendar: np.ndarray, end_times: np.ndarray, start_times: np.ndarray = None) -> np.ndarray:
+    # Binary search, in the calendar of a resource, the last end time previous to each end time
+    num_previous = np.searchsorted(resource_calendar, end_times, side='left')
+    if start_times is not None:
+        # Consider only the end times not after the start time (none if the start time is missing)
+        num_previous = np.minimum(num_previous, np.searchsorted(resource_calendar, start_times, side='right'))
+        num_previous[start_times == NAT_NANOSECONDS] = 0
+    return np.where(
+        num_previous > 0,
+        resource_calendar[np.maximum(num_previous - 1, 0)] if len(resource_calendar) > 0 else NAT_NANOSECONDS,
+        NAT_NANOSECONDS
+    )
 
 
 class SimpleResourceAvailability(ResourceAvailability):
-    def __init__(self, event_log: pd.DataFrame, config: Configuration):
-        # Create a dictionary with the resources as key and all its events as value
-        resources = {str(i) for i in event_log[config.log_ids.resource].unique()}
-        resources_calendar = {}
-        for resource in (resources - config.bot_resources):
-            resources_calendar[resource] = event_log[event_log[config.log_ids.resource] == resource][config.log_ids.end_time]
+    def __init__(self, event_log: pd.DataFrame, config: Configuration, log_index: Optional[EventLogIndex] = None):
+        # Create an index with the resources as key and all its events as value
+        resources_calendar = ResourceCalendarIndex.from_event_log(event_log, config, log_index)
         # Super
         super(SimpleResourceAvailability, self).__init__(resources_calendar, config)
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from estimate_start_times.config import Configuration, EstimationOutput, configuration_to_dict
+from estimate_start_times.estimator import StartTimeEstimator, build_estimation_output
+from estimate_start_times.persistence import save_artifact, load_artifact, ARTIFACT_FORMAT_VERSION
+from estimate_start_times.utils import to_nanoseconds
+
+
+class EstimationResultCache:
+    """
+    On-disk cache of estimation results, keyed by the fingerprint of the columns of the event log used in the estimation and the
+    canonical form of the configuration. Each entry stores the new columns of the estimation (as .npy arrays), and the least recently
+    used entries are evicted when the total size of the cache goes over its limit.
+    """
+
+    def __init__(self, path: str, max_size: int = 2 ** 30):
+        """
+        :param path:        path of the directory to store the cache entries in (created if it does not exist).
+        :param max_size:    maximum size (in bytes) of the cache.
+        """
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    def estimate(
+            self,
+            event_log: pd.DataFrame,
+            config: Configuration,
+            replace_recorded_start_times: bool = False,
+            output: EstimationOutput = EstimationOutput.COPY
+    ):
+        """
+        Estimate the start times of an event log (see StartTimeEstimator.estimate), loading the result from the cache if the same event
+        log has already been estimated with the same configuration, and storing it in the cache otherwise.
+
+        :param event_log:                       event log to estimate the start times of.
+        :param config:                          configuration of the estimation.
+        :param replace_recorded_start_times:    If 'true', replace the start time column with the estimated start
+                                                times, if 'false', the estimation is placed in its own column.
+        :param output:                          form of the result (see EstimationOutput).
+
+        :return: The event log (or only the new columns of it, depending on [output]) with the estimated start time, the resource
+        availability time, and the enablement time for each activity instance.
+        """
+        key = self.get_key(event_log, config, replace_recorded_start_times)
+        new_columns = self.get(key)
+        if new_columns is None:
+            # Not in the cache, estimate and store the new columns
+            new_columns = StartTimeEstimator(event_log, config).estimate(replace_recorded_start_times, EstimationOutput.ARRAYS)
+            self.put(key, new_columns)
+        return build_estimation_output(event_log, config.log_ids, new_columns, replace_recorded_start_times, output)
+
+    @staticmethod
+    def get_key(event_log: pd.DataFrame, config: Configuration, replace_recorded_start_times: bool = False) -> str:
+        """
+        Compute the key of the estimation of an event log with a configuration: a hash of the index of the event log, the values of the
+        columns used in the estimation, and the canonical serialization of the configuration.
+
+        :param event_log:                       event log to estimate.
+        :param config:                          configuration of the estimation.
+        :param replace_recorded_start_times:    whether the estimation replaces the recorded start times or not.
+
+        :return: a hexadecimal string identifying the estimation.
+        """
+        log_ids = config.log_ids
+        key = hashlib.sha256()
+        key.update(json.dumps({
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'config': configuration_to_dict(config),
+            'replace_recorded_start_times': replace_recorded_start_times
+        }, sort_keys=True, default=str).encode())
+        # Fingerprint of the index and the identifier columns
+        key.update(pd.util.hash_pandas_object(event_log.index).values.tobytes())
+        for column in [log_ids.case, log_ids.activity, log_ids.resource]:
+            if column in event_log:
+                key.update(column.encode())
+                key.update(pd.util.hash_pandas_object(event_log[column], index=False).values.tobytes())
+        # Fingerprint of the timestamp columns (including the enabled and available times, if already computed)
+        for column in [log_ids.start_time, log_ids.end_time, log_ids.enabled_time, log_ids.available_time]:
+            if column in event_log:
+                key.update(column.encode())
+                key.update(to_nanoseconds(event_log[column]).tobytes())
+        return key.hexdigest()
+
+    def get(self, key: str):
+        """
+        Load the new columns of the estimation with key [key] from the cache, marking it as recently used.
+
+        :param key: key of the estimation.
+
+        :return: a dictionary with the name of each new column as key and its values (np.ndarray of UTC datetime64[ns]) as value, or
+        None if the estimation is not in the cache.
+        """
+        entry_path = os.path.join(self.path, key)
+        if not os.path.isdir(entry_path):
+            return None
+        try:
+            header, arrays = load_artifact(entry_path, 'EstimationResult')
+        except (OSError, ValueError):
+            # Incomplete or incompatible entry
+            return None
+        # Mark the entry as recently used
+        os.utime(entry_path)
+        return {column: np.asarray(arrays[name]).view('datetime64[ns]') for column, name in zip(header['columns'], arrays)}
+
+    def put(self, key: str, new_columns: dict) -> bool:
+        """
+        Store the new columns of the estimation with key [key] in the cache, evicting the least recently used entries (other than this
+        one) if the cache goes over its maximum size. Estimations larger than the maximum size of the cache are not stored.
+
+        :param key:         key of the estimation.
+        :param new_columns: dictionary with the name of each new column as key and its values (np.ndarray of datetime64[ns]) as value.
+
+        :return: True if the estimation has been stored, False if it is larger than the maximum size of the cache.
+        """
+        arrays = {
+            "column_{}".format(position): np.asarray(values, dtype='datetime64[ns]').view(np.int64)
+            for position, values in enumerate(new_columns.values())
+        }
+        if sum(array.nbytes for array in arrays.values()) > self.max_size:
+            # It would not fit even with the cache empty
+            return False
+        # Write the entry in a temporary directory and move it to its place, so partial entries are never read
+        temporary_path = tempfile.mkdtemp(dir=self.path, prefix='.tmp-')
+        save_artifact(temporary_path, 'EstimationResult', {'columns': list(new_columns)}, arrays)
+        try:
+            os.rename(temporary_path, os.path.join(self.path, key))
+        except OSError:
+            # Already stored (e.g. by another process)
+            shutil.rmtree(temporary_path, ignore_errors=True)
+        self._evict(key)
+        return True
+
+    def _evict(self, kept_key: str):
+        # Get the entries (except the one just stored) with their size and last use
+        entries, total_size = [], 0
+        for name in os.listdir(self.path):
+            entry_path = os.path.join(self.path, name)
+            if not name.startswith('.tmp-') and os.path.isdir(entry_path):
+                size = sum(entry.stat().st_size for entry in os.scandir(entry_path) if entry.is_file())
+                total_size += size
+                if name != kept_key:
+                    entries += [(os.stat(entry_path).st_mtime, size, entry_path)]
+        # Remove the least recently used ones until the cache fits in its maximum size
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total_size -= size
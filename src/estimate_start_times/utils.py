@@ -1,7 +1,20 @@
+import importlib
 import itertools
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import asdict
+from typing import Optional
 
+import numpy as np
 import pandas as pd
 
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
 
 def zip_with_next(iterable):
     # s -> (s0,s1), (s1,s2), (s2, s3), ...
@@ -10,22 +23,462 @@ def zip_with_next(iterable):
     return zip(a, b)
 
 
-def read_csv_log(log_path, config, sort_by_end_time=True) -> pd.DataFrame:
+def read_csv_log(
+        log_path,
+        config,
+        sort_by_end_time=True,
+        only_log_ids: bool = False,
+        categorical_ids: bool = False,
+        timestamp_format: Optional[str] = None,
+        report: Optional[dict] = None
+) -> pd.DataFrame:
+    """
+    Read an event log from a CSV file, parsing its timestamps as UTC datetimes and filling the missing resources.
+
+    :param log_path:            path to the CSV file (can be compressed).
+    :param config:              configuration with the IDs of the columns and the value for missing resources.
+    :param sort_by_end_time:    sort the event log by end time (warning this might alter the order of the events sharing end time).
+    :param only_log_ids:        if True, read only the columns of the event log IDs (case, activity, resource, timestamps...).
+    :param categorical_ids:     if True, read the activity and resource columns as categorical (pd.Categorical).
+    :param timestamp_format:    format of the timestamps (strftime directives). If None, ISO-8601 timestamps (with or without UTC offset)
+                                are parsed with a vectorized parser, and the format of other timestamps is guessed from the first one.
+    :param report:              if given, dictionary to fill with the time (in seconds) spent in each step ('read', 'timestamps', and
+                                'sort'), and the parser used for each timestamp column ('timestamp_parsers').
+
+    :return: the event log (pd.DataFrame).
+    """
+    report = report if report is not None else {}
+    log_ids = config.log_ids
     # Read log
-    event_log = pd.read_csv(log_path)
+    step_start = time.perf_counter()
+    event_log = pd.read_csv(
+        log_path,
+        usecols=(lambda column: column in set(asdict(log_ids).values())) if only_log_ids else None,
+        dtype={log_ids.activity: 'category', log_ids.resource: 'category'} if categorical_ids else None
+    )
     # Set case id as object
-    event_log = event_log.astype({config.log_ids.case: object})
+    event_log = event_log.astype({log_ids.case: object})
     # Fix missing resources
-    if config.log_ids.resource not in event_log.columns:
-        event_log[config.log_ids.resource] = config.missing_resource
+    if log_ids.resource not in event_log.columns:
+        event_log[log_ids.resource] = config.missing_resource
+        if categorical_ids:
+            event_log[log_ids.resource] = event_log[log_ids.resource].astype('category')
+    elif categorical_ids:
+        resources = event_log[log_ids.resource]
+        if resources.isna().any():
+            if config.missing_resource not in resources.cat.categories:
+                resources = resources.cat.add_categories([config.missing_resource])
+            event_log[log_ids.resource] = resources.fillna(config.missing_resource)
     else:
-        event_log[config.log_ids.resource].fillna(config.missing_resource, inplace=True)
+        event_log[log_ids.resource].fillna(config.missing_resource, inplace=True)
+    report['read'] = time.perf_counter() - step_start
     # Convert timestamp value to datetime
-    event_log[config.log_ids.end_time] = pd.to_datetime(event_log[config.log_ids.end_time], utc=True)
-    if config.log_ids.start_time in event_log.columns:
-        event_log[config.log_ids.start_time] = pd.to_datetime(event_log[config.log_ids.start_time], utc=True)
+    step_start = time.perf_counter()
+    report['timestamp_parsers'] = {}
+    for column in [log_ids.end_time, log_ids.start_time]:
+        if column in event_log.columns:
+            (event_log[column], report['timestamp_parsers'][column]) = _parse_timestamps(event_log[column], timestamp_format)
+    report['timestamps'] = time.perf_counter() - step_start
     # Sort by end time
+    step_start = time.perf_counter()
     if sort_by_end_time:
-        event_log = event_log.sort_values(config.log_ids.end_time)
+        event_log = event_log.sort_values(log_ids.end_time)
+    report['sort'] = time.perf_counter() - step_start
     # Return parsed event log
     return event_log
+
+
+def _parse_timestamps(timestamps: pd.Series, timestamp_format: Optional[str]) -> (pd.Series, str):
+    # Parse the timestamps as UTC datetimes, returning them and the parser used
+    if timestamp_format is not None:
+        return pd.to_datetime(timestamps, format=timestamp_format, utc=True), timestamp_format
+    # Vectorized parse of ISO-8601 timestamps
+    nanoseconds = _parse_iso8601_timestamps(timestamps)
+    if nanoseconds is not None:
+        return from_nanoseconds(nanoseconds, timestamps.index), 'ISO-8601'
+    # Guess the format from the first timestamp, parsing them element by element if they do not follow it
+    first_timestamps = timestamps.dropna().head(1)
+    if len(first_timestamps) > 0 and isinstance(first_timestamps.iloc[0], str):
+        guessed_format = guess_datetime_format(first_timestamps.iloc[0])
+        if guessed_format is not None:
+            try:
+                return pd.to_datetime(timestamps, format=guessed_format, utc=True), guessed_format
+            except (ValueError, TypeError):
+                pass
+    return pd.to_datetime(timestamps, utc=True), 'inferred'
+
+
+def _parse_iso8601_timestamps(timestamps: pd.Series) -> Optional[np.ndarray]:
+    # Parse timestamps in the form 'YYYY-MM-DD[ T]HH:MM:SS[.f*][Z|+HH:MM|-HH:MM]' (UTC if no offset) as UTC nanoseconds since epoch
+    # (NAT_NANOSECONDS if missing), or None if any of them is not in that form
+    if timestamps.dtype != object:
+        return None
+    present = timestamps.notna().values
+    nanoseconds = np.full(len(timestamps), NAT_NANOSECONDS, dtype=np.int64)
+    if not present.any():
+        return nanoseconds
+    try:
+        encoded = np.array(timestamps.values[present], dtype=bytes)
+    except (UnicodeEncodeError, ValueError, TypeError):
+        return None
+    # Parse the timestamps of each length as a matrix of characters
+    characters = encoded.view(np.uint8).reshape(len(encoded), encoded.itemsize)
+    lengths = np.count_nonzero(characters, axis=1)
+    parsed = np.empty(len(encoded), dtype=np.int64)
+    unique_lengths = np.unique(lengths)
+    for length in unique_lengths:
+        with_length = lengths == length if len(unique_lengths) > 1 else slice(None)
+        parsed_with_length = _parse_iso8601_characters(characters[with_length, :length])
+        if parsed_with_length is None:
+            return None
+        parsed[with_length] = parsed_with_length
+    nanoseconds[present] = parsed
+    return nanoseconds
+
+
+def _parse_iso8601_characters(characters: np.ndarray) -> Optional[np.ndarray]:
+    # Parse a matrix with the (ASCII) characters of timestamps with the same length, or None if any of them is not ISO-8601
+    length = characters.shape[1]
+    # Value of each character as digit (over 9 if it is not a digit)
+    digits = characters - np.uint8(ord('0'))
+    # UTC offset at the end ('Z', '+HH:MM', '-HH:MM', or none)
+    offsets = 0
+    if length >= 20 and np.all(characters[:, -1] == ord('Z')):
+        length -= 1
+    elif length >= 25 and np.all(characters[:, -3] == ord(':')) and \
+            np.all((characters[:, -6] == ord('+')) | (characters[:, -6] == ord('-'))):
+        if not _all_digits(digits, [-5, -4, -2, -1]):
+            return None
+        offsets = (_get_number(digits, [-5, -4]) * 60 + _get_number(digits, [-2, -1])) * (60 * 10 ** 9)
+        offsets[characters[:, -6] == ord('-')] *= -1
+        length -= 6
+    # Date and time, with optional fraction of second (up to nanoseconds)
+    fraction_digits = max(length - 20, 0)
+    if length < 19 or length == 20 or fraction_digits > 9 or (length > 20 and not np.all(characters[:, 19] == ord('.'))):
+        return None
+    separators = [(4, '-'), (7, '-'), (13, ':'), (16, ':')]
+    if not all(np.all(characters[:, position] == ord(separator)) for position, separator in separators) or \
+            not np.all((characters[:, 10] == ord(' ')) | (characters[:, 10] == ord('T'))):
+        return None
+    if not _all_digits(digits, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18] + list(range(20, length))):
+        return None
+    (year, month, day) = (_get_number(digits, [0, 1, 2, 3]), _get_number(digits, [5, 6]), _get_number(digits, [8, 9]))
+    (hour, minute, second) = (_get_number(digits, [11, 12]), _get_number(digits, [14, 15]), _get_number(digits, [17, 18]))
+    # Check the values (the ones out of range or of the bounds of pd.Timestamp are left to pandas)
+    leap_year = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_days = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(month, 0, 12)] + (leap_year & (month == 2))
+    if not np.all((year > 1677) & (year < 2262) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days) &
+                  (hour <= 23) & (minute <= 59) & (second <= 59)):
+        return None
+    # Days since epoch of the (proleptic Gregorian) date, with the years starting in March
+    march_year = year - (month <= 2)
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    days = march_year * 365 + march_year // 4 - march_year // 100 + march_year // 400 + day_of_year - 719468
+    # Nanoseconds since epoch
+    nanoseconds = ((days * 24 + hour) * 60 + minute) * 60 + second
+    nanoseconds *= 10 ** 9
+    if fraction_digits > 0:
+        nanoseconds += _get_number(digits, list(range(20, length))) * 10 ** (9 - fraction_digits)
+    return nanoseconds - offsets
+
+
+def _all_digits(digits: np.ndarray, positions: list) -> bool:
+    # Check if the characters in the given positions are digits
+    return bool(np.all(digits[:, positions] <= 9))
+
+
+def _get_number(digits: np.ndarray, positions: list) -> np.ndarray:
+    # Number formed by the digits in the given positions
+    number = digits[:, positions[0]].astype(np.int64)
+    for position in positions[1:]:
+        number *= 10
+        number += digits[:, position]
+    return number
+
+
+def read_parquet_log(log_path, config, columns: Optional[list] = None, memory_map: bool = True, sort_by_end_time=True) -> pd.DataFrame:
+    """
+    Read an event log from a Parquet file (e.g. written with [write_parquet_log]), keeping the stored types: tz-aware timestamps are
+    not parsed, and dictionary-encoded columns are read as categorical. Requires the optional dependency 'pyarrow'.
+
+    :param log_path:            path to the Parquet file.
+    :param config:              configuration with the IDs of the columns and the value for missing resources.
+    :param columns:             names of the columns to read (all if None).
+    :param memory_map:          if True, memory-map the file instead of reading it into memory.
+    :param sort_by_end_time:    sort the event log by end time (warning this might alter the order of the events sharing end time).
+
+    :return: the event log (pd.DataFrame).
+    """
+    parquet = _import_pyarrow('pyarrow.parquet')
+    table = parquet.read_table(log_path, columns=columns, memory_map=memory_map)
+    return _table_to_event_log(table, config, sort_by_end_time)
+
+
+def read_arrow_log(log_path, config, columns: Optional[list] = None, memory_map: bool = True, sort_by_end_time=True) -> pd.DataFrame:
+    """
+    Read an event log from an Arrow IPC (Feather v2) file (e.g. written with [write_arrow_log]), keeping the stored types: tz-aware
+    timestamps are not parsed, and dictionary-encoded columns are read as categorical. Requires the optional dependency 'pyarrow'.
+
+    :param log_path:            path to the Arrow IPC file.
+    :param config:              configuration with the IDs of the columns and the value for missing resources.
+    :param columns:             names of the columns to read (all if None).
+    :param memory_map:          if True, memory-map the file (the uncompressed columns are then read without copying them).
+    :param sort_by_end_time:    sort the event log by end time (warning this might alter the order of the events sharing end time).
+
+    :return: the event log (pd.DataFrame).
+    """
+    pyarrow = _import_pyarrow('pyarrow')
+    source = pyarrow.memory_map(log_path, 'r') if memory_map else pyarrow.OSFile(log_path, 'rb')
+    table = pyarrow.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    return _table_to_event_log(table, config, sort_by_end_time)
+
+
+def write_parquet_log(event_log: pd.DataFrame, log_path, config, compression: Optional[str] = 'snappy'):
+    """
+    Write an event log to a Parquet file, with its timestamps as (tz-aware) nanosecond timestamps and its activity and resource columns
+    dictionary-encoded. The index of the event log is not written. Requires the optional dependency 'pyarrow'.
+
+    :param event_log:   event log to write.
+    :param log_path:    path to the Parquet file.
+    :param config:      configuration with the IDs of the columns.
+    :param compression: compression codec of the file (None for no compression).
+    """
+    parquet = _import_pyarrow('pyarrow.parquet')
+    parquet.write_table(_event_log_to_table(event_log, config), log_path, compression=compression, version='2.6')
+
+
+def write_arrow_log(event_log: pd.DataFrame, log_path, config, compression: Optional[str] = None):
+    """
+    Write an event log to an Arrow IPC (Feather v2) file, with its timestamps as (tz-aware) nanosecond timestamps and its activity and
+    resource columns dictionary-encoded. The index of the event log is not written. Requires the optional dependency 'pyarrow'.
+
+    :param event_log:   event log to write.
+    :param log_path:    path to the Arrow IPC file.
+    :param config:      configuration with the IDs of the columns.
+    :param compression: compression codec of the file ('lz4' or 'zstd'), or None to leave it uncompressed (to memory-map it without
+                        copying its columns when reading it).
+    """
+    pyarrow = _import_pyarrow('pyarrow')
+    table = _event_log_to_table(event_log, config)
+    with pyarrow.OSFile(str(log_path), 'wb') as sink:
+        with pyarrow.ipc.new_file(sink, table.schema, options=pyarrow.ipc.IpcWriteOptions(compression=compression)) as writer:
+            writer.write_table(table)
+
+
+def _import_pyarrow(module: str):
+    # Import (lazily) a module of the optional dependency pyarrow
+    try:
+        return importlib.import_module(module)
+    except ImportError as error:
+        raise ImportError("Reading and writing Parquet/Arrow event logs requires 'pyarrow' (pip install pyarrow)!") from error
+
+
+def _event_log_to_table(event_log: pd.DataFrame, config):
+    # Arrow table of the event log, with the activity and resource columns dictionary-encoded
+    pyarrow = _import_pyarrow('pyarrow')
+    table = pyarrow.Table.from_pandas(event_log, preserve_index=False)
+    for column in [config.log_ids.activity, config.log_ids.resource]:
+        if column in table.column_names and not pyarrow.types.is_dictionary(table.schema.field(column).type):
+            table = table.set_column(table.column_names.index(column), column, table.column(column).dictionary_encode())
+    return table
+
+
+def _table_to_event_log(table, config, sort_by_end_time: bool) -> pd.DataFrame:
+    # Event log of an Arrow table, with UTC timestamps and the missing resources filled
+    log_ids = config.log_ids
+    event_log = table.to_pandas(split_blocks=True)
+    # Fix missing resources
+    if log_ids.resource not in event_log.columns:
+        event_log[log_ids.resource] = config.missing_resource
+    elif event_log[log_ids.resource].isna().any():
+        resources = event_log[log_ids.resource]
+        if resources.dtype == 'category' and config.missing_resource not in resources.cat.categories:
+            resources = resources.cat.add_categories([config.missing_resource])
+        event_log[log_ids.resource] = resources.fillna(config.missing_resource)
+    # Set the timestamps in UTC (parsing them only if not stored as timestamps)
+    for column in [log_ids.end_time, log_ids.start_time, log_ids.enabled_time, log_ids.available_time, log_ids.estimated_start_time]:
+        if column in event_log.columns:
+            if pd.api.types.is_datetime64tz_dtype(event_log[column]):
+                if str(event_log[column].dt.tz) != 'UTC':
+                    event_log[column] = event_log[column].dt.tz_convert('UTC')
+            elif pd.api.types.is_datetime64_dtype(event_log[column]):
+                event_log[column] = event_log[column].dt.tz_localize('UTC')
+            elif column in [log_ids.end_time, log_ids.start_time]:
+                (event_log[column], _) = _parse_timestamps(event_log[column], None)
+    # Sort by end time
+    if sort_by_end_time and log_ids.end_time in event_log.columns:
+        event_log = event_log.sort_values(log_ids.end_time)
+    return event_log
+
+
+# Value of pd.NaT when representing the timestamps as nanoseconds (int64)
+NAT_NANOSECONDS = np.iinfo(np.int64).min
+
+
+def to_nanoseconds(timestamps: pd.Series) -> np.ndarray:
+    # Transform the timestamps to UTC nanoseconds since epoch (int64), with pd.NaT as NAT_NANOSECONDS
+    return pd.to_datetime(timestamps, utc=True).values.astype('datetime64[ns]').view(np.int64)
+
+
+def from_nanoseconds(nanoseconds: np.ndarray, index: pd.Index = None) -> pd.Series:
+    # Transform the UTC nanoseconds since epoch (int64) to timestamps, with NAT_NANOSECONDS as pd.NaT
+    return pd.Series(pd.to_datetime(nanoseconds, utc=True), index=index)
+
+
+# Approximate memory (in bytes) of each event of the batches read by [read_csv_log_in_batches]
+_BATCH_BYTES_PER_EVENT = 128
+
+
+def read_csv_log_in_batches(
+        log_path,
+        config,
+        memory_budget: int = 2 ** 30,
+        chunk_size: int = 1_000_000,
+        num_buckets: int = 64,
+        temporary_path: str = None,
+        sort_by_end_time: bool = True
+):
+    """
+    Read an event log too large to fit in memory in batches of whole cases. The CSV file is streamed in chunks, encoding the identifiers
+    (case, activity, and resource) with integer codes on the fly, and spilling the events to temporary files bucketed by case. Then, the
+    buckets are grouped in batches within a memory budget (splitting the buckets over it), so each batch can be processed on its own by
+    the stages depending only on the events of the same case (e.g. ConcurrencyOracle.add_enabled_times). Only the columns of the event
+    log IDs (case, activity, resource, start and end time) are read, with the identifiers as strings.
+
+    :param log_path:            path to the CSV file (can be compressed).
+    :param config:              configuration with the IDs of the columns and the value for missing resources.
+    :param memory_budget:       approximate maximum memory (in bytes) of each batch (a case over it forms a batch on its own).
+    :param chunk_size:          number of rows of the CSV file to read at once.
+    :param num_buckets:         number of buckets to spill the events to.
+    :param temporary_path:      path of the directory to create the temporary files in (the default one of the system if None).
+    :param sort_by_end_time:    sort the events of each batch by end time (keeping the order of the file for the same end time), or
+                                keep the order of the file.
+
+    :return: a generator of event logs (pd.DataFrame indexed by the position of each event in the file) with all the events of their
+    cases.
+    """
+    log_ids = config.log_ids
+    spill_path = tempfile.mkdtemp(dir=temporary_path, prefix='.event-log-')
+    try:
+        # Stream the file encoding the identifiers, and spill the events of each chunk to the bucket of their case
+        vocabularies = {'case': {}, 'activity': {}, 'resource': {}}
+        columns, bucket_sizes, num_events = [], np.zeros(num_buckets, dtype=np.int64), 0
+        id_columns = [log_ids.case, log_ids.activity, log_ids.resource, log_ids.start_time, log_ids.end_time]
+        # Read the identifiers as strings, as the type inferred for each chunk may differ (e.g. case 1 as int in a chunk with only
+        # numeric IDs, and as '1' in another one), which would split the cases in several batches
+        for chunk_number, chunk in enumerate(pd.read_csv(
+                log_path,
+                chunksize=chunk_size,
+                usecols=lambda column: column in id_columns,
+                dtype={log_ids.case: str, log_ids.activity: str, log_ids.resource: str}
+        )):
+            # Fix missing resources
+            if log_ids.resource not in chunk.columns:
+                chunk[log_ids.resource] = config.missing_resource
+            else:
+                chunk[log_ids.resource] = chunk[log_ids.resource].fillna(config.missing_resource)
+            columns = list(chunk.columns)
+            # Encode identifiers and timestamps
+            arrays = {
+                'case': _encode_values(chunk[log_ids.case], vocabularies['case']),
+                'activity': _encode_values(chunk[log_ids.activity], vocabularies['activity']),
+                'resource': _encode_values(chunk[log_ids.resource], vocabularies['resource']),
+                'end_time': to_nanoseconds(_parse_timestamps(chunk[log_ids.end_time], None)[0]),
+                'position': np.arange(num_events, num_events + len(chunk), dtype=np.int64)
+            }
+            if log_ids.start_time in chunk.columns:
+                arrays['start_time'] = to_nanoseconds(_parse_timestamps(chunk[log_ids.start_time], None)[0])
+            # Spill them to the bucket of their case
+            buckets = _get_case_buckets(arrays['case'], num_buckets, 0)
+            _spill_buckets(arrays, buckets, spill_path, chunk_number)
+            bucket_sizes += np.bincount(buckets, minlength=num_buckets)
+            num_events += len(chunk)
+        # Values of each identifier by code (with a last missing value for the code -1)
+        values = {name: pd.Series(list(vocabulary) + [np.nan], dtype=object).values for name, vocabulary in vocabularies.items()}
+        # Read the buckets of each batch and build its event log
+        buckets = [(os.path.join(spill_path, str(bucket)), bucket_sizes[bucket]) for bucket in range(num_buckets)]
+        for batch_buckets in _group_buckets(buckets, memory_budget, num_buckets, 1):
+            arrays = _read_buckets(batch_buckets)
+            order = np.lexsort((arrays['position'], arrays['end_time'])) if sort_by_end_time else np.argsort(arrays['position'])
+            batch = {
+                log_ids.case: values['case'][arrays['case'][order]],
+                log_ids.activity: values['activity'][arrays['activity'][order]],
+                log_ids.resource: values['resource'][arrays['resource'][order]],
+                log_ids.end_time: pd.to_datetime(arrays['end_time'][order], utc=True)
+            }
+            if 'start_time' in arrays:
+                batch[log_ids.start_time] = pd.to_datetime(arrays['start_time'][order], utc=True)
+            yield pd.DataFrame({column: batch[column] for column in columns}, index=pd.Index(arrays['position'][order]))
+    finally:
+        shutil.rmtree(spill_path, ignore_errors=True)
+
+
+def _encode_values(values: pd.Series, vocabulary: dict) -> np.ndarray:
+    # Code of each value in the vocabulary (adding the new values to it), -1 for missing values
+    codes, uniques = pd.factorize(values)
+    value_codes = [vocabulary.setdefault(value, len(vocabulary)) for value in uniques.tolist()]
+    return np.array(value_codes + [-1], dtype=np.int32)[codes]
+
+
+def _get_case_buckets(case_codes: np.ndarray, num_buckets: int, level: int) -> np.ndarray:
+    # Bucket of each event by its case code (the level-th digit of the code in base [num_buckets], to split the buckets again)
+    return ((case_codes.astype(np.int64) // (num_buckets ** level)) % num_buckets).astype(np.int64)
+
+
+def _spill_buckets(arrays: dict, buckets: np.ndarray, path: str, part: int):
+    # Write the events of each bucket as a part of the bucket
+    for bucket in np.unique(buckets):
+        os.makedirs(os.path.join(path, str(bucket)), exist_ok=True)
+        in_bucket = buckets == bucket
+        np.savez(os.path.join(path, str(bucket), "{:06d}.npz".format(part)), **{name: array[in_bucket] for name, array in arrays.items()})
+
+
+def _iter_bucket_parts(bucket_path: str):
+    # Arrays of each part of a bucket (in order)
+    for name in sorted(os.listdir(bucket_path)):
+        with np.load(os.path.join(bucket_path, name)) as part:
+            yield {array_name: part[array_name] for array_name in part.files}
+
+
+def _read_buckets(bucket_paths: list) -> dict:
+    # Concatenate the arrays of all the parts of the buckets
+    parts = [part for bucket_path in bucket_paths for part in _iter_bucket_parts(bucket_path)]
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def _group_buckets(buckets: list, memory_budget: int, num_buckets: int, level: int):
+    # Group the buckets (path and number of events) in batches within the memory budget, splitting the buckets over it with the next
+    # digit of the case codes
+    batch, batch_size = [], 0
+    for bucket_path, bucket_size in buckets:
+        if bucket_size == 0:
+            continue
+        if bucket_size * _BATCH_BYTES_PER_EVENT > memory_budget and num_buckets > 1 and not _is_single_case(bucket_path):
+            yield from _group_buckets(_split_bucket(bucket_path, num_buckets, level), memory_budget, num_buckets, level + 1)
+            continue
+        if len(batch) > 0 and (batch_size + bucket_size) * _BATCH_BYTES_PER_EVENT > memory_budget:
+            yield batch
+            batch, batch_size = [], 0
+        batch += [bucket_path]
+        batch_size += bucket_size
+    if len(batch) > 0:
+        yield batch
+
+
+def _is_single_case(bucket_path: str) -> bool:
+    # Check if all the events of a bucket belong to the same case
+    case_codes = np.unique(np.concatenate([part['case'] for part in _iter_bucket_parts(bucket_path)]))
+    return len(case_codes) == 1
+
+
+def _split_bucket(bucket_path: str, num_buckets: int, level: int) -> list:
+    # Split (part by part) the events of a bucket into sub-buckets, removing it
+    bucket_sizes = np.zeros(num_buckets, dtype=np.int64)
+    for part_number, part in enumerate(_iter_bucket_parts(bucket_path)):
+        buckets = _get_case_buckets(part['case'], num_buckets, level)
+        _spill_buckets(part, buckets, bucket_path + '_', part_number)
+        bucket_sizes += np.bincount(buckets, minlength=num_buckets)
+    shutil.rmtree(bucket_path)
+    return [(os.path.join(bucket_path + '_', str(bucket)), bucket_sizes[bucket]) for bucket in range(num_buckets)]
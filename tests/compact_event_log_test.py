@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from estimate_start_times.compact_event_log import CompactEventLog
+from estimate_start_times.config import Configuration
+from estimate_start_times.event_log_index import EventLogIndex
+from estimate_start_times.utils import read_csv_log
+
+
+def test_compact_event_log():
+    config = Configuration()
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    compact_event_log = CompactEventLog(event_log, config.log_ids)
+    assert len(compact_event_log) == len(event_log)
+    # Identifiers coded as int32 and timestamps as int64
+    assert compact_event_log.case_codes.dtype == np.int32
+    assert compact_event_log.activity_codes.dtype == np.int32
+    assert compact_event_log.resource_codes.dtype == np.int32
+    assert compact_event_log.end_times.dtype == np.int64
+    assert compact_event_log.start_times.dtype == np.int64
+    # No per-instance dictionary
+    assert not hasattr(compact_event_log, '__dict__')
+    # Build back the event log
+    rebuilt_event_log = compact_event_log.to_event_log()
+    columns = [config.log_ids.case, config.log_ids.activity, config.log_ids.resource, config.log_ids.start_time, config.log_ids.end_time]
+    pd.testing.assert_frame_equal(rebuilt_event_log[columns], event_log[columns].astype({config.log_ids.resource: str}))
+
+
+def test_event_log_index():
+    config = Configuration()
+    event_log = pd.DataFrame({
+        config.log_ids.case: ['c1', 'c2', 'c1', 'c2', 'c1'],
+        config.log_ids.activity: ['A', 'A', 'B', 'B', 'C'],
+        config.log_ids.resource: ['R1', 'R2', 'R2', 'R1', 'R1'],
+        config.log_ids.end_time: pd.to_datetime([3, 1, 2, 4, 5], unit='s', utc=True)
+    })
+    log_index = EventLogIndex(event_log, config.log_ids)
+    assert not hasattr(log_index, '__dict__')
+    # Events grouped by case and sorted by end time
+    assert log_index.case_order.tolist() == [2, 0, 4, 1, 3]
+    assert log_index.case_offsets.tolist() == [0, 3, 5]
+    assert not log_index.case_order_is_log_order
+    assert log_index.get_case_order_in_log_order().tolist() == [0, 2, 4, 1, 3]
+    # Events grouped by resource and sorted by end time
+    assert log_index.resource_order.tolist() == [0, 3, 4, 1, 2]
+    assert log_index.resource_offsets.tolist() == [0, 3, 5]
+    # Check the event log it corresponds to
+    assert log_index.matches(event_log, config.log_ids)
+    assert not log_index.matches(event_log.head(3), config.log_ids)
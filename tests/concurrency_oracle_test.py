@@ -1,11 +1,15 @@
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
+import estimate_start_times.concurrency_oracle as concurrency_oracle_module
 from estimate_start_times.concurrency_oracle import AlphaConcurrencyOracle, HeuristicsConcurrencyOracle, \
-    DirectlyFollowsConcurrencyOracle, DeactivatedConcurrencyOracle
+    DirectlyFollowsConcurrencyOracle, DeactivatedConcurrencyOracle, ConcurrencyOracle
+from estimate_start_times.concurrency_oracle import _get_df_count_matrix, _get_df_relations, _get_heuristics_counts
 from estimate_start_times.config import Configuration, HeuristicsThresholds
-from estimate_start_times.utils import read_csv_log
+from estimate_start_times.event_log_index import EventLogIndex
+from estimate_start_times.utils import read_csv_log, zip_with_next
 
 
 def test_deactivated_concurrency_oracle():
@@ -149,3 +153,173 @@ def test_heuristics_concurrency_oracle_multi_parallel_noise():
         'H': {'I'},
         'I': {'H'}
     }
+
+
+def _add_enabled_times_per_event(concurrency_oracle, event_log: pd.DataFrame, set_nat_to_first_event: bool):
+    # Reference implementation: compute the enabled time of each event with [enabled_since]
+    log_ids = concurrency_oracle.log_ids
+    indexes = []
+    enabled_times = []
+    for (case_id, trace) in event_log.groupby([log_ids.case]):
+        if log_ids.start_time in trace:
+            trace_start_time = min(trace[log_ids.start_time].min(), trace[log_ids.end_time].min())
+        else:
+            trace_start_time = trace[log_ids.end_time].min()
+        for index, event in trace.iterrows():
+            indexes += [index]
+            enabled_time = concurrency_oracle.enabled_since(trace, event)
+            enabled_times += [enabled_time if set_nat_to_first_event or not pd.isna(enabled_time) else trace_start_time]
+    event_log.loc[indexes, log_ids.enabled_time] = enabled_times
+    event_log[log_ids.enabled_time] = pd.to_datetime(event_log[log_ids.enabled_time], utc=True)
+
+
+def _random_event_log(config: Configuration, num_cases: int, seed: int) -> pd.DataFrame:
+    # Random log with repeated timestamps, overlapping and missing start times, and traces of different lengths
+    rng = np.random.default_rng(seed)
+    events = []
+    for case in range(num_cases):
+        end_times = np.sort(rng.integers(0, 20, rng.integers(1, 12))) * 600
+        for end_time in end_times:
+            start_time = end_time - rng.integers(0, 4) * 600
+            events += [{
+                config.log_ids.case: "case-{}".format(case),
+                config.log_ids.activity: "ABCDEF"[rng.integers(0, 6)],
+                config.log_ids.resource: "R{}".format(rng.integers(0, 3)),
+                config.log_ids.start_time: pd.NaT if rng.random() < 0.1 else pd.Timestamp(int(start_time), unit='s', tz='UTC'),
+                config.log_ids.end_time: pd.Timestamp(int(end_time), unit='s', tz='UTC')
+            }]
+    return pd.DataFrame(events).sample(frac=1.0, random_state=seed).sort_values(config.log_ids.end_time, kind='stable')
+
+
+def test_add_enabled_times_equivalent_to_per_event_computation():
+    for consider_start_times in [False, True]:
+        config = Configuration(consider_start_times=consider_start_times)
+        event_logs = [
+            read_csv_log('./tests/assets/test_event_log_1.csv', config),
+            read_csv_log('./tests/assets/test_event_log_4.csv', config),
+            _random_event_log(config, num_cases=40, seed=int(consider_start_times))
+        ]
+        for event_log in event_logs:
+            concurrency_oracles = [
+                DeactivatedConcurrencyOracle(config),
+                DirectlyFollowsConcurrencyOracle(event_log, config),
+                AlphaConcurrencyOracle(event_log, config),
+                HeuristicsConcurrencyOracle(event_log, config)
+            ]
+            for concurrency_oracle in concurrency_oracles:
+                for set_nat_to_first_event in [False, True]:
+                    expected = event_log.copy()
+                    _add_enabled_times_per_event(concurrency_oracle, expected, set_nat_to_first_event)
+                    actual = event_log.copy()
+                    concurrency_oracle.add_enabled_times(actual, set_nat_to_first_event)
+                    # The enabled times are the same as computing them event by event
+                    pd.testing.assert_series_equal(actual[config.log_ids.enabled_time], expected[config.log_ids.enabled_time])
+
+
+def test_enabled_times_of_long_cases(monkeypatch):
+    # Sweep chunks of 4 events (x 6 activities), shorter than the cases
+    monkeypatch.setattr(concurrency_oracle_module, '_ENABLED_TIMES_CHUNK_SIZE', 4 * 6)
+    for consider_start_times in [False, True]:
+        config = Configuration(consider_start_times=consider_start_times)
+        # Random log with a case of around 100 events
+        event_log = _random_event_log(config, num_cases=40, seed=3)
+        event_log.loc[event_log[config.log_ids.case].isin(["case-{}".format(case) for case in range(20)]), config.log_ids.case] = 'case-0'
+        for concurrency_oracle in [AlphaConcurrencyOracle(event_log, config), HeuristicsConcurrencyOracle(event_log, config)]:
+            assert concurrency_oracle.concurrency_matrix.any()
+            expected = event_log.copy()
+            _add_enabled_times_per_event(concurrency_oracle, expected, True)
+            actual = event_log.copy()
+            concurrency_oracle.add_enabled_times(actual, True)
+            # The enabled times are the same as computing them event by event
+            pd.testing.assert_series_equal(actual[config.log_ids.enabled_time], expected[config.log_ids.enabled_time])
+
+
+def test_enabled_times_in_parallel():
+    for consider_start_times in [False, True]:
+        config = Configuration(consider_start_times=consider_start_times)
+        event_log = _random_event_log(config, num_cases=60, seed=2)
+        log_index = EventLogIndex(event_log, config.log_ids)
+        for concurrency_oracle in [DirectlyFollowsConcurrencyOracle(event_log, config), HeuristicsConcurrencyOracle(event_log, config)]:
+            # Same enabled times computing the shards of cases in several processes
+            for set_nat_to_first_event in [False, True]:
+                assert (
+                        concurrency_oracle.get_enabled_times(event_log, set_nat_to_first_event, log_index, n_jobs=3) ==
+                        concurrency_oracle.get_enabled_times(event_log, set_nat_to_first_event, log_index)
+                ).all()
+
+
+def test_df_count_matrix():
+    config = Configuration()
+    for event_log in [read_csv_log('./tests/assets/test_event_log_3_noise.csv', config), _random_event_log(config, 40, 0)]:
+        # Count directly-follows relations iterating each trace
+        expected = {}
+        for (key, trace) in event_log.groupby([config.log_ids.case]):
+            for (current_activity, future_activity) in zip_with_next(trace[config.log_ids.activity]):
+                expected[(current_activity, future_activity)] = expected.get((current_activity, future_activity), 0) + 1
+        # The count matrix has the same relations
+        (activities, df_count) = _get_df_count_matrix(EventLogIndex(event_log, config.log_ids))
+        assert list(activities) == list(event_log[config.log_ids.activity].unique())
+        assert df_count.sum() == sum(expected.values())
+        for (act_a, act_b), count in expected.items():
+            assert df_count[list(activities).index(act_a), list(activities).index(act_b)] == count
+        # The dictionary of directly-follows relations is derived from it
+        df_relations = _get_df_relations(event_log, config.log_ids)
+        assert df_relations == {
+            act_a: {act_b: count for (act_x, act_b), count in expected.items() if act_x == act_a} for act_a in activities
+        }
+
+
+def test_heuristics_counts():
+    config = Configuration()
+    event_log = pd.DataFrame({
+        config.log_ids.case: ['c1', 'c1', 'c2', 'c1', 'c2', 'c1', 'c2', 'c1'],
+        config.log_ids.activity: ['A', 'B', 'A', 'A', 'C', 'B', 'A', 'C']
+    })
+    (activities, df_count, l2l_count) = _get_heuristics_counts(EventLogIndex(event_log, config.log_ids))
+    assert list(activities) == ['A', 'B', 'C']
+    # Directly-follows relations: c1 = A-B-A-B-C, c2 = A-C-A
+    assert df_count.tolist() == [[0, 2, 1], [1, 0, 1], [1, 0, 0]]
+    # Length 2 loops: A-B-A and B-A-B in c1, A-C-A in c2
+    assert l2l_count.tolist() == [[0, 1, 1], [1, 0, 0], [0, 0, 0]]
+
+
+def test_heuristics_concurrency_sweep():
+    config = Configuration()
+    event_log = read_csv_log('./tests/assets/test_event_log_3_noise.csv', config)
+    thresholds = [
+        HeuristicsThresholds(df=df, l2l=l2l, l1l=l1l) for df in [0.5, 0.9, 1.0] for l2l in [0.5, 0.9, 1.0] for l1l in [0.5, 0.9]
+    ]
+    (activities, concurrency_tensor) = HeuristicsConcurrencyOracle.concurrency_sweep(event_log, config.log_ids, thresholds)
+    # One concurrency matrix per grid point
+    assert concurrency_tensor.shape == (len(thresholds), len(activities), len(activities))
+    for heuristics_thresholds, concurrency_matrix in zip(thresholds, concurrency_tensor):
+        # The concurrency relations of each grid point are the same as discovering them individually
+        concurrency_oracle = HeuristicsConcurrencyOracle(event_log, Configuration(heuristics_thresholds=heuristics_thresholds))
+        assert concurrency_oracle.concurrency == {
+            act_a: {act_b for act_b, concurrent in zip(activities, row) if concurrent} for act_a, row in zip(activities, concurrency_matrix)
+        }
+
+
+def test_concurrency_matrix():
+    config = Configuration()
+    event_log = read_csv_log('./tests/assets/test_event_log_1.csv', config)
+    concurrency_oracle = AlphaConcurrencyOracle(event_log, config)
+    # The concurrency matrix is exposed alongside the dict
+    activities = list(concurrency_oracle.activities)
+    assert sorted(activities) == ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I']
+    assert concurrency_oracle.concurrency_matrix.shape == (9, 9)
+    assert {
+               (activities[i], activities[j]) for i, j in zip(*np.nonzero(concurrency_oracle.concurrency_matrix))
+           } == {('C', 'D'), ('D', 'C')}
+    # A concurrency oracle built from the dict gets the same matrix
+    oracle_from_dict = ConcurrencyOracle({'A': {'B'}, 'B': {'A'}, 'C': set()}, config)
+    assert list(oracle_from_dict.activities) == ['A', 'B', 'C']
+    assert oracle_from_dict.concurrency_matrix.tolist() == [[False, True, False], [True, False, False], [False, False, False]]
+    # A custom concurrency oracle can supply the matrix directly
+    custom_oracle = ConcurrencyOracle(None, config, activities, concurrency_oracle.concurrency_matrix)
+    assert custom_oracle.concurrency == concurrency_oracle.concurrency
+    expected = event_log.copy()
+    concurrency_oracle.add_enabled_times(expected)
+    actual = event_log.copy()
+    custom_oracle.add_enabled_times(actual)
+    pd.testing.assert_series_equal(actual[config.log_ids.enabled_time], expected[config.log_ids.enabled_time])
@@ -0,0 +1,40 @@
+from statistics import mode
+
+import numpy as np
+
+from estimate_start_times.duration_statistics import ActivityDurationStatistics, compute_grouped_statistic
+from estimate_start_times.utils import NAT_NANOSECONDS
+
+
+def test_compute_grouped_statistic():
+    rng = np.random.default_rng(0)
+    group_codes = rng.integers(0, 5, 200)
+    values = rng.integers(-3, 10, 200) * 1000000007
+    for statistic, reference in [('MODE', mode), ('MEDIAN', np.median), ('MEAN', np.mean)]:
+        result = compute_grouped_statistic(statistic, group_codes, values, 6)
+        for group in range(5):
+            # Same value as the statistic over the timedelta values of the group
+            durations = values[group_codes == group].astype('timedelta64[ns]')
+            assert result[group] == reference(durations).astype(np.int64)
+        # No value for the groups with no values
+        assert result[5] == NAT_NANOSECONDS
+
+
+def test_mode_ties_broken_by_first_occurrence():
+    group_codes = np.array([0, 0, 0, 0, 1, 1, 1])
+    values = np.array([5, 3, 3, 5, 7, 2, 9])
+    assert compute_grouped_statistic('MODE', group_codes, values, 2).tolist() == [5, 7]
+
+
+def test_activity_duration_statistics_update():
+    activity_codes = np.array([0, 1, 0, 1, 0, -1, 2])
+    durations = np.array([10, 20, 30, NAT_NANOSECONDS, 50, 60, NAT_NANOSECONDS])
+    duration_statistics = ActivityDurationStatistics(activity_codes, durations, 3)
+    assert duration_statistics.get_statistic('MEDIAN').tolist() == [30, 20, NAT_NANOSECONDS]
+    assert duration_statistics.get_statistic('MEAN').tolist() == [30, 20, NAT_NANOSECONDS]
+    assert duration_statistics.get_event_statistic('MEDIAN').tolist() == [30, 20, 30, 20, 30, NAT_NANOSECONDS, NAT_NANOSECONDS]
+    # Update the durations of some events, recomputing the statistics of their activities
+    duration_statistics.update_durations(np.array([4, 3]), np.array([20, 40]))
+    assert duration_statistics.get_statistic('MEDIAN').tolist() == [20, 30, NAT_NANOSECONDS]
+    assert duration_statistics.get_statistic('MEAN').tolist() == [20, 30, NAT_NANOSECONDS]
+    assert duration_statistics.get_statistic('MODE').tolist() == [10, 20, NAT_NANOSECONDS]
@@ -1,10 +1,14 @@
 from datetime import timedelta
 
+import numpy as np
 import pandas as pd
 
-from estimate_start_times.config import ConcurrencyOracleType, Configuration, ReEstimationMethod, ResourceAvailabilityType, OutlierStatistic
+from estimate_start_times.config import ConcurrencyOracleType, Configuration, ReEstimationMethod, ResourceAvailabilityType, \
+    OutlierStatistic, EstimationOutput
 from estimate_start_times.estimator import StartTimeEstimator
-from estimate_start_times.utils import read_csv_log
+from estimate_start_times.event_log_index import EventLogIndex
+from estimate_start_times.resource_availability import SimpleResourceAvailability
+from estimate_start_times.utils import read_csv_log, from_nanoseconds
 
 
 def test_estimate_start_times_only_resource():
@@ -136,6 +140,33 @@ def test_repair_activities_with_duration_over_threshold():
            first_trace.iloc[6][config.log_ids.end_time] - timedelta(minutes=38.4)
 
 
+def test_re_estimate_durations_over_threshold_all_statistics():
+    for outlier_statistic in OutlierStatistic:
+        config = Configuration(
+            re_estimation_method=ReEstimationMethod.MEDIAN,
+            concurrency_oracle_type=ConcurrencyOracleType.DF,
+            resource_availability_type=ResourceAvailabilityType.SIMPLE,
+            outlier_statistic=outlier_statistic,
+            outlier_threshold=1.3
+        )
+        event_log = read_csv_log('./tests/assets/test_event_log_1.csv', config)
+        start_time_estimator = StartTimeEstimator(event_log, config)
+        event_log[config.log_ids.estimated_start_time] = event_log[config.log_ids.end_time] - pd.to_timedelta(
+            [(index * 7) % 30 for index in range(len(event_log))], unit='m'
+        )
+        event_log.loc[event_log.index[::5], config.log_ids.estimated_start_time] = pd.NaT
+        expected = event_log.copy()
+        start_time_estimator._re_estimate_durations_over_threshold(event_log)
+        # Compare with the re-estimation of each activity independently
+        for activity, events in expected[~pd.isna(expected[config.log_ids.estimated_start_time])].groupby(config.log_ids.activity):
+            durations = events[config.log_ids.end_time] - events[config.log_ids.estimated_start_time]
+            duration_limit = config.outlier_threshold * start_time_estimator._apply_statistic(durations)
+            over_threshold = durations.index[durations > duration_limit]
+            expected.loc[over_threshold, config.log_ids.estimated_start_time] = \
+                expected.loc[over_threshold, config.log_ids.end_time] - duration_limit
+        pd.testing.assert_frame_equal(event_log, expected)
+
+
 def test_estimate_start_times_mode():
     config = Configuration(
         re_estimation_method=ReEstimationMethod.MODE,
@@ -272,6 +303,171 @@ def test_set_median_non_estimated_start_times():
     assert second_trace.iloc[2][config.log_ids.estimated_start_time] == second_trace.iloc[2][config.log_ids.end_time]
 
 
+def test_shared_event_log_index():
+    config = Configuration(
+        re_estimation_method=ReEstimationMethod.MEDIAN,
+        concurrency_oracle_type=ConcurrencyOracleType.HEURISTICS,
+        resource_availability_type=ResourceAvailabilityType.SIMPLE,
+        consider_start_times=True
+    )
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    # Build the index once and share it between estimators with different configurations
+    log_index = EventLogIndex(event_log, config.log_ids)
+    alpha_config = Configuration(
+        re_estimation_method=ReEstimationMethod.MODE,
+        concurrency_oracle_type=ConcurrencyOracleType.ALPHA,
+        resource_availability_type=ResourceAvailabilityType.SIMPLE
+    )
+    for estimator_config in [config, alpha_config]:
+        shared = StartTimeEstimator(event_log, estimator_config, log_index).estimate()
+        not_shared = StartTimeEstimator(event_log, estimator_config).estimate()
+        pd.testing.assert_frame_equal(shared, not_shared)
+    # An index built from another event log is rejected
+    try:
+        StartTimeEstimator(event_log.head(10), config, log_index)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_estimate_start_times_nan_resources():
+    config = Configuration(re_estimation_method=ReEstimationMethod.MODE, concurrency_oracle_type=ConcurrencyOracleType.DF)
+    event_log = pd.DataFrame({
+        config.log_ids.case: ['c1', 'c1', 'c2', 'c2', 'c1', 'c2'],
+        config.log_ids.activity: ['A', 'B', 'A', 'B', 'C', 'C'],
+        config.log_ids.resource: ['R1', np.nan, 'R1', np.nan, 'R2', np.nan],
+        config.log_ids.end_time: pd.to_datetime(['2021-01-01 10:00', '2021-01-01 10:30', '2021-01-01 11:00', '2021-01-01 11:45',
+                                                '2021-01-01 12:00', '2021-01-01 12:30'], utc=True)
+    })
+    # The events with no resource do not share a calendar (NaN resource is not coded as 'nan')
+    assert EventLogIndex(event_log, config.log_ids).resource_codes.tolist() == [0, -1, 0, -1, 1, -1]
+    extended_event_log = StartTimeEstimator(event_log, config).estimate()
+    # Same result as the per-event estimation: the events with no resource are always available (pd.NaT)
+    expected = pd.DataFrame({
+        config.log_ids.enabled_time: pd.to_datetime(
+            [None, '2021-01-01 10:00', None, '2021-01-01 11:00', '2021-01-01 10:30', '2021-01-01 11:45'], utc=True
+        ),
+        config.log_ids.available_time: pd.to_datetime([None, None, '2021-01-01 10:00', None, None, None], utc=True),
+        config.log_ids.estimated_start_time: pd.to_datetime(
+            ['2021-01-01 09:00', '2021-01-01 10:00', '2021-01-01 10:00', '2021-01-01 11:00', '2021-01-01 10:30', '2021-01-01 11:45'],
+            utc=True
+        )
+    })
+    pd.testing.assert_frame_equal(extended_event_log[expected.columns], expected)
+
+
+def test_estimation_outputs():
+    config = Configuration(
+        re_estimation_method=ReEstimationMethod.MODE,
+        concurrency_oracle_type=ConcurrencyOracleType.HEURISTICS,
+        resource_availability_type=ResourceAvailabilityType.SIMPLE,
+        outlier_threshold=2.0
+    )
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    new_columns = [config.log_ids.available_time, config.log_ids.enabled_time, config.log_ids.estimated_start_time]
+    start_time_estimator = StartTimeEstimator(event_log, config)
+    extended_event_log = start_time_estimator.estimate()
+    # Only the new columns, aligned with the event log
+    estimated_columns = start_time_estimator.estimate(output=EstimationOutput.NEW_COLUMNS)
+    assert list(estimated_columns.columns) == new_columns
+    pd.testing.assert_frame_equal(estimated_columns, extended_event_log[new_columns])
+    # Only the values of the new columns
+    estimated_arrays = start_time_estimator.estimate(output=EstimationOutput.ARRAYS)
+    for column in new_columns:
+        pd.testing.assert_series_equal(
+            pd.Series(pd.to_datetime(estimated_arrays[column], utc=True), index=event_log.index, name=column),
+            extended_event_log[column]
+        )
+    # New columns written in the event log of the estimator
+    assert config.log_ids.estimated_start_time not in event_log.columns
+    in_place_event_log = start_time_estimator.estimate(output=EstimationOutput.IN_PLACE)
+    assert in_place_event_log is event_log
+    pd.testing.assert_frame_equal(event_log, extended_event_log)
+
+
+def test_estimate_in_place_twice():
+    config = Configuration(
+        re_estimation_method=ReEstimationMethod.MODE,
+        concurrency_oracle_type=ConcurrencyOracleType.DEACTIVATED,
+        reuse_current_start_times=True,
+        outlier_statistic=OutlierStatistic.MEAN,
+        outlier_threshold=2.0
+    )
+    end_times = pd.to_datetime(['2021-01-01 10:00', '2021-01-01 11:00', '2021-01-01 12:00', '2021-01-01 13:00'], utc=True)
+    event_log = pd.DataFrame({
+        config.log_ids.case: ['c1', 'c2', 'c3', 'c4'],
+        config.log_ids.activity: ['A', 'A', 'A', 'A'],
+        config.log_ids.resource: ['R1', 'R2', 'R3', 'R4'],
+        config.log_ids.start_time: end_times - pd.to_timedelta([10, 10, 10, 100], unit='m'),
+        config.log_ids.end_time: end_times
+    })
+    start_time_estimator = StartTimeEstimator(event_log, config)
+    # The first estimation clips the duration over the threshold (2 * 32.5m), replacing the start times in the event log
+    assert start_time_estimator.estimate(replace_recorded_start_times=True, output=EstimationOutput.IN_PLACE) is event_log
+    assert event_log[config.log_ids.start_time].iloc[3] == end_times[3] - pd.Timedelta(minutes=65)
+    # The second one estimates the modified event log (2 * 23.75m), not the one indexed before the first estimation
+    expected = StartTimeEstimator(event_log.copy(), config).estimate(replace_recorded_start_times=True)
+    extended_event_log = start_time_estimator.estimate(replace_recorded_start_times=True, output=EstimationOutput.IN_PLACE)
+    assert extended_event_log[config.log_ids.start_time].iloc[3] == end_times[3] - pd.Timedelta(minutes=47.5)
+    pd.testing.assert_frame_equal(extended_event_log, expected)
+
+
+def test_fit_transform():
+    config = Configuration(
+        re_estimation_method=ReEstimationMethod.MEDIAN,
+        concurrency_oracle_type=ConcurrencyOracleType.HEURISTICS,
+        resource_availability_type=ResourceAvailabilityType.SIMPLE,
+        consider_start_times=True
+    )
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    cases = event_log[config.log_ids.case].unique()
+    history_log = event_log[event_log[config.log_ids.case].isin(cases[:len(cases) // 2])]
+    new_log = event_log[~event_log[config.log_ids.case].isin(cases[:len(cases) // 2])]
+    # Learn from the history and estimate the new log
+    start_time_estimator = StartTimeEstimator(config=config).fit(history_log)
+    concurrency = start_time_estimator.concurrency_oracle.concurrency
+    estimated_columns = start_time_estimator.transform(new_log, output=EstimationOutput.NEW_COLUMNS)
+    # The learned concurrency is reused
+    assert start_time_estimator.concurrency_oracle.concurrency == concurrency
+    pd.testing.assert_series_equal(
+        estimated_columns[config.log_ids.enabled_time],
+        from_nanoseconds(start_time_estimator.concurrency_oracle.get_enabled_times(new_log, set_nat_to_first_event=True), new_log.index),
+        check_names=False
+    )
+    # The availability considers the events of both the history and the new log
+    expected_available_times = SimpleResourceAvailability(event_log, config).get_resource_availability_times(event_log)
+    pd.testing.assert_series_equal(
+        estimated_columns[config.log_ids.available_time],
+        from_nanoseconds(expected_available_times, event_log.index)[new_log.index],
+        check_names=False
+    )
+    # The start times are estimated
+    assert not estimated_columns[config.log_ids.estimated_start_time].isna().any()
+
+
+def test_transform_does_not_modify_fitted_model():
+    config = Configuration(
+        re_estimation_method=ReEstimationMethod.MEDIAN,
+        concurrency_oracle_type=ConcurrencyOracleType.HEURISTICS,
+        resource_availability_type=ResourceAvailabilityType.SIMPLE
+    )
+    event_log = read_csv_log('./tests/assets/test_event_log_1.csv', config)
+    cases = event_log[config.log_ids.case].unique()
+    history_log = event_log[event_log[config.log_ids.case].isin(cases[:2])]
+    new_log = event_log[~event_log[config.log_ids.case].isin(cases[:2])]
+    start_time_estimator = StartTimeEstimator(history_log, config)
+    expected = start_time_estimator.estimate()
+    num_calendar_events = len(start_time_estimator.resource_availability.resources_calendar.end_times)
+    # Transforming the same window twice gives the same result, and does not change the fitted calendars nor the estimation
+    first_transformation = start_time_estimator.transform(new_log)
+    pd.testing.assert_frame_equal(start_time_estimator.transform(new_log), first_transformation)
+    assert len(start_time_estimator.resource_availability.resources_calendar.end_times) == num_calendar_events
+    pd.testing.assert_frame_equal(start_time_estimator.estimate(), expected)
+    # The events are kept in the calendars only if committed
+    start_time_estimator.transform(new_log, commit=True)
+    assert len(start_time_estimator.resource_availability.resources_calendar.end_times) == num_calendar_events + len(new_log)
+
+
 def test_get_activity_duration():
     durationsA = [timedelta(2), timedelta(2), timedelta(4), timedelta(6), timedelta(7), timedelta(9)]
     durationsB = [timedelta(2), timedelta(2), timedelta(4), timedelta(8)]
@@ -309,3 +505,55 @@ def test_get_activity_duration():
     assert start_time_estimator._get_activity_duration(durationsA) == timedelta(2)
     assert start_time_estimator._get_activity_duration(durationsB) == timedelta(2)
     assert start_time_estimator._get_activity_duration(durationsC) == timedelta(2)
+
+
+def test_configuration_sweep():
+    configs = [
+        Configuration(
+            concurrency_oracle_type=concurrency_oracle_type,
+            re_estimation_method=re_estimation_method,
+            outlier_statistic=OutlierStatistic.MEDIAN,
+            outlier_threshold=outlier_threshold,
+            instant_activities={'H'} if outlier_threshold == 2.0 else set(),
+            bot_resources={'Marcus'} if concurrency_oracle_type == ConcurrencyOracleType.DF else set()
+        )
+        for concurrency_oracle_type in [ConcurrencyOracleType.HEURISTICS, ConcurrencyOracleType.DF, ConcurrencyOracleType.DEACTIVATED]
+        for re_estimation_method in [ReEstimationMethod.MEDIAN, ReEstimationMethod.MODE]
+        for outlier_threshold in [float('nan'), 2.0, 5.0]
+    ]
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', configs[0])
+    # Same result as estimating with each configuration separately
+    results = StartTimeEstimator.configuration_sweep(event_log, configs, output=EstimationOutput.NEW_COLUMNS)
+    assert len(results) == len(configs)
+    for config, result in zip(configs, results):
+        pd.testing.assert_frame_equal(result, StartTimeEstimator(event_log, config).estimate(output=EstimationOutput.NEW_COLUMNS))
+    # The input event log is not modified
+    assert configs[0].log_ids.estimated_start_time not in event_log.columns
+
+
+def test_update():
+    config = Configuration(
+        re_estimation_method=ReEstimationMethod.MEDIAN,
+        concurrency_oracle_type=ConcurrencyOracleType.HEURISTICS,
+        resource_availability_type=ResourceAvailabilityType.SIMPLE,
+        outlier_statistic=OutlierStatistic.MEDIAN,
+        outlier_threshold=2.0,
+        consider_start_times=True
+    )
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    # Late events: the last events of some cases, and a whole new case
+    cases = event_log[config.log_ids.case].unique()
+    late_events = pd.concat([
+        event_log[event_log[config.log_ids.case].isin(cases[:2])].groupby(config.log_ids.case).tail(2),
+        event_log[event_log[config.log_ids.case] == cases[-1]]
+    ])
+    start_time_estimator = StartTimeEstimator(event_log.drop(late_events.index), config)
+    start_time_estimator.estimate()
+    updated_estimation = start_time_estimator.update(late_events, output=EstimationOutput.NEW_COLUMNS)
+    # Same estimation as with the whole event log (and the same concurrency relations)
+    updated_event_log = pd.concat([event_log.drop(late_events.index), late_events])
+    expected_start_time_estimator = StartTimeEstimator(updated_event_log, config)
+    expected_start_time_estimator.concurrency_oracle = start_time_estimator.concurrency_oracle
+    pd.testing.assert_frame_equal(updated_estimation, expected_start_time_estimator.estimate(output=EstimationOutput.NEW_COLUMNS))
+    # The estimator keeps the updated event log
+    pd.testing.assert_frame_equal(start_time_estimator.estimate(output=EstimationOutput.NEW_COLUMNS), updated_estimation)
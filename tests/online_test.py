@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from estimate_start_times.config import Configuration, ConcurrencyOracleType, ReEstimationMethod, EstimationOutput, OutlierStatistic
+from estimate_start_times.duration_statistics import RunningDurationStatistics, WindowedDurationStatistics, compute_grouped_statistic
+from estimate_start_times.estimator import StartTimeEstimator
+from estimate_start_times.online import OnlineStartTimeEstimator
+from estimate_start_times.utils import read_csv_log
+
+
+def test_running_duration_statistics():
+    rng = np.random.default_rng(0)
+    values = rng.integers(-3, 10, 100) * 1000000007
+    running_statistics = RunningDurationStatistics()
+    for position, value in enumerate(values):
+        running_statistics.add(value)
+        # Same value as the statistics over all the values added so far
+        for statistic in ['MODE', 'MEDIAN', 'MEAN']:
+            expected = compute_grouped_statistic(statistic, np.zeros(position + 1, dtype=np.int64), values[:position + 1], 1)[0]
+            assert running_statistics.get_statistic(statistic) == expected
+
+
+def test_windowed_duration_statistics():
+    rng = np.random.default_rng(0)
+    values = rng.integers(-3, 10, 200) * 1000000007
+    windowed_statistics = WindowedDurationStatistics(window=25)
+    for position, value in enumerate(values):
+        windowed_statistics.add(value)
+        window = values[max(position - 24, 0):position + 1]
+        # Exact mean of all the values, and median of the values in the window
+        expected_mean = compute_grouped_statistic('MEAN', np.zeros(position + 1, dtype=np.int64), values[:position + 1], 1)[0]
+        expected_median = compute_grouped_statistic('MEDIAN', np.zeros(len(window), dtype=np.int64), window, 1)[0]
+        assert windowed_statistics.get_statistic('MEAN') == expected_mean
+        assert windowed_statistics.get_statistic('MEDIAN') == expected_median
+        # Mode: one of the most frequent values of the window
+        (window_values, counts) = np.unique(window, return_counts=True)
+        assert windowed_statistics.get_statistic('MODE') in window_values[counts == counts.max()]
+        # Bounded state
+        assert len(windowed_statistics._durations) <= 25 and len(windowed_statistics._occurrences) <= 25
+
+
+def test_online_estimation_same_as_batch():
+    for consider_start_times in [False, True]:
+        config = Configuration(
+            concurrency_oracle_type=ConcurrencyOracleType.HEURISTICS,
+            re_estimation_method=ReEstimationMethod.SET_INSTANT,
+            consider_start_times=consider_start_times,
+            bot_resources={'Marcus'}
+        )
+        event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+        event_log = event_log.sort_values(config.log_ids.end_time, kind='stable')
+        start_time_estimator = StartTimeEstimator(event_log, config)
+        # Stream the events in two batches
+        online_estimator = OnlineStartTimeEstimator.from_estimator(start_time_estimator)
+        online_estimation = pd.concat([
+            online_estimator.estimate_events(event_log.iloc[:len(event_log) // 2], output=EstimationOutput.NEW_COLUMNS),
+            online_estimator.estimate_events(event_log.iloc[len(event_log) // 2:], output=EstimationOutput.NEW_COLUMNS)
+        ])
+        # Same enablement, availability and (with no re-estimation statistics) estimated start times as the batch estimation
+        pd.testing.assert_frame_equal(online_estimation, start_time_estimator.estimate(output=EstimationOutput.NEW_COLUMNS))
+
+
+def test_online_estimation_state():
+    config = Configuration(
+        concurrency_oracle_type=ConcurrencyOracleType.DF,
+        re_estimation_method=ReEstimationMethod.MEDIAN,
+        outlier_statistic=OutlierStatistic.MEDIAN,
+        outlier_threshold=2.0
+    )
+    event_log = read_csv_log('./tests/assets/test_event_log_1.csv', config)
+    online_estimator = OnlineStartTimeEstimator.from_estimator(StartTimeEstimator(event_log, config))
+    (enabled_time, available_time, start_time) = online_estimator.estimate_event('c1', 'A', '2022-01-01T10:00:00+00:00', 'R1')
+    assert pd.isna(enabled_time) and pd.isna(available_time) and start_time == pd.Timestamp('2022-01-01T10:00:00+00:00')
+    (enabled_time, available_time, start_time) = online_estimator.estimate_event('c1', 'B', '2022-01-01T11:00:00+00:00', 'R2')
+    assert enabled_time == start_time == pd.Timestamp('2022-01-01T10:00:00+00:00')
+    # Re-estimated with the running median of the activity
+    (enabled_time, available_time, start_time) = online_estimator.estimate_event('c2', 'B', '2022-01-01T12:30:00+00:00', 'R3')
+    assert start_time == pd.Timestamp('2022-01-01T11:30:00+00:00')
+    # Duration over the threshold of the running median (1h) clipped
+    (enabled_time, available_time, start_time) = online_estimator.estimate_event('c3', 'B', '2022-01-01T14:00:00+00:00', 'R2')
+    assert available_time == pd.Timestamp('2022-01-01T11:00:00+00:00')
+    assert start_time == pd.Timestamp('2022-01-01T12:00:00+00:00')
+    # Closed cases are evicted
+    assert online_estimator.num_open_cases == 3
+    online_estimator.close_case('c1')
+    assert online_estimator.num_open_cases == 2
+    # Events out of end time order are rejected
+    with pytest.raises(ValueError):
+        online_estimator.estimate_event('c2', 'C', '2022-01-01T13:00:00+00:00', 'R3')
+
+
+def test_online_estimation_missing_resources():
+    config = Configuration(concurrency_oracle_type=ConcurrencyOracleType.DF, re_estimation_method=ReEstimationMethod.SET_INSTANT)
+    event_log = read_csv_log('./tests/assets/test_event_log_1.csv', config)
+    online_estimator = OnlineStartTimeEstimator.from_estimator(StartTimeEstimator(event_log, config))
+    # Events with no resource column, or with missing (NaN) resources, have no resource availability time
+    events = pd.DataFrame({
+        config.log_ids.case: ['c1', 'c2', 'c3', 'c4'],
+        config.log_ids.activity: ['A', 'A', 'A', 'A'],
+        config.log_ids.end_time: pd.to_datetime(['2022-01-01T10:00:00', '2022-01-01T11:00:00', '2022-01-01T12:00:00',
+                                                 '2022-01-01T13:00:00'], utc=True)
+    })
+    estimation = online_estimator.estimate_events(events, output=EstimationOutput.NEW_COLUMNS)
+    assert estimation[config.log_ids.available_time].isna().all()
+    events[config.log_ids.resource] = [np.nan, None, np.nan, None]
+    events[config.log_ids.end_time] += pd.Timedelta(days=1)
+    estimation = online_estimator.estimate_events(events, output=EstimationOutput.NEW_COLUMNS)
+    assert estimation[config.log_ids.available_time].isna().all()
+    (_, available_time, _) = online_estimator.estimate_event('c5', 'A', '2022-01-03T10:00:00+00:00')
+    assert pd.isna(available_time)
+    assert online_estimator.num_active_resources == 0
+
+
+def test_online_estimation_nan_resources_same_as_batch():
+    config = Configuration(concurrency_oracle_type=ConcurrencyOracleType.DF, re_estimation_method=ReEstimationMethod.SET_INSTANT)
+    # Log with missing (NaN) and non-string resources
+    event_log = pd.DataFrame({
+        config.log_ids.case: ['c1', 'c1', 'c2', 'c2', 'c1', 'c2', 'c3', 'c3'],
+        config.log_ids.activity: ['A', 'B', 'A', 'B', 'C', 'C', 'A', 'B'],
+        config.log_ids.resource: ['R1', np.nan, 'R1', np.nan, 'R2', np.nan, 5, 5],
+        config.log_ids.end_time: pd.to_datetime(['2021-01-01 10:00', '2021-01-01 10:30', '2021-01-01 11:00', '2021-01-01 11:45',
+                                                '2021-01-01 12:00', '2021-01-01 12:30', '2021-01-01 13:00', '2021-01-01 14:00'], utc=True)
+    })
+    start_time_estimator = StartTimeEstimator(event_log, config)
+    online_estimator = OnlineStartTimeEstimator.from_estimator(start_time_estimator)
+    online_estimation = online_estimator.estimate_events(event_log, output=EstimationOutput.NEW_COLUMNS)
+    # Same enablement, availability and estimated start times as the batch estimation
+    pd.testing.assert_frame_equal(online_estimation, start_time_estimator.estimate(output=EstimationOutput.NEW_COLUMNS))
+
+
+def test_online_estimation_bounded_state():
+    config = Configuration(
+        concurrency_oracle_type=ConcurrencyOracleType.DF,
+        re_estimation_method=ReEstimationMethod.MEDIAN,
+        outlier_statistic=OutlierStatistic.MODE,
+        outlier_threshold=2.0,
+        consider_start_times=True
+    )
+    event_log = read_csv_log('./tests/assets/test_event_log_1.csv', config)
+    online_estimator = OnlineStartTimeEstimator.from_estimator(
+        StartTimeEstimator(event_log, config),
+        statistics_window=50,
+        horizon=pd.Timedelta(hours=2)
+    )
+    # Long stream of cases with three events, performed by a changing set of resources
+    start = pd.Timestamp('2022-01-01T00:00:00+00:00')
+    for position in range(6000):
+        online_estimator.estimate_event(
+            "case-{}".format(position // 3),
+            ['A', 'B', 'C'][position % 3],
+            start + pd.Timedelta(minutes=position),
+            "resource-{}".format(position // 100 + position % 4),
+            start + pd.Timedelta(minutes=position - 1)
+        )
+        # The state is bounded by the cases and resources active in the horizon, and the window of the statistics
+        assert online_estimator.num_open_cases <= 41
+        assert online_estimator.num_active_resources <= 8
+        assert all(len(statistics._durations) <= 50 for statistics in online_estimator._statistics.values())
@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from estimate_start_times.config import Configuration, ReEstimationMethod, ConcurrencyOracleType, OutlierStatistic
+from estimate_start_times.estimator import StartTimeEstimator
+from estimate_start_times.partitioned import PartitionedStartTimeEstimator
+from estimate_start_times.utils import read_csv_log
+
+
+def test_partitioned_estimation(tmp_path):
+    configs = [
+        Configuration(re_estimation_method=ReEstimationMethod.MODE, concurrency_oracle_type=ConcurrencyOracleType.HEURISTICS),
+        Configuration(
+            re_estimation_method=ReEstimationMethod.MEDIAN,
+            concurrency_oracle_type=ConcurrencyOracleType.ALPHA,
+            outlier_statistic=OutlierStatistic.MODE,
+            outlier_threshold=1.5,
+            consider_start_times=True
+        ),
+        Configuration(re_estimation_method=ReEstimationMethod.MEAN, concurrency_oracle_type=ConcurrencyOracleType.DF),
+        Configuration(re_estimation_method=ReEstimationMethod.SET_INSTANT, concurrency_oracle_type=ConcurrencyOracleType.DEACTIVATED)
+    ]
+    for config in configs:
+        event_log = read_csv_log('./tests/assets/test_event_log_3_noise.csv', config).reset_index(drop=True)
+        # Estimate the event log received in chunks, with fewer partitions than cases and resources
+        partitioned_estimator = PartitionedStartTimeEstimator(
+            str(tmp_path), config, num_case_partitions=3, num_resource_partitions=2, n_jobs=2
+        )
+        partitioned_estimator.estimate(event_log.iloc[start:start + 50] for start in range(0, len(event_log), 50))
+        # Same result as estimating the whole event log
+        pd.testing.assert_frame_equal(partitioned_estimator.read_results(), StartTimeEstimator(event_log, config).estimate())
+
+
+def test_partitioned_estimation_by_partition(tmp_path):
+    for concurrency_oracle_type in [ConcurrencyOracleType.HEURISTICS, ConcurrencyOracleType.DEACTIVATED]:
+        config = Configuration(re_estimation_method=ReEstimationMethod.MODE, concurrency_oracle_type=concurrency_oracle_type)
+        event_log = read_csv_log('./tests/assets/test_event_log_3_noise.csv', config).reset_index(drop=True)
+        partitioned_estimator = PartitionedStartTimeEstimator(str(tmp_path), config, num_case_partitions=2, num_resource_partitions=2)
+        partitioned_estimator.partition_by_case([event_log])
+        # Count the relations of each partition in a different call
+        partitioned_estimator.discover_concurrency([0])
+        if concurrency_oracle_type != ConcurrencyOracleType.DEACTIVATED:
+            # The enabled times cannot be computed until the relations of all the partitions are counted
+            with pytest.raises(ValueError, match=r"\[1\]"):
+                partitioned_estimator.compute_enabled_times()
+        partitioned_estimator.discover_concurrency([1])
+        # Process each partition in a different call
+        for partition in [0, 1]:
+            partitioned_estimator.compute_enabled_times([partition])
+        for partition in [0, 1]:
+            partitioned_estimator.compute_available_times([partition])
+        partitioned_estimator.compute_duration_statistics()
+        for partition in [0, 1]:
+            partitioned_estimator.re_estimate([partition])
+        # Same result as estimating the whole event log
+        pd.testing.assert_frame_equal(partitioned_estimator.read_results(), StartTimeEstimator(event_log, config).estimate())
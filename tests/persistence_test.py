@@ -0,0 +1,80 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from estimate_start_times.concurrency_oracle import AlphaConcurrencyOracle, HeuristicsConcurrencyOracle, ConcurrencyOracle
+from estimate_start_times.config import Configuration, HeuristicsThresholds, ConcurrencyOracleType, ReEstimationMethod, \
+    configuration_to_dict, configuration_from_dict, EstimationOutput
+from estimate_start_times.estimator import StartTimeEstimator
+from estimate_start_times.resource_availability import SimpleResourceAvailability, ResourceAvailability
+from estimate_start_times.utils import read_csv_log
+
+
+def test_configuration_dict():
+    config = Configuration(
+        concurrency_oracle_type=ConcurrencyOracleType.ALPHA,
+        re_estimation_method=ReEstimationMethod.MODE,
+        bot_resources={'Bot1', 'Bot2'},
+        instant_activities={'A'},
+        heuristics_thresholds=HeuristicsThresholds(df=0.6, l2l=0.7, l1l=0.8),
+        outlier_threshold=1.5
+    )
+    # Serializable and reversible
+    values = json.loads(json.dumps(configuration_to_dict(config)))
+    assert configuration_from_dict(values) == config
+    # NaN threshold supported
+    assert configuration_from_dict(configuration_to_dict(Configuration())).log_ids == Configuration().log_ids
+
+
+def test_save_load_concurrency_oracle(tmp_path):
+    config = Configuration()
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    for concurrency_oracle in [AlphaConcurrencyOracle(event_log, config), HeuristicsConcurrencyOracle(event_log, config)]:
+        path = os.path.join(tmp_path, type(concurrency_oracle).__name__)
+        concurrency_oracle.save(path)
+        loaded_concurrency_oracle = ConcurrencyOracle.load(path)
+        # Same type, concurrency and configuration
+        assert type(loaded_concurrency_oracle) == type(concurrency_oracle)
+        assert loaded_concurrency_oracle.concurrency == concurrency_oracle.concurrency
+        assert configuration_to_dict(loaded_concurrency_oracle.config) == configuration_to_dict(concurrency_oracle.config)
+        # Same enabled times
+        assert (loaded_concurrency_oracle.get_enabled_times(event_log) == concurrency_oracle.get_enabled_times(event_log)).all()
+
+
+def test_save_load_resource_availability(tmp_path):
+    config = Configuration(consider_start_times=True, bot_resources={'Dominic'})
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    resource_availability = SimpleResourceAvailability(event_log, config)
+    resource_availability.save(tmp_path)
+    loaded_resource_availability = ResourceAvailability.load(tmp_path)
+    assert type(loaded_resource_availability) == SimpleResourceAvailability
+    # Memory-mapped end times
+    assert isinstance(loaded_resource_availability.resources_calendar.end_times, np.memmap)
+    assert list(loaded_resource_availability.resources_calendar) == list(resource_availability.resources_calendar)
+    assert (
+            loaded_resource_availability.get_resource_availability_times(event_log) ==
+            resource_availability.get_resource_availability_times(event_log)
+    ).all()
+
+
+def test_save_load_estimator(tmp_path):
+    config = Configuration(re_estimation_method=ReEstimationMethod.MEDIAN, outlier_threshold=2.0)
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    cases = event_log[config.log_ids.case].unique()
+    history_log = event_log[event_log[config.log_ids.case].isin(cases[:len(cases) // 2])]
+    new_log = event_log[~event_log[config.log_ids.case].isin(cases[:len(cases) // 2])]
+    start_time_estimator = StartTimeEstimator(history_log, config)
+    start_time_estimator.save(tmp_path)
+    loaded_start_time_estimator = StartTimeEstimator.load(tmp_path)
+    assert loaded_start_time_estimator.config == config
+    # Same estimation of new event logs
+    pd.testing.assert_frame_equal(
+        loaded_start_time_estimator.transform(new_log, output=EstimationOutput.NEW_COLUMNS),
+        start_time_estimator.transform(new_log, output=EstimationOutput.NEW_COLUMNS)
+    )
+    # Another kind of artifact cannot be loaded as an estimator
+    with pytest.raises(ValueError):
+        StartTimeEstimator.load(os.path.join(tmp_path, 'concurrency_oracle'))
@@ -1,9 +1,10 @@
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
 from estimate_start_times.config import Configuration
-from estimate_start_times.resource_availability import SimpleResourceAvailability
+from estimate_start_times.resource_availability import SimpleResourceAvailability, ResourceCalendarIndex
 from estimate_start_times.utils import read_csv_log
 
 
@@ -63,3 +64,106 @@ def test_resource_availability_considering_start_times():
     # The availability of a resource considers the recorded start times but if equals its ok
     fifth_trace = event_log[event_log[config.log_ids.case] == 'trace-05']
     assert resource_availability.available_since('Marcus', fifth_trace.iloc[0]) == fourth_trace.iloc[2][config.log_ids.end_time]
+
+
+def test_add_resource_availability_times_equivalent_to_per_event_computation():
+    rng = np.random.default_rng(0)
+    for consider_start_times in [False, True]:
+        config = Configuration(consider_start_times=consider_start_times, bot_resources={'Bot'})
+        # Random log with repeated end times, overlapping and missing start times, bots and missing resources
+        end_times = pd.to_datetime(rng.integers(0, 50, 300) * 600, unit='s', utc=True)
+        event_log = pd.DataFrame({
+            config.log_ids.case: rng.integers(0, 30, 300),
+            config.log_ids.resource: rng.choice(['R1', 'R2', 'R3', 'Bot', config.missing_resource], 300),
+            config.log_ids.start_time: end_times - pd.to_timedelta(rng.integers(0, 5, 300) * 600, unit='s'),
+            config.log_ids.end_time: end_times
+        }).sort_values(config.log_ids.end_time)
+        event_log.loc[event_log.sample(frac=0.1, random_state=0).index, config.log_ids.start_time] = pd.NaT
+        resource_availability = SimpleResourceAvailability(event_log, config)
+        resource_availability.add_resource_availability_times(event_log)
+        for index, event in event_log.iterrows():
+            resource = event[config.log_ids.resource]
+            resource_events = event_log[event_log[config.log_ids.resource] == resource]
+            if resource == config.missing_resource:
+                # The missing resource is always available (pd.NaT)
+                expected = pd.NaT
+            elif resource == 'Bot':
+                # The availability of a bot resource is the same timestamp as checked
+                expected = event[config.log_ids.end_time]
+            else:
+                # The availability of the resource is the last end time previous to the event (and to its start if considered)
+                expected = resource_events[config.log_ids.end_time].where(
+                    (resource_events[config.log_ids.end_time] < event[config.log_ids.end_time]) &
+                    ((not consider_start_times) or (resource_events[config.log_ids.end_time] <= event[config.log_ids.start_time]))
+                ).max()
+            assert event[config.log_ids.available_time] == expected or (pd.isna(expected) and pd.isna(event[config.log_ids.available_time]))
+            assert resource_availability.available_since(resource, event) == expected or (
+                    pd.isna(expected) and pd.isna(resource_availability.available_since(resource, event))
+            )
+
+
+def test_resource_availability_non_string_resources():
+    config = Configuration()
+    event_log = pd.DataFrame({
+        config.log_ids.case: ['c1', 'c2', 'c3'],
+        config.log_ids.resource: [5, 5, 7],
+        config.log_ids.end_time: pd.to_datetime(['2021-01-01 10:00', '2021-01-01 11:00', '2021-01-01 12:00'], utc=True)
+    })
+    resource_availability = SimpleResourceAvailability(event_log, config)
+    # The resources are identified by their string ID, so non-string resources also have calendar
+    assert set(resource_availability.resources_calendar.keys()) == {'5', '7'}
+    resource_availability.add_resource_availability_times(event_log)
+    assert event_log[config.log_ids.available_time].tolist() == [pd.NaT, event_log[config.log_ids.end_time][0], pd.NaT]
+    assert resource_availability.available_since(5, event_log.iloc[1]) == event_log[config.log_ids.end_time][0]
+
+
+def test_resource_availability_times_in_parallel():
+    rng = np.random.default_rng(1)
+    for consider_start_times in [False, True]:
+        config = Configuration(consider_start_times=consider_start_times, bot_resources={'Bot'})
+        # Random log with a busy resource, bots and missing resources
+        end_times = pd.to_datetime(rng.integers(0, 500, 1000) * 600, unit='s', utc=True)
+        event_log = pd.DataFrame({
+            config.log_ids.case: rng.integers(0, 100, 1000),
+            config.log_ids.resource: rng.choice(['Busy'] * 10 + ['R1', 'R2', 'R3', 'Bot', config.missing_resource], 1000),
+            config.log_ids.start_time: end_times - pd.to_timedelta(rng.integers(0, 5, 1000) * 600, unit='s'),
+            config.log_ids.end_time: end_times
+        })
+        resource_availability = SimpleResourceAvailability(event_log, config)
+        # Same availability times computing the shards of events in several processes
+        assert (
+                resource_availability.get_resource_availability_times(event_log, n_jobs=3) ==
+                resource_availability.get_resource_availability_times(event_log)
+        ).all()
+
+
+def test_resource_calendar_index():
+    config = Configuration(bot_resources={'Dominic'})
+    event_log = read_csv_log('./tests/assets/test_event_log_1.csv', config)
+    resource_availability = SimpleResourceAvailability(event_log, config)
+    calendar_index = resource_availability.resources_calendar
+    # Only the non-bot resources have calendar
+    assert set(calendar_index.keys()) == {'Marcus', 'Anya'}
+    # One buffer with the calendar of each resource sorted by end time
+    assert len(calendar_index.end_times) == len(event_log[event_log[config.log_ids.resource] != 'Dominic'])
+    for resource in calendar_index:
+        end_times = event_log[event_log[config.log_ids.resource] == resource][config.log_ids.end_time]
+        assert list(calendar_index[resource]) == sorted(end_times.values.astype(np.int64))
+        # The calendar is a view of the buffer
+        assert np.shares_memory(calendar_index[resource], calendar_index.end_times)
+
+
+def test_resource_calendar_index_merge():
+    config = Configuration(bot_resources={'Dominic'})
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    cases = event_log[config.log_ids.case].unique()
+    first_log = event_log[event_log[config.log_ids.case].isin(cases[::2])]
+    second_log = event_log[~event_log[config.log_ids.case].isin(cases[::2])]
+    # Merging the calendars of two event logs is equivalent to building the calendars of both together
+    merged_calendar = ResourceCalendarIndex.from_event_log(first_log, config).merge(
+        ResourceCalendarIndex.from_event_log(second_log, config)
+    )
+    calendar = ResourceCalendarIndex.from_event_log(event_log, config)
+    assert set(merged_calendar) == set(calendar)
+    for resource in calendar:
+        assert merged_calendar[resource].tolist() == calendar[resource].tolist()
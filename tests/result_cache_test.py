@@ -0,0 +1,65 @@
+import os
+
+import pandas as pd
+
+from estimate_start_times.config import Configuration, ReEstimationMethod, EstimationOutput
+from estimate_start_times.estimator import StartTimeEstimator
+from estimate_start_times.result_cache import EstimationResultCache
+from estimate_start_times.utils import read_csv_log
+
+
+def test_result_cache(tmp_path):
+    config = Configuration(re_estimation_method=ReEstimationMethod.MODE, outlier_threshold=2.0)
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    result_cache = EstimationResultCache(tmp_path)
+    key = result_cache.get_key(event_log, config)
+    # Not cached
+    assert result_cache.get(key) is None
+    expected = StartTimeEstimator(event_log, config).estimate()
+    pd.testing.assert_frame_equal(result_cache.estimate(event_log, config), expected)
+    # Cached, the same result is loaded
+    assert result_cache.get(key) is not None
+    pd.testing.assert_frame_equal(result_cache.estimate(event_log, config), expected)
+    new_columns = [config.log_ids.available_time, config.log_ids.enabled_time, config.log_ids.estimated_start_time]
+    pd.testing.assert_frame_equal(result_cache.estimate(event_log, config, output=EstimationOutput.NEW_COLUMNS), expected[new_columns])
+    # Different key for other configurations or event logs
+    assert result_cache.get_key(event_log, Configuration(re_estimation_method=ReEstimationMethod.MEDIAN, outlier_threshold=2.0)) != key
+    assert result_cache.get_key(event_log, config, replace_recorded_start_times=True) != key
+    assert result_cache.get_key(event_log.head(10), config) != key
+    modified_event_log = event_log.copy()
+    modified_event_log.loc[modified_event_log.index[0], config.log_ids.end_time] += pd.Timedelta(1)
+    assert result_cache.get_key(modified_event_log, config) != key
+    # Same key for equal event logs and configurations
+    assert result_cache.get_key(event_log.copy(), Configuration(re_estimation_method=ReEstimationMethod.MODE, outlier_threshold=2.0)) == key
+
+
+def test_result_cache_eviction(tmp_path):
+    config = Configuration()
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    # Cache with space for only one result
+    result_cache = EstimationResultCache(tmp_path, max_size=len(event_log) * 8 * 3 + 1024)
+    result_cache.estimate(event_log, config)
+    first_key = result_cache.get_key(event_log, config)
+    result_cache.estimate(event_log.head(20), config)
+    # The least recently used is evicted
+    assert result_cache.get(first_key) is None
+    assert result_cache.get(result_cache.get_key(event_log.head(20), config)) is not None
+    assert len([name for name in os.listdir(tmp_path) if not name.startswith('.')]) == 1
+
+
+def test_result_cache_entry_over_max_size(tmp_path):
+    config = Configuration()
+    event_log = read_csv_log('./tests/assets/test_event_log_3.csv', config)
+    new_columns = StartTimeEstimator(event_log, config).estimate(output=EstimationOutput.ARRAYS)
+    # An estimation larger than the cache is not stored, and the cached ones are kept
+    result_cache = EstimationResultCache(tmp_path, max_size=len(event_log) * 8 * 3 + 1024)
+    result_cache.put('small', {column: values[:10] for column, values in new_columns.items()})
+    result_cache.max_size = len(event_log) * 8 * 3 - 1
+    assert not result_cache.put('large', new_columns)
+    assert result_cache.get('large') is None
+    assert result_cache.get('small') is not None
+    # An estimation fitting only without its header is stored, evicting the others instead of itself
+    result_cache.max_size = len(event_log) * 8 * 3
+    assert result_cache.put('large', new_columns)
+    assert result_cache.get('large') is not None
+    assert result_cache.get('small') is None
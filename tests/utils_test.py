@@ -0,0 +1,130 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from estimate_start_times.concurrency_oracle import HeuristicsConcurrencyOracle
+from estimate_start_times.config import Configuration, DEFAULT_CSV_IDS
+from estimate_start_times.estimator import StartTimeEstimator
+from estimate_start_times.utils import read_csv_log, read_csv_log_in_batches, _parse_timestamps, read_parquet_log, write_parquet_log, \
+    read_arrow_log, write_arrow_log
+
+
+def test_read_csv_log_in_batches(tmp_path):
+    config = Configuration()
+    event_log = read_csv_log('./tests/assets/test_event_log_3_noise.csv', config, sort_by_end_time=False).reset_index(drop=True)
+    # Read with a budget of less than 1000 events per batch, forcing the buckets to be split
+    batches = list(read_csv_log_in_batches(
+        './tests/assets/test_event_log_3_noise.csv',
+        config,
+        memory_budget=1000 * 128,
+        chunk_size=500,
+        num_buckets=3,
+        temporary_path=str(tmp_path)
+    ))
+    assert len(batches) > 8
+    assert all(len(batch) <= 1000 for batch in batches)
+    # The temporary files are removed
+    assert os.listdir(tmp_path) == []
+    # Each batch has all the events of its cases, sorted by end time
+    cases = [set(batch[config.log_ids.case]) for batch in batches]
+    assert sum(len(batch_cases) for batch_cases in cases) == len(set.union(*cases))
+    assert all(batch[config.log_ids.end_time].is_monotonic_increasing for batch in batches)
+    # All the events are read, indexed by their position in the file
+    pd.testing.assert_frame_equal(pd.concat(batches).sort_index(), event_log)
+    # The enabled times can be computed batch by batch
+    concurrency_oracle = HeuristicsConcurrencyOracle(event_log, config)
+    for batch in batches:
+        concurrency_oracle.add_enabled_times(batch)
+    expected_event_log = event_log.sort_values(config.log_ids.end_time, kind='stable')
+    concurrency_oracle.add_enabled_times(expected_event_log)
+    pd.testing.assert_frame_equal(pd.concat(batches).sort_index(), expected_event_log.sort_index())
+
+
+def test_read_csv_log_in_batches_mixed_case_ids(tmp_path):
+    config = Configuration(log_ids=DEFAULT_CSV_IDS)
+    log_ids = config.log_ids
+    # The first chunk has only numeric case IDs, and the second one a non-numeric one
+    log_path = str(tmp_path / 'log.csv')
+    pd.DataFrame({
+        log_ids.case: ['1', '2', '1', 'x9', '2', '1'],
+        log_ids.activity: ['A', 'A', 'B', 'A', 'B', 'C'],
+        log_ids.resource: ['R1', 'R2', 'R1', 'R1', 'R2', 'R1'],
+        log_ids.end_time: ["2021-01-01T10:0{}:00+00:00".format(minute) for minute in range(6)]
+    }).to_csv(log_path, index=False)
+    batches = list(read_csv_log_in_batches(log_path, config, chunk_size=3, num_buckets=2, temporary_path=str(tmp_path)))
+    # Each case is read with the same (string) ID, with all its events in the same batch
+    event_log = pd.concat(batches).sort_index()
+    assert event_log[log_ids.case].tolist() == ['1', '2', '1', 'x9', '2', '1']
+    cases = [set(batch[log_ids.case]) for batch in batches]
+    assert sum(len(batch_cases) for batch_cases in cases) == 3
+
+
+def test_read_csv_log_typed():
+    config = Configuration(log_ids=DEFAULT_CSV_IDS)
+    event_log = read_csv_log('./tests/assets/test_event_log_1.csv', config)
+    # ISO-8601 timestamps with offset parsed as with pandas
+    raw_event_log = pd.read_csv('./tests/assets/test_event_log_1.csv')
+    for column in [config.log_ids.start_time, config.log_ids.end_time]:
+        expected = pd.to_datetime(raw_event_log[column], utc=True).reindex(event_log.index)
+        pd.testing.assert_series_equal(event_log[column], expected)
+    # Only the columns of the event log IDs, with categorical activities and resources
+    report = {}
+    typed_event_log = read_csv_log('./tests/assets/test_event_log_1.csv', config, only_log_ids=True, categorical_ids=True, report=report)
+    assert typed_event_log[config.log_ids.activity].dtype == 'category'
+    assert typed_event_log[config.log_ids.resource].dtype == 'category'
+    expected = event_log[[column for column in event_log.columns if column in typed_event_log.columns]]
+    pd.testing.assert_frame_equal(typed_event_log.astype({config.log_ids.activity: object, config.log_ids.resource: object}), expected)
+    assert report['timestamp_parsers'] == {config.log_ids.start_time: 'ISO-8601', config.log_ids.end_time: 'ISO-8601'}
+    assert all(report[step] >= 0 for step in ['read', 'timestamps', 'sort'])
+
+
+def test_parse_timestamps():
+    # ISO-8601 timestamps with different offsets, separators, and precisions
+    timestamps = pd.Series([
+        '2021-01-01T00:00:00Z', np.nan, '2020-02-29 23:59:59.123456789-05:30', '1999-12-31 10:00:00.5', '2021-03-04T05:06:07.89+01:00'
+    ], dtype=object)
+    (parsed, parser) = _parse_timestamps(timestamps, None)
+    assert parser == 'ISO-8601'
+    pd.testing.assert_series_equal(parsed, pd.to_datetime(timestamps, utc=True))
+    # Other formats guessed, or given
+    timestamps = pd.Series(['2021/01/13 10:00', '2021/02/01 11:30'], dtype=object)
+    (parsed, parser) = _parse_timestamps(timestamps, None)
+    assert parser == '%Y/%m/%d %H:%M'
+    pd.testing.assert_series_equal(parsed, pd.to_datetime(timestamps, utc=True))
+    timestamps = pd.Series(['01/02/2021 10:00', '13/02/2021 11:30'], dtype=object)
+    (parsed, parser) = _parse_timestamps(timestamps, '%d/%m/%Y %H:%M')
+    pd.testing.assert_series_equal(parsed, pd.to_datetime(timestamps, format='%d/%m/%Y %H:%M', utc=True))
+    # Invalid ISO-8601 dates are left to pandas
+    timestamps = pd.Series(['2021-01-01 10:00:00+0200', '2021-01-01 11:00:00+0100'], dtype=object)
+    (parsed, parser) = _parse_timestamps(timestamps, None)
+    assert parser != 'ISO-8601'
+    pd.testing.assert_series_equal(parsed, pd.to_datetime(timestamps, utc=True))
+
+
+def test_parquet_and_arrow_logs(tmp_path):
+    pytest.importorskip('pyarrow')
+    config = Configuration(log_ids=DEFAULT_CSV_IDS)
+    event_log = read_csv_log('./tests/assets/test_event_log_1.csv', config)
+    extended_event_log = StartTimeEstimator(event_log, config).estimate().reset_index(drop=True)
+    expected = extended_event_log.astype({config.log_ids.activity: 'category', config.log_ids.resource: 'category'})
+    for (write_log, read_log, file_name) in [(write_parquet_log, read_parquet_log, 'log.parquet'),
+                                             (write_arrow_log, read_arrow_log, 'log.arrow')]:
+        log_path = str(tmp_path / file_name)
+        write_log(extended_event_log, log_path, config)
+        # Same values, with tz-aware timestamps and categorical (dictionary-encoded) activities and resources
+        for memory_map in [True, False]:
+            read_event_log = read_log(log_path, config, memory_map=memory_map, sort_by_end_time=False)
+            pd.testing.assert_frame_equal(read_event_log, expected, check_categorical=False)
+        # Projection of the columns
+        columns = [config.log_ids.case, config.log_ids.activity, config.log_ids.end_time]
+        read_event_log = read_log(log_path, config, columns=columns + [config.log_ids.resource], sort_by_end_time=False)
+        pd.testing.assert_frame_equal(read_event_log, expected[columns + [config.log_ids.resource]], check_categorical=False)
+        # The estimation gives the same result
+        read_event_log = read_log(log_path, config, columns=columns + [config.log_ids.resource, config.log_ids.start_time])
+        estimated_event_log = StartTimeEstimator(read_event_log, config).estimate().sort_index()
+        pd.testing.assert_series_equal(
+            estimated_event_log[config.log_ids.estimated_start_time],
+            extended_event_log[config.log_ids.estimated_start_time]
+        )